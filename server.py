@@ -1,137 +1,502 @@
+import argparse
 import asyncio
+import hmac
 import json
+import os
+import sys
 import time
-import threading
-from typing import Set, Any
-from server.playerHandler import PlayerHandler
+import traceback
+from typing import Dict, Any
+from server.playerHandler import PlayerHandler, REAP_RESOLUTION
+from server.chatStore import ChatStore, CAPACITY as CHAT_CAPACITY
+from server.chatChannels import ChatBatch, CHAT_BATCH_WINDOW, GLOBAL, resolve_channel, subscriptions
+from server.shardRouter import ShardRouter, SECRET_ENV, SHARD_HOST
+from server.clientSession import ClientSession, RESUME_GRACE, RESUMABLE_CLOSE_CODES, resume_params
+from server.metrics import METRICS, status_endpoint
+from server.movement import MovementValidator, CORRECTION_INTERVAL
+from server.collisionGrid import load_collision_grids, map_names
+from server.teleports import TeleportTable
+from server.snapshot import SnapshotEncoder, VIEW_HALF_WIDTH, VIEW_HALF_HEIGHT
+from server.sessionRecorder import SessionRecorder, RECORD_FLUSH_INTERVAL, replay_events
+from server.stateStore import StateStore, STATE_DB_PATH, CHECKPOINT_INTERVAL
+from server.tickLoop import TickScheduler, SNAPSHOT_DIVISORS, TICK_RATE
+from server.clockSync import SERVER_CLOCK, time_pong
+from server.protocol import (
+    BINARY_FORMAT, MSG_PLAYER_UPDATE, MapTable, binary_type, decode_player_update
+)
 
 from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
 
 PORT = 8989
+CHAT_LOG_PATH = "saves/chat.log"
+CHAT_SYNC_INTERVAL = 1.0   # seconds between batched fsyncs of the chat log
 
 PLAYER_HANDLER = PlayerHandler()
-PLAYER_HANDLER.start()
-
-# ------------------------------
-# Simple in-memory chat storage
-# ------------------------------
-class ChatStore:
-    def __init__(self) -> None:
-        self._lock = threading.Lock()
-        self._next_id = 1
-        self._messages: list[dict] = []
-
-    def add(self, sender_id: int, text: str) -> dict:
-        # Sanitize
-        t = (text or "").strip()
-        if len(t) > 200:
-            t = t[:200]
-        if not t:
-            raise ValueError("empty")
-        with self._lock:
-            msg = {
-                "id": self._next_id,
-                "from": sender_id,
-                "text": t,
-                "ts": time.time(),
-            }
-            self._messages.append(msg)
-            self._next_id += 1
-            # Keep only the last N to avoid unbounded growth
-            if len(self._messages) > 1000:
-                self._messages = self._messages[-800:]
-            return msg
-
-    def list_since(self, since_id: int) -> list[dict]:
-        with self._lock:
-            if since_id <= 0:
-                return list(self._messages[-100:])  # cap response size
-            # Find first index with id > since_id
-            # Messages are appended in increasing id order
-            out: list[dict] = []
-            for m in self._messages:
-                if int(m.get("id", 0)) > since_id:
-                    out.append(m)
-            # Cap size
-            if len(out) > 200:
-                out = out[-200:]
-            return out
 
 CHAT = ChatStore()
+# Chat accepted since the last fan-out
+CHAT_BATCH = ChatBatch()
 
-# Track connected clients
-CONNECTED_CLIENTS: Set[Any] = set()
-CLIENTS_LOCK = asyncio.Lock()
+# Map names seen in snapshots; binary records refer to them by index
+MAP_TABLE = MapTable()
+# Map names a player_update may carry; anything else is rejected before it is stored
+KNOWN_MAPS = frozenset(map_names())
 
+# Track connected clients (player id -> per-connection session state)
+CONNECTED_CLIENTS: Dict[int, ClientSession] = {}
 
-async def broadcast_player_update():
-    """Broadcast player list to all connected clients periodically"""
+# Resume token -> player id, for connected players and for dropped ones
+# (player id -> (last session, deadline)) still inside the grace window
+RESUME_TOKENS: Dict[str, int] = {}
+DETACHED: Dict[int, tuple[ClientSession, float]] = {}
+
+TICK = TickScheduler()
+# Authoritative movement check; None trusts client positions (--trust-movement)
+MOVES: MovementValidator | None = None
+
+# Set in shard worker mode: connections must open with an "attach" carrying it
+SHARD_SECRET: str | None = None
+ATTACH_TIMEOUT = 5.0
+TICK_ERROR_LOG_INTERVAL = 10.0  # seconds between tracebacks while ticks keep failing
+# Set by --record: every tick's player table and all chat go to a session log
+RECORDER: SessionRecorder | None = None
+# --replay: recorded players get ids from here up, clear of the connected clients' ids
+REPLAY_ID_BASE = 1_000_000
+
+# SQLite checkpoint (--state-db), and the saved players of the last run by
+# resume token, waiting for their clients to reconnect
+STATE: StateStore | None = None
+SAVED_PLAYERS: Dict[str, dict] = {}
+
+
+async def tick_loop():
+    """Run the server tick at a fixed rate; a tick that raises is logged and the next one runs"""
+    last_logged = -TICK_ERROR_LOG_INTERVAL
+    while True:
+        seq = await TICK.wait()
+        try:
+            apply_pending_updates()
+            if RECORDER is not None:
+                RECORDER.record_tick(seq, TICK.tick_time, PLAYER_HANDLER.states())
+            broadcast_player_update(seq)
+        except Exception:
+            METRICS.tick_errors += 1
+            now = time.monotonic()
+            if now - last_logged >= TICK_ERROR_LOG_INTERVAL:
+                last_logged = now
+                print(f"[Server] tick {seq} failed ({METRICS.tick_errors} failed ticks so far):")
+                traceback.print_exc()
+        finally:
+            TICK.done()
+
+
+def stop_on_failure(task: asyncio.Task, stop: asyncio.Future) -> None:
+    """Shut the server down if `task`, a loop it cannot run without, ends anyway"""
+    def done(t: asyncio.Task) -> None:
+        if t.cancelled() or stop.done():
+            return
+        print(f"[Server] {t.get_name()} stopped ({t.exception()!r}), shutting down")
+        stop.set_result(t.get_name())
+    task.add_done_callback(done)
+
+
+async def reaper_loop():
+    """Evict players whose clients went silent, and close their connections"""
+    while True:
+        await asyncio.sleep(REAP_RESOLUTION)
+        for pid in PLAYER_HANDLER.reap_inactive():
+            print(f"[Server] player {pid} timed out")
+            # Other clients get the removal in their next delta snapshot
+            session = CONNECTED_CLIENTS.get(pid)
+            if session is not None:
+                session.outbox.close(4000, "inactive")
+            elif pid in DETACHED:
+                RESUME_TOKENS.pop(DETACHED.pop(pid)[0].resume_token, None)
+        now = time.monotonic()
+        for pid in [pid for pid, (_, deadline) in DETACHED.items() if deadline <= now]:
+            session, _ = DETACHED.pop(pid)
+            RESUME_TOKENS.pop(session.resume_token, None)
+            PLAYER_HANDLER.unregister(pid)
+            print(f"[Server] player {pid} did not reconnect")
+
+
+async def chat_flush_loop():
+    """Fan out the chat of the last window, one chat_update per recipient"""
+    while True:
+        await asyncio.sleep(CHAT_BATCH_WINDOW)
+        CHAT_BATCH.flush(
+            (session, pid, PLAYER_HANDLER.map_of(pid)) for pid, session in CONNECTED_CLIENTS.items()
+        )
+
+
+async def metrics_loop():
+    """Sample the traffic counters once a second for the per-second rates"""
+    while True:
+        METRICS.sample()
+        await asyncio.sleep(1.0)
+
+
+async def chat_sync_loop():
+    """Make chat log writes durable in batches, off the event loop"""
     while True:
-        await asyncio.sleep(0.0167)  # 60 updates per second
-        players = PLAYER_HANDLER.list_players()
-        message = {
-            "type": "players_update",
-            "players": players,
-            "timestamp": time.time()
-        }
-        msg_json = json.dumps(message)
-        # Broadcast to all connected clients
-        disconnected = set()
-        async with CLIENTS_LOCK:
-            for client in CONNECTED_CLIENTS:
+        await asyncio.sleep(CHAT_SYNC_INTERVAL)
+        await asyncio.to_thread(CHAT.sync)
+
+
+async def recorder_flush_loop():
+    """Write the buffered session recording in batches, off the event loop"""
+    while True:
+        await asyncio.sleep(RECORD_FLUSH_INTERVAL)
+        await asyncio.to_thread(RECORDER.flush)
+
+
+def apply_recorded_tick(delta: dict, replayed: set[int]) -> None:
+    """Bring the replayed players in PLAYER_HANDLER to a recorded tick (ids already offset)"""
+    removed = replayed - set(delta["table"]) if delta["keyframe"] else replayed & set(delta["removed"])
+    for pid in removed:
+        PLAYER_HANDLER.unregister(pid)
+        replayed.discard(pid)
+    for pid in delta["players"]:
+        if pid not in replayed:
+            PLAYER_HANDLER.register(pid)
+            replayed.add(pid)
+    # Recorded players send nothing: keep the reaper off them while they stand still
+    now = time.monotonic()
+    PLAYER_HANDLER.update_many(
+        [(pid, p["x"], p["y"], p["map"], p["dir"], p["moving"]) for pid, p in delta["players"].items()],
+        [(pid, now) for pid in replayed]
+    )
+
+
+async def replay_loop(path: str, speed: float):
+    """
+    Play a --record session log into the live server at `speed` times the recorded
+    pace. The tick loop broadcasts the recorded players to the connected clients
+    like any others (tiers, map tables, outboxes), and recorded chat goes out
+    through CHAT_BATCH, so a client can watch the session as it happened.
+    """
+    replayed: set[int] = set()
+    elapsed = 0.0           # recorded seconds played so far
+    last_ts = None
+    start = time.monotonic()
+    ticks = 0
+    try:
+        for kind, event in replay_events(path):
+            if kind == "chat":
+                to = event.get("to")
                 try:
-                    await client.send(msg_json)
-                except Exception:
-                    disconnected.add(client)
-            # Remove disconnected clients
-            CONNECTED_CLIENTS.difference_update(disconnected)
+                    msg = CHAT.add(REPLAY_ID_BASE + int(event["from"]), event["text"], event.get("channel", GLOBAL),
+                                   REPLAY_ID_BASE + int(to) if to is not None else None)
+                except ValueError:
+                    continue
+                CHAT_BATCH.add(msg)
+                continue
+            ts = event["timestamp"]
+            if last_ts is not None and ts >= last_ts:
+                elapsed += ts - last_ts     # a later server run appended to the file restarts the clock
+            last_ts = ts
+            delay = elapsed / speed - (time.monotonic() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            event["players"] = {REPLAY_ID_BASE + pid: p for pid, p in event["players"].items()}
+            event["removed"] = [REPLAY_ID_BASE + pid for pid in event["removed"]]
+            event["table"] = {REPLAY_ID_BASE + pid for pid in event["table"]}
+            apply_recorded_tick(event, replayed)
+            ticks += 1
+    except (OSError, ValueError) as e:
+        print(f"[Server] replay of {path} stopped: {e}")
+    print(f"[Server] replay of {path} done: {ticks} ticks, {elapsed:.1f} recorded seconds")
+    for pid in replayed:
+        PLAYER_HANDLER.unregister(pid)
+
+
+def collect_checkpoint() -> tuple[list, list, list, dict[str, int]]:
+    """What changed since the last checkpoint: player rows, tokens gone for good, new chat"""
+    rows, versions = [], {}
+    for token, pid in RESUME_TOKENS.items():
+        p = PLAYER_HANDLER.players.get(pid)
+        if p is None or not p.map:
+            continue
+        versions[token] = p.version
+        if STATE.saved.get(token) != p.version:
+            rows.append((token, p.x, p.y, p.map, p.dir))
+    gone = [token for token in STATE.saved if token not in RESUME_TOKENS]
+    return rows, gone, CHAT.messages_after(STATE.chat_id), versions
+
+
+def checkpoint_done(chat: list[dict], versions: dict[str, int]) -> None:
+    STATE.saved = versions
+    if chat:
+        STATE.chat_id = chat[-1]["id"]
+
+
+async def checkpoint_loop():
+    """Save player positions and chat to SQLite once a second, off the event loop"""
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL)
+        rows, gone, chat, versions = collect_checkpoint()
+        if rows or gone or chat:
+            await asyncio.to_thread(STATE.checkpoint, rows, gone, chat)
+        checkpoint_done(chat, versions)
+
+
+async def wait_for_router():
+    """Return once the router that started this shard is gone (it holds our stdin)"""
+    await asyncio.to_thread(sys.stdin.buffer.read)
+    print("[Server] router exited, stopping shard")
+
+
+def apply_pending_updates():
+    """
+    Apply the newest position each client sent since the last tick, in one batch,
+    along with when each client was last heard from (for the inactivity reaper)
+    """
+    updates = []
+    heard = []
+    now = time.monotonic()
+    for session in CONNECTED_CLIENTS.values():
+        if session.last_heard - session.heard_pushed >= REAP_RESOLUTION:
+            session.heard_pushed = session.last_heard
+            heard.append((session.player_id, session.last_heard))
+        if session.pending_update is not None:
+            x, y, map_name, direction, moving, input_seq = session.pending_update
+            session.pending_update = None
+            current = PLAYER_HANDLER.players.get(session.player_id)
+            if MOVES is not None and current is not None:
+                ok_x, ok_y, ok_map = MOVES.check(session.move_budget, current.x, current.y, current.map,
+                                                 x, y, map_name)
+                if (ok_x, ok_y, ok_map) != (x, y, map_name) and now - session.last_correction >= CORRECTION_INTERVAL:
+                    session.last_correction = now
+                    # `seq` tells the client which of its inputs this position follows,
+                    # so it can replay the later ones on top of it
+                    session.send(json.dumps({
+                        "type": "position_correction", "x": ok_x, "y": ok_y, "map": ok_map,
+                        "seq": input_seq
+                    }))
+                x, y, map_name = ok_x, ok_y, ok_map
+            updates.append((session.player_id, x, y, map_name, direction, moving))
+    if updates or heard:
+        PLAYER_HANDLER.update_many(updates, heard)
+
+
+def broadcast_player_update(seq: int):
+    """Send each client that is due one a delta snapshot of the players in its view"""
+    due = []
+    for session in CONNECTED_CLIENTS.values():
+        session.update_tier(seq, len(SNAPSHOT_DIVISORS) - 1)
+        hz = TICK.snapshot_hz(session.tier)
+        if hz != session.update_hz:
+            # Clients send positions no faster than they get snapshots
+            session.update_hz = hz
+            session.send(json.dumps({"type": "update_rate", "hz": hz}))
+        if TICK.snapshot_due(session.tier, session.player_id):
+            due.append(session)
+    if not due:
+        return
+    states, visible = PLAYER_HANDLER.snapshot_visible(
+        [session.player_id for session in due], VIEW_HALF_WIDTH, VIEW_HALF_HEIGHT
+    )
+    # Player records are encoded once per tick and shared by every client's delta.
+    # Frames are only queued here; each client's writer task does the sending.
+    encoder = SnapshotEncoder(TICK.tick_time, MAP_TABLE)
+    for session in due:
+        in_view = visible.get(session.player_id)
+        if in_view is None:
+            continue  # player was removed by the cleaner
+        delta = session.snapshots.diff(seq, {pid: states[pid][0] for pid in in_view})
+        if delta is None:
+            continue  # nothing moved since the client's last ack
+        try:
+            frame = encoder.encode_binary(delta, states) if session.binary else encoder.encode(delta, states)
+        except ValueError as e:
+            # Never let one bad record stop the tick; this client just misses the frame
+            print(f"[Server] snapshot for player {session.player_id} not encoded: {e}")
+            continue
+        if session.binary and session.maps_announced < len(MAP_TABLE):
+            # Map names must be announced before a frame refers to them
+            session.send(json.dumps(MAP_TABLE.announce(session.maps_announced)))
+            session.maps_announced = len(MAP_TABLE)
+        # A newer delta supersedes a queued one, but later deltas build on keyframes
+        session.send(frame, droppable=not delta.keyframe)
+
+
+def resume_session(websocket: Any, token: str) -> ClientSession | None:
+    """Give a reconnecting client its player back, or None if the token is unknown or expired"""
+    pid = RESUME_TOKENS.get(token) if token else None
+    if pid is None or pid not in PLAYER_HANDLER.players:
+        return None
+    old = CONNECTED_CLIENTS.get(pid)
+    if old is not None:
+        # The old connection is half-open (the client noticed the drop first)
+        old.outbox.close(4001, "resumed on another connection")
+    else:
+        old, _ = DETACHED.pop(pid)
+    # Deltas continue from the last snapshot the client acked. Map tables
+    # start over, since announcements may have been lost with the connection.
+    return ClientSession(websocket, pid, snapshots=old.snapshots, binary=old.binary,
+                         resume_token=token)
+
+
+def status() -> dict:
+    """Everything /status, /metrics and server_stats report"""
+    depths = {pid: len(session.outbox) for pid, session in CONNECTED_CLIENTS.items()}
+    return {
+        "clients": len(CONNECTED_CLIENTS),
+        "players": len(PLAYER_HANDLER.players),
+        "players_per_map": PLAYER_HANDLER.count_by_map(),
+        "detached": len(DETACHED),
+        "evictions": PLAYER_HANDLER.evictions,
+        "tick": TICK.stats(),
+        "send_queue": {
+            "max": max(depths.values(), default=0),
+            "total": sum(depths.values()),
+            "by_client": {pid: depth for pid, depth in depths.items() if depth},
+        },
+        "traffic": METRICS.snapshot(),
+        **({"checkpoint": STATE.stats()} if STATE is not None else {}),
+    }
+
+
+def server_stats() -> dict:
+    return {"type": "server_stats", **status()}
+
+
+async def accept_attach(websocket: Any) -> dict | None:
+    """Read the router's attach message on a shard; None if it is missing or forged"""
+    try:
+        data = json.loads(await asyncio.wait_for(websocket.recv(), ATTACH_TIMEOUT))
+        secret = str(data.get("secret", ""))
+        if data.get("type") == "attach" and hmac.compare_digest(secret, SHARD_SECRET):
+            return data
+    except (asyncio.TimeoutError, ValueError, AttributeError):
+        pass
+    await websocket.close(code=1008, reason="attach required")
+    return None
+
+
+async def serve_control(websocket: Any):
+    """Router control connection to a shard: answers stats requests only"""
+    try:
+        async for message in websocket:
+            if json.loads(message).get("type") == "server_stats":
+                await websocket.send(json.dumps(server_stats()))
+    except ConnectionClosed:
+        pass
 
 
 async def handle_client(websocket: Any):
     """Handle a WebSocket client connection"""
     #player_id = -1
-    
-    async with CLIENTS_LOCK:
-        CONNECTED_CLIENTS.add(websocket)
-    
-    player_id = PLAYER_HANDLER.register()
-    print("[Server] registered", player_id)
+    attach = None
+    if SHARD_SECRET is not None:
+        # Shard worker: only the router connects, and it says which player this is
+        attach = await accept_attach(websocket)
+        if attach is None:
+            return
+        if attach.get("control"):
+            await serve_control(websocket)
+            return
+
+    token, last_chat = resume_params(websocket.request.path)
+    session = None if attach else resume_session(websocket, token)
+    saved = None
+    resumed = session is not None
+    if resumed:
+        player_id = session.player_id
+        print("[Server] resumed", player_id)
+    else:
+        player_id = PLAYER_HANDLER.register(int(attach["id"]) if attach else None)
+        print("[Server] registered", player_id)
+        session = ClientSession(websocket, player_id)
+        saved = SAVED_PLAYERS.pop(token, None) if token and not attach else None
+        if saved is not None and saved["map"] not in KNOWN_MAPS:
+            saved = None  # the map is gone since the checkpoint: start over
+        place = attach.get("place") if attach else None
+        if place is not None and place.get("map") in KNOWN_MAPS:
+            # Arriving from another shard; the router checked the map change
+            PLAYER_HANDLER.update(player_id, float(place["x"]), float(place["y"]), place["map"])
+        if saved is not None:
+            # Returning after a server restart: back where the last checkpoint left the player
+            PLAYER_HANDLER.update(player_id, saved["x"], saved["y"], saved["map"], saved["dir"])
+            session.resume_token = token
+            STATE.saved[token] = -1  # its row gets rewritten, or deleted if the player leaves for good
+            print("[Server] restored", player_id, "on", saved["map"])
+        if not attach:
+            RESUME_TOKENS[session.resume_token] = player_id
+    writer = asyncio.create_task(session.outbox.run(websocket))
+    METRICS.connections += 1
 
     try:
-        # Register player on connection - server assigns ID
-        #player_id = PLAYER_HANDLER.register()
-        await websocket.send(json.dumps({
-            "type": "registered",
-            "id": player_id
-        }))
-        
-        # Send initial player list
-        players = PLAYER_HANDLER.list_players()
-        await websocket.send(json.dumps({
-            "type": "players_update",
-            "players": players,
-            "timestamp": time.time()
-        }))
-        
-        # Send recent chat messages
-        recent_chat = CHAT.list_since(0)
-        await websocket.send(json.dumps({
-            "type": "chat_update",
-            "messages": recent_chat
-        }))
-        
+        if attach:
+            # The router already greeted the client and owns chat
+            session.binary = bool(attach.get("binary"))
+            session.inbound_maps.apply(attach.get("maps", {}))
+        else:
+            # Register player on connection - server assigns ID
+            #player_id = PLAYER_HANDLER.register()
+            session.send(json.dumps({
+                "type": "registered",
+                "id": player_id,
+                "token": session.resume_token,
+                "resumed": resumed,
+                "restored": saved is not None
+            }))
+
+            # Send the chat messages the client hasn't seen (recent ones if it has none)
+            recent_chat = CHAT.list_since(last_chat, subscriptions(player_id, PLAYER_HANDLER.map_of(player_id)))
+            session.send(json.dumps({
+                "type": "chat_update",
+                "messages": recent_chat
+            }))
+
+        # Join the broadcast only now, so the first snapshot (a keyframe) follows "registered"
+        CONNECTED_CLIENTS[player_id] = session
+
         # Handle incoming messages
         async for message in websocket:
+            received = SERVER_CLOCK()
+            METRICS.msgs_in += 1
+            METRICS.bytes_in += len(message)
+            if not session.inbound.take():
+                # Over the rate limit: drop before decoding anything
+                session.inbound_dropped += 1
+                METRICS.inbound_dropped += 1
+                if not session.flood.take():
+                    print(f"[Server] player {player_id} flooding, disconnecting")
+                    await websocket.close(code=1008, reason="rate limit exceeded")
+                    break
+                continue
+            # Any message counts as activity; the tick pushes it to the reaper in its batch
+            session.last_heard = time.monotonic()
             try:
-                data = json.loads(message)
+                if isinstance(message, bytes):
+                    if binary_type(message) != MSG_PLAYER_UPDATE:
+                        raise ValueError("unsupported binary message")
+                    data = decode_player_update(message, session.inbound_maps)
+                else:
+                    data = json.loads(message)
                 msg_type = data.get("type")
-                
-                
-                if msg_type == "player_update":
+
+                if msg_type == "hello":
+                    # Negotiate the wire format; JSON stays the fallback
+                    if BINARY_FORMAT in data.get("encodings", []):
+                        session.binary = True
+                    session.send(json.dumps({
+                        "type": "encoding",
+                        "format": BINARY_FORMAT if session.binary else "json"
+                    }))
+
+                elif msg_type == "map_table":
+                    session.inbound_maps.apply(data.get("maps", {}))
+
+                elif msg_type == "player_update":
                     # Update player position - use server-assigned ID, ignore client ID
                     x = float(data.get("x", 0))
                     y = float(data.get("y", 0))
                     map_name = str(data.get("map", ""))
+                    if map_name not in KNOWN_MAPS:
+                        raise ValueError("unknown_map")
                     
                     # Use the server-assigned player_id, not client-provided
                     # HINT: This part might be helpful for direction change
@@ -140,43 +505,59 @@ async def handle_client(websocket: Any):
                      # NEW
                     direction = str(data.get("dir", "down"))   # "up"|"down"|"left"|"right"
                     moving = bool(data.get("moving", False))   # True if walking
+                    input_seq = int(data.get("seq", 0))       # client's input frame, echoed in corrections
+
+                    # Latest wins: the tick loop applies only the newest update per client
+                    session.pending_update = (x, y, map_name, direction, moving, input_seq)
+
+                elif msg_type == "time_ping":
+                    session.send(json.dumps(time_pong(data, received)))
+
+                elif msg_type == "player_state" and attach:
+                    # The router asks where this player is before moving it to another shard
+                    p = PLAYER_HANDLER.players.get(player_id)
+                    if p is not None:
+                        session.send(json.dumps({"type": "player_state", "x": p.x, "y": p.y, "map": p.map}))
+
+                elif msg_type == "server_stats":
+                    session.send(json.dumps(server_stats()))
+
+                elif msg_type == "snapshot_ack":
+                    # Later deltas are computed against the newest snapshot the client holds
+                    session.snapshots.ack(int(data.get("seq", 0)))
 
-                    # update playear state in handler
-                    PLAYER_HANDLER.update(player_id, x, y, map_name, direction, moving)
-                    
                 elif msg_type == "chat_send":
                     # Send chat message - use server-assigned ID
                     text = str(data.get("text", ""))
-                    if text:
+                    if not session.chat.take():
+                        session.send(json.dumps({
+                            "type": "error",
+                            "message": "chat_rate_limited"
+                        }))
+                    elif text:
                         try:
-                            msg = CHAT.add(player_id, text)  # Use server-assigned ID
-                            # Broadcast to all clients
-                            chat_msg = {
-                                "type": "chat_update",
-                                "messages": [msg]
-                            }
-                            chat_json = json.dumps(chat_msg)
-                            async with CLIENTS_LOCK:
-                                disconnected = set()
-                                for client in CONNECTED_CLIENTS:
-                                    try:
-                                        await client.send(chat_json)
-                                    except Exception:
-                                        disconnected.add(client)
-                                CONNECTED_CLIENTS.difference_update(disconnected)
-                        except ValueError:
-                            await websocket.send(json.dumps({
+                            channel, to = resolve_channel(data, PLAYER_HANDLER.map_of(player_id))
+                            if to is not None and to not in CONNECTED_CLIENTS:
+                                raise ValueError("unknown_player")
+                            msg = CHAT.add(player_id, text, channel, to)  # Use server-assigned ID
+                            METRICS.chat_messages += 1
+                            # Sent with the rest of this window's chat
+                            CHAT_BATCH.add(msg)
+                            if RECORDER is not None:
+                                RECORDER.record_chat(msg)
+                        except ValueError as e:
+                            session.send(json.dumps({
                                 "type": "error",
-                                "message": "empty_message"
+                                "message": str(e)
                             }))
                             
             except json.JSONDecodeError:
-                await websocket.send(json.dumps({
+                session.send(json.dumps({
                     "type": "error",
                     "message": "invalid_json"
                 }))
             except Exception as e:
-                await websocket.send(json.dumps({
+                session.send(json.dumps({
                     "type": "error",
                     "message": str(e)
                 }))
@@ -184,21 +565,138 @@ async def handle_client(websocket: Any):
     except Exception as e:
         print(f"[Server] Client handler error: {e}")
     finally:
-        # Unregister player on disconnect
-        if player_id >= 0:
-            PLAYER_HANDLER.unregister(player_id)
-        async with CLIENTS_LOCK:
-            CONNECTED_CLIENTS.discard(websocket)
+        # A session taken over by a resumed connection leaves the player alone
+        if CONNECTED_CLIENTS.get(player_id) is session or player_id not in CONNECTED_CLIENTS:
+            CONNECTED_CLIENTS.pop(player_id, None)
+            if websocket.close_code in RESUMABLE_CLOSE_CODES and session.outbox.closing is None and not attach:
+                # Connection lost: keep the player around for a while in case the client comes back
+                DETACHED[player_id] = (session, time.monotonic() + RESUME_GRACE)
+            else:
+                # Unregister player on disconnect
+                RESUME_TOKENS.pop(session.resume_token, None)
+                PLAYER_HANDLER.unregister(player_id)
+        writer.cancel()
 
 
-async def main():
-    print(f"[Server] Running WebSocket server on ws://0.0.0.0:{PORT}")
-    # Start broadcast task
-    asyncio.create_task(broadcast_player_update())
-    # Start server
-    async with serve(handle_client, "0.0.0.0", PORT):
-        await asyncio.Future()  # run forever
+async def main(args: argparse.Namespace):
+    global SHARD_SECRET, MOVES, RECORDER, STATE, SAVED_PLAYERS
+    if args.chat_log:
+        replayed = CHAT.open_log(args.chat_log)
+        print(f"[Server] Chat log {args.chat_log}: replayed {replayed} messages")
+        asyncio.create_task(chat_sync_loop())
+
+    if args.sharded:
+        # Router only: one worker process per map simulates the players
+        worker_cmd = [sys.executable, os.path.abspath(__file__)]
+        if args.trust_movement:
+            worker_cmd.append("--trust-movement")
+        if args.record:
+            worker_cmd += ["--record", args.record]
+        worker_cmd += ["--snapshot-rate", str(args.snapshot_rate)]
+        router = ShardRouter(CHAT, args.port + 1, worker_cmd, moves=None if args.trust_movement
+                             else MovementValidator(load_collision_grids(), TeleportTable.from_saves()))
+        await router.start_shards()
+        print(f"[Server] Running sharded WebSocket router on ws://0.0.0.0:{args.port}")
+        asyncio.create_task(metrics_loop())
+        asyncio.create_task(router.chat_flush_loop())
+        try:
+            async with serve(router.handle_client, "0.0.0.0", args.port,
+                             process_request=status_endpoint(router.status)):
+                await asyncio.Future()  # run forever
+        finally:
+            await router.stop_shards()
+            CHAT.close()
+        return
+
+    host = "0.0.0.0"
+    if args.shard:
+        SHARD_SECRET = os.environ.get(SECRET_ENV)
+        if not SHARD_SECRET:
+            raise SystemExit(f"--shard needs the router's secret in ${SECRET_ENV}")
+        host = SHARD_HOST
+    if not args.trust_movement:
+        MOVES = MovementValidator(load_collision_grids(), TeleportTable.from_saves())
+    TICK.set_snapshot_rate(args.snapshot_rate)
+    if args.record:
+        # Shards each record their own map; chat goes through the router and is not recorded there
+        path = f"{args.record}.{args.shard}" if args.shard else args.record
+        RECORDER = SessionRecorder(path)
+        print(f"[Server] Recording session to {path}")
+        asyncio.create_task(recorder_flush_loop())
+    if args.state_db and not args.shard:
+        STATE = StateStore(args.state_db)
+        SAVED_PLAYERS = STATE.load_players()
+        if not CHAT.messages_after(0):
+            CHAT.restore(STATE.load_chat(CHAT_CAPACITY))
+        print(f"[Server] State checkpoints in {args.state_db}: {len(SAVED_PLAYERS)} players to restore")
+        checkpointer = asyncio.create_task(checkpoint_loop())
+    print(f"[Server] Running WebSocket server on ws://{host}:{args.port}"
+          + (f" (shard {args.shard})" if args.shard else ""))
+    # Start the server tick and the inactivity reaper; the server stops if either dies
+    failed = asyncio.get_running_loop().create_future()
+    stop_on_failure(asyncio.create_task(tick_loop(), name="tick loop"), failed)
+    stop_on_failure(asyncio.create_task(reaper_loop(), name="reaper"), failed)
+    asyncio.create_task(metrics_loop())
+    if not args.shard:
+        asyncio.create_task(chat_flush_loop())  # the router owns chat in sharded mode
+    if args.replay:
+        print(f"[Server] Replaying {args.replay} at {args.replay_speed}x")
+        asyncio.create_task(replay_loop(args.replay, args.replay_speed))
+    # Start server; plain HTTP GET /status and /metrics are answered on the same port
+    try:
+        async with serve(handle_client, host, args.port, process_request=status_endpoint(status)):
+            try:
+                if args.shard:
+                    await asyncio.wait([asyncio.create_task(wait_for_router()), failed],
+                                       return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    await failed  # run until a core loop dies
+            finally:
+                if STATE is not None:
+                    # Last checkpoint before the connections close, so everyone can be restored
+                    checkpointer.cancel()
+                    STATE.checkpoint(*collect_checkpoint()[:3])
+    finally:
+        CHAT.close()
+        if RECORDER is not None:
+            RECORDER.close()
+        if STATE is not None:
+            STATE.close()
+    if failed.done():
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Monster Go online server")
+    parser.add_argument("--chat-log", default=CHAT_LOG_PATH,
+                        help="append-only chat log replayed on start ('' to keep chat in memory only)")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--sharded", action="store_true",
+                        help="run one worker process per map behind a router on --port")
+    parser.add_argument("--shard", metavar="MAP",
+                        help="internal: run as the worker for MAP (started by --sharded)")
+    parser.add_argument("--trust-movement", action="store_true",
+                        help="accept client positions as sent (no speed or wall checks)")
+    parser.add_argument("--snapshot-rate", type=int, default=TICK_RATE, metavar="HZ",
+                        help="players_delta frames per second per client (clients interpolate, so 20 is enough)")
+    parser.add_argument("--state-db", default=STATE_DB_PATH,
+                        help="SQLite file player positions and chat are checkpointed to ('' to disable; "
+                             "not used in sharded mode)")
+    parser.add_argument("--record", metavar="PATH",
+                        help="append every tick's player table and all chat to a session log (see tools/replay.py)")
+    parser.add_argument("--replay", metavar="PATH",
+                        help="play a --record session log to the connected clients (no chat log or state db)")
+    parser.add_argument("--replay-speed", type=float, default=1.0, metavar="FACTOR",
+                        help="playback speed of --replay")
+    args = parser.parse_args()
+    if args.replay:
+        if args.sharded:
+            parser.error("--replay runs on a single server, not with --sharded")
+        if args.replay_speed <= 0:
+            parser.error("--replay-speed must be positive")
+        # Recorded players and chat must not end up in the live server's saved state
+        args.chat_log = args.state_db = ""
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
\ No newline at end of file
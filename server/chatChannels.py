@@ -0,0 +1,87 @@
+import json
+from typing import Any, Iterable
+
+GLOBAL = "global"
+WHISPER = "whisper"
+CHAT_RATE = 1.0             # chat messages per second a client may send
+CHAT_BURST = 5.0
+CHAT_BATCH_WINDOW = 0.1     # seconds chat is collected before it is fanned out
+
+# Channels: "global", "map:<map name>" (the sender's map at the time), and
+# "whisper" between the sender and msg["to"]. The store indexes whispers under
+# "user:<id>" of both ends, so subscriptions() covers everything a player may read.
+# Player ids restart with the server, so whispers live in memory only: they are
+# never written to the chat log or the state database, and never replayed.
+
+
+def persisted(msg: dict) -> bool:
+    """Whether `msg` may be saved and replayed after a restart"""
+    return msg.get("channel", GLOBAL) != WHISPER
+
+
+def resolve_channel(data: dict, sender_map: str) -> tuple[str, int | None]:
+    """Channel and whisper target of a chat_send message"""
+    kind = str(data.get("channel", GLOBAL))
+    if kind == "map":
+        return f"map:{sender_map}", None
+    if kind == WHISPER:
+        try:
+            return WHISPER, int(data["to"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("whisper_needs_target")
+    return GLOBAL, None
+
+
+def index_keys(msg: dict) -> list[str]:
+    channel = msg.get("channel", GLOBAL)
+    if channel == WHISPER:
+        if msg["from"] == msg["to"]:
+            return [f"user:{msg['from']}"]
+        return [f"user:{msg['from']}", f"user:{msg['to']}"]
+    return [channel]
+
+
+def subscriptions(pid: int, map_name: str) -> list[str]:
+    return [GLOBAL, f"map:{map_name}", f"user:{pid}"]
+
+
+def visible(msg: dict, pid: int, map_name: str) -> bool:
+    channel = msg.get("channel", GLOBAL)
+    if channel == GLOBAL:
+        return True
+    if channel == WHISPER:
+        return pid == msg["from"] or pid == msg["to"]
+    return channel == f"map:{map_name}"
+
+
+class ChatBatch:
+    """
+    Chat accepted since the last flush. flush() sends each recipient one
+    chat_update with the messages it may see; recipients that see the same
+    messages share one encoded frame.
+    """
+    pending: list[dict]
+
+    def __init__(self) -> None:
+        self.pending = []
+
+    def add(self, msg: dict) -> None:
+        self.pending.append(msg)
+
+    def flush(self, recipients: Iterable[tuple[Any, int, str]]) -> None:
+        """`recipients` yields (session, player id, current map); sessions need a send() method"""
+        if not self.pending:
+            return
+        msgs, self.pending = self.pending, []
+        frames: dict[tuple[int, ...], str] = {}
+        for session, pid, map_name in recipients:
+            picked = tuple(i for i, msg in enumerate(msgs) if visible(msg, pid, map_name))
+            if not picked:
+                continue
+            frame = frames.get(picked)
+            if frame is None:
+                frame = frames[picked] = json.dumps({
+                    "type": "chat_update",
+                    "messages": [msgs[i] for i in picked]
+                })
+            session.send(frame)
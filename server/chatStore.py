@@ -0,0 +1,179 @@
+import heapq
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import IO, Iterable
+
+from server.chatChannels import GLOBAL, WHISPER, index_keys, persisted
+
+CAPACITY = 1000             # messages kept in memory
+HISTORY_ON_JOIN = 100       # messages sent to a client that has none yet
+MAX_CATCH_UP = 200          # messages returned for any other request
+LOG_READ_BLOCK = 64 * 1024
+LOG_COMPACT_BYTES = 8 * 1024 * 1024
+
+
+class ChatStore:
+    """
+    In-memory chat history as a fixed-size ring: message `id` lives in slot
+    id % CAPACITY, so finding the messages after an id is plain arithmetic.
+    Each channel also keeps the ids of its messages still in the ring, so a
+    client is only sent the channels it can read.
+
+    Optionally every message but whispers is also appended to a JSON-lines log.
+    Writes are buffered and made durable by sync(), which the server calls
+    periodically, and the last CAPACITY messages are replayed from the end of
+    the log on boot.
+    """
+
+    def __init__(self, capacity: int = CAPACITY) -> None:
+        self._lock = threading.Lock()
+        self._capacity = capacity
+        self._ring: list[dict | None] = [None] * capacity
+        self._channels: dict[str, deque[int]] = {}
+        self._next_id = 1
+        self._log: IO[str] | None = None
+        self._dirty = False
+
+    def _oldest_id(self) -> int:
+        return max(1, self._next_id - self._capacity)
+
+    def _store(self, msg: dict) -> None:
+        slot = msg["id"] % self._capacity
+        old = self._ring[slot]
+        if old is not None:
+            # The overwritten message leaves its channels too (it is their oldest id)
+            for key in index_keys(old):
+                ids = self._channels.get(key)
+                while ids and ids[0] <= old["id"]:
+                    ids.popleft()
+                if not ids:
+                    self._channels.pop(key, None)
+        self._ring[slot] = msg
+        for key in index_keys(msg):
+            self._channels.setdefault(key, deque()).append(msg["id"])
+
+    def add(self, sender_id: int, text: str, channel: str = GLOBAL, to: int | None = None) -> dict:
+        # Sanitize
+        t = (text or "").strip()
+        if len(t) > 200:
+            t = t[:200]
+        if not t:
+            raise ValueError("empty_message")
+        with self._lock:
+            msg = {
+                "id": self._next_id,
+                "from": sender_id,
+                "text": t,
+                "ts": time.time(),
+                "channel": channel,
+            }
+            if channel == WHISPER:
+                msg["to"] = to
+            self._store(msg)
+            self._next_id += 1
+            if self._log is not None and persisted(msg):
+                self._log.write(json.dumps(msg) + "\n")
+                self._dirty = True
+            return msg
+
+    def list_since(self, since_id: int, channels: Iterable[str] = (GLOBAL,)) -> list[dict]:
+        """Messages after `since_id` in `channels`, oldest first, capped to the newest few"""
+        with self._lock:
+            start = max(since_id + 1, self._oldest_id())
+            limit = HISTORY_ON_JOIN if since_id <= 0 else MAX_CATCH_UP  # cap response size
+            per_channel = []
+            for key in set(channels):
+                ids = self._channels.get(key)
+                if not ids:
+                    continue
+                newest: list[int] = []
+                for i in reversed(ids):
+                    if i < start or len(newest) == limit:
+                        break
+                    newest.append(i)
+                per_channel.append(newest)
+            # Each list is newest first; merge them and keep the newest `limit`
+            picked = list(heapq.merge(*per_channel, reverse=True))[:limit]
+            return [self._ring[i % self._capacity] for i in reversed(picked)]
+
+    def messages_after(self, since_id: int) -> list[dict]:
+        """Every message after `since_id` still in the ring, all channels, oldest first"""
+        with self._lock:
+            start = max(since_id + 1, self._oldest_id())
+            return [self._ring[i % self._capacity] for i in range(start, self._next_id)]
+
+    # Persistence
+    def restore(self, messages: list[dict]) -> None:
+        """Put saved messages (oldest first) back into the ring, except whispers; new ids continue after them"""
+        with self._lock:
+            for msg in messages:
+                if persisted(msg):
+                    self._store(msg)
+            if messages:
+                self._next_id = messages[-1]["id"] + 1
+
+    def open_log(self, path: str) -> int:
+        """Replay the tail of the log at `path` into the ring and append to it from now on."""
+        replayed = self._read_tail(path) if os.path.exists(path) else []
+        self.restore(replayed)
+        kept = [msg for msg in replayed if persisted(msg)]
+        if len(kept) < len(replayed) or (replayed and os.path.getsize(path) > LOG_COMPACT_BYTES):
+            # Rewrite the log with just what the ring holds (whispers from older logs go)
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for msg in kept:
+                    f.write(json.dumps(msg) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        self._log = open(path, "a", encoding="utf-8")
+        if self._log.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._log.write("\n")  # don't glue new lines onto a torn one
+        return len(kept)
+
+    def _read_tail(self, path: str) -> list[dict]:
+        """Parse only the last `capacity` lines, reading the file backwards in blocks."""
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            data = b""
+            while pos > 0 and data.count(b"\n") <= self._capacity:
+                step = min(LOG_READ_BLOCK, pos)
+                pos -= step
+                f.seek(pos)
+                data = f.read(step) + data
+        lines = data.splitlines()
+        if pos > 0:
+            lines = lines[1:]  # first line may be cut in half
+        out: list[dict] = []
+        for line in lines[-self._capacity:]:
+            try:
+                msg = json.loads(line)
+                msg["id"] = int(msg["id"])
+            except (ValueError, KeyError, TypeError):
+                continue  # torn write from a crash
+            out.append(msg)
+        return out
+
+    def sync(self) -> None:
+        """Flush and fsync buffered log writes. Blocking: run it off the event loop."""
+        with self._lock:
+            if self._log is None or not self._dirty:
+                return
+            self._log.flush()
+            self._dirty = False
+            fd = self._log.fileno()
+        os.fsync(fd)
+
+    def close(self) -> None:
+        self.sync()
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
@@ -0,0 +1,160 @@
+import asyncio
+import secrets
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+
+from websockets.exceptions import ConnectionClosed
+
+from server.chatChannels import CHAT_RATE, CHAT_BURST
+from server.metrics import METRICS
+from server.movement import move_budget
+from server.protocol import MapTable
+from server.rateLimit import TokenBucket
+from server.snapshot import SnapshotHistory
+
+SEND_QUEUE_SIZE = 32            # frames queued before stale snapshots get dropped
+SEND_QUEUE_HARD_LIMIT = 256     # reliable backlog at which the client is disconnected
+SLOW_CLIENT_BACKLOG = 4         # queued frames that move a client to a slower snapshot tier
+TIER_RECOVERY_TICKS = 120       # ticks with an empty queue before it moves back up
+INBOUND_RATE = 200.0            # messages per second a client may send
+INBOUND_BURST = 400.0
+RESUME_GRACE = 15.0             # seconds a dropped player waits for its client to reconnect
+# Close codes of a lost connection (no close frame, keepalive timeout); clean
+# closes and kicks end the session for good
+RESUMABLE_CLOSE_CODES = (None, 1005, 1006, 1011)
+
+
+class Outbox:
+    """
+    Bounded outbound queue for one connection, drained by its own writer task.
+
+    Producers never wait on the socket. Snapshot frames are droppable: once the
+    queue is full the oldest queued one is discarded, which is safe because the
+    next delta is built against what the client acked. Everything else (chat,
+    keyframes, map tables, replies) is reliable.
+    """
+    _queue: deque[tuple[str | bytes, bool]]
+    _wakeup: asyncio.Event
+    closing: tuple[int, str] | None     # close code and reason, once a close is requested
+    overflowed: bool
+    dropped: int
+
+    def __init__(self) -> None:
+        self._queue = deque()
+        self._wakeup = asyncio.Event()
+        self.closing = None
+        self.overflowed = False
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def push(self, frame: str | bytes, droppable: bool = False) -> None:
+        if self.closing:
+            return
+        if len(self._queue) >= SEND_QUEUE_SIZE:
+            for i, (_, stale) in enumerate(self._queue):
+                if stale:
+                    del self._queue[i]
+                    self.dropped += 1
+                    METRICS.frames_dropped += 1
+                    break
+            else:
+                if droppable:
+                    self.dropped += 1
+                    METRICS.frames_dropped += 1
+                    return
+        if len(self._queue) >= SEND_QUEUE_HARD_LIMIT:
+            # The client stopped reading; the writer closes the connection
+            self.overflowed = True
+            self._queue.clear()
+            self.close(1013, "send queue overflow")
+        else:
+            self._queue.append((frame, droppable))
+        self._wakeup.set()
+
+    def close(self, code: int, reason: str) -> None:
+        """Have the writer close the connection once the frames already queued are sent."""
+        if not self.closing:
+            self.closing = (code, reason)
+            self._wakeup.set()
+
+    async def run(self, websocket: Any) -> None:
+        """Writer task: send queued frames in order until the connection ends."""
+        try:
+            while True:
+                if not self._queue:
+                    if self.closing:
+                        await websocket.close(*self.closing)
+                        return
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                frame, _ = self._queue.popleft()
+                await websocket.send(frame)
+                METRICS.msgs_out += 1
+                METRICS.bytes_out += len(frame)
+        except ConnectionClosed:
+            pass
+
+
+@dataclass
+class ClientSession:
+    """Server-side state kept for one websocket connection."""
+    websocket: Any
+    player_id: int
+    snapshots: SnapshotHistory = field(default_factory=SnapshotHistory)
+    outbox: Outbox = field(default_factory=Outbox)
+    # Wire format negotiated in the client's "hello"
+    binary: bool = False
+    # Entries of the server-wide map table this client has been told about
+    maps_announced: int = 0
+    # Map names the client announced for its own binary player_update frames
+    inbound_maps: MapTable = field(default_factory=MapTable)
+    # Snapshot rate tier (0 = every tick); raised while the client can't keep up
+    tier: int = 0
+    tier_tick: int = 0
+    # Snapshot rate last announced in an update_rate message (0 = not yet)
+    update_hz: int = 0
+    # Newest (x, y, map, dir, moving, input seq) received since the last tick; older ones are overwritten
+    pending_update: tuple[float, float, str, str, bool, int] | None = None
+    # Inbound flood control: messages beyond `inbound` are dropped, and a client
+    # that keeps it empty long enough to also drain `flood` is disconnected
+    inbound: TokenBucket = field(default_factory=lambda: TokenBucket(INBOUND_RATE, INBOUND_BURST))
+    flood: TokenBucket = field(default_factory=lambda: TokenBucket(INBOUND_RATE, INBOUND_BURST * 4))
+    inbound_dropped: int = 0
+    # Per-sender chat limit
+    chat: TokenBucket = field(default_factory=lambda: TokenBucket(CHAT_RATE, CHAT_BURST))
+    # Distance the player may still move (pixels), and when it was last sent a position_correction
+    move_budget: TokenBucket = field(default_factory=move_budget)
+    last_correction: float = 0.0
+    # When the client last sent anything (time.monotonic), and the value last pushed to the reaper
+    last_heard: float = 0.0
+    heard_pushed: float = 0.0
+    # Secret that lets a reconnecting client take this player back
+    resume_token: str = field(default_factory=lambda: secrets.token_urlsafe(16))
+
+    def send(self, frame: str | bytes, droppable: bool = False) -> None:
+        self.outbox.push(frame, droppable)
+
+    def update_tier(self, tick: int, max_tier: int) -> None:
+        backlog = len(self.outbox)
+        if backlog >= SLOW_CLIENT_BACKLOG and self.tier < max_tier:
+            self.tier += 1
+            self.tier_tick = tick
+        elif backlog == 0 and self.tier > 0 and tick - self.tier_tick >= TIER_RECOVERY_TICKS:
+            self.tier -= 1
+            self.tier_tick = tick
+
+
+def resume_params(path: str) -> tuple[str, int]:
+    """Resume token and last chat id from a connection URL like /?resume=TOKEN&last_chat=42"""
+    query = parse_qs(urlsplit(path).query)
+    token = query.get("resume", [""])[0]
+    try:
+        last_chat = int(query.get("last_chat", ["0"])[0])
+    except ValueError:
+        last_chat = 0
+    return token, max(0, last_chat)
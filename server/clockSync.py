@@ -0,0 +1,87 @@
+"""
+NTP-style clock sync between a client and the server.
+
+The client sends {"type": "time_ping", "t0": <client clock>}; the server (or
+the shard router) answers at once with {"type": "time_pong", "t0", "t1", "t2"}
+where t1 is when the ping was read and t2 when the pong was queued, both on
+SERVER_CLOCK. With t3 the client clock when the pong arrives:
+
+    rtt    = (t3 - t0) - (t2 - t1)
+    offset = ((t1 - t0) + (t2 - t3)) / 2        server time = client time + offset
+
+Snapshots carry the tick time on the same SERVER_CLOCK as their timestamp,
+so a synced client can place every snapshot on its own clock.
+"""
+import time
+from collections import deque
+
+# Monotonic and system-wide on Linux, so shards on one host share it
+SERVER_CLOCK = time.perf_counter
+CLIENT_CLOCK = time.perf_counter
+
+SYNC_SAMPLES = 8            # newest samples kept; the one with the lowest RTT wins
+SYNC_BURST = 4              # pings sent quickly after connecting
+SYNC_BURST_INTERVAL = 0.25
+SYNC_INTERVAL = 2.0         # seconds between pings once synced
+
+
+def time_pong(ping: dict, received: float) -> dict:
+    return {"type": "time_pong", "t0": ping.get("t0"), "t1": received, "t2": SERVER_CLOCK()}
+
+
+class ClockSync:
+    """Client-side estimate of the server clock from ping/pong samples"""
+    _samples: deque[tuple[float, float]]    # (rtt, offset)
+    sent: int
+
+    def __init__(self) -> None:
+        self._samples = deque(maxlen=SYNC_SAMPLES)
+        self.sent = 0
+        self.last_ping = 0.0
+
+    def reset(self) -> None:
+        """Forget the samples, e.g. after connecting to a (possibly different) server"""
+        self._samples.clear()
+        self.sent = 0
+        self.last_ping = 0.0
+
+    def ping(self) -> dict | None:
+        """A time_ping message if one is due now, else None"""
+        now = CLIENT_CLOCK()
+        interval = SYNC_BURST_INTERVAL if self.sent < SYNC_BURST else SYNC_INTERVAL
+        if self.sent and now - self.last_ping < interval:
+            return None
+        self.sent += 1
+        self.last_ping = now
+        return {"type": "time_ping", "t0": now}
+
+    def next_ping_in(self) -> float:
+        """Seconds until ping() returns the next time_ping"""
+        if not self.sent:
+            return 0.0
+        interval = SYNC_BURST_INTERVAL if self.sent < SYNC_BURST else SYNC_INTERVAL
+        return max(0.0, self.last_ping + interval - CLIENT_CLOCK())
+
+    def add(self, pong: dict) -> float:
+        """Take a time_pong; returns this sample's round trip in seconds"""
+        t3 = CLIENT_CLOCK()
+        t0, t1, t2 = float(pong["t0"]), float(pong["t1"]), float(pong["t2"])
+        rtt = (t3 - t0) - (t2 - t1)
+        self._samples.append((rtt, ((t1 - t0) + (t2 - t3)) / 2))
+        return rtt
+
+    @property
+    def synced(self) -> bool:
+        return bool(self._samples)
+
+    @property
+    def offset(self) -> float:
+        """Server clock minus client clock, from the lowest-RTT sample (0 until synced)"""
+        return min(self._samples)[1] if self._samples else 0.0
+
+    @property
+    def rtt(self) -> float:
+        return min(self._samples)[0] if self._samples else 0.0
+
+    def server_now(self) -> float:
+        return CLIENT_CLOCK() + self.offset
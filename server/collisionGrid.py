@@ -0,0 +1,68 @@
+import os
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")  # pytmx imports pygame
+import pytmx
+
+from server.spatialHash import TILE_SIZE
+
+MAPS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "maps")
+# Same layers the client's Map._create_collision_map turns into walls
+COLLISION_LAYER_KEYS = ("collision", "house")
+
+
+class CollisionGrid:
+    """
+    Blocked tiles of one map as a packed bitset, one bit per tile in row-major
+    order. Built from the .tmx data alone: no images or surfaces are loaded.
+    """
+    width: int
+    height: int
+    _bits: bytes
+
+    def __init__(self, width: int, height: int, bits: bytes) -> None:
+        self.width = width
+        self.height = height
+        self._bits = bits
+
+    @classmethod
+    def from_tmx(cls, path: str) -> "CollisionGrid":
+        tmx = pytmx.TiledMap(path)
+        bits = bytearray((tmx.width * tmx.height + 7) // 8)
+        for layer in tmx.visible_layers:
+            name = layer.name.lower()
+            if isinstance(layer, pytmx.TiledTileLayer) and any(k in name for k in COLLISION_LAYER_KEYS):
+                for x, y, gid in layer:
+                    if gid:
+                        i = y * tmx.width + x
+                        bits[i >> 3] |= 1 << (i & 7)
+        return cls(tmx.width, tmx.height, bytes(bits))
+
+    def blocked(self, tx: int, ty: int) -> bool:
+        if 0 <= tx < self.width and 0 <= ty < self.height:
+            i = ty * self.width + tx
+            return (self._bits[i >> 3] >> (i & 7)) & 1 == 1
+        return False  # as on the client, nothing stops a player past the map edge
+
+    def rect_blocked(self, x: float, y: float) -> bool:
+        """Whether a player at pixel (x, y) overlaps a blocked tile; its collider is one tile, like the client's"""
+        x, y = int(x), int(y)
+        tx0, ty0 = x // TILE_SIZE, y // TILE_SIZE
+        tx1, ty1 = (x + TILE_SIZE - 1) // TILE_SIZE, (y + TILE_SIZE - 1) // TILE_SIZE
+        w, bits = self.width, self._bits
+        if tx0 < 0 or ty0 < 0 or tx1 >= w or ty1 >= self.height:
+            return (self.blocked(tx0, ty0) or self.blocked(tx1, ty0)
+                    or self.blocked(tx0, ty1) or self.blocked(tx1, ty1))
+        # in bounds: at most four bit lookups without the per-tile range checks
+        for i in {ty0 * w + tx0, ty0 * w + tx1, ty1 * w + tx0, ty1 * w + tx1}:
+            if bits[i >> 3] >> (i & 7) & 1:
+                return True
+        return False
+
+def map_names(maps_dir: str = MAPS_DIR) -> list[str]:
+    """The .tmx file names: the only map names a client may send"""
+    return sorted(name for name in os.listdir(maps_dir) if name.endswith(".tmx"))
+
+
+def load_collision_grids(maps_dir: str = MAPS_DIR) -> dict[str, CollisionGrid]:
+    """One grid per .tmx file, keyed by file name (the map name clients send)"""
+    return {name: CollisionGrid.from_tmx(os.path.join(maps_dir, name)) for name in map_names(maps_dir)}
@@ -0,0 +1,158 @@
+import json
+import time
+from collections import deque
+from http import HTTPStatus
+from typing import Any, Callable
+from urllib.parse import urlsplit
+
+RATE_WINDOW = 10            # one-second samples the per-second rates are averaged over
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "monster"
+
+COUNTERS = (
+    ("msgs_out", "Websocket messages sent"),
+    ("bytes_out", "Websocket payload bytes sent"),
+    ("msgs_in", "Websocket messages received"),
+    ("bytes_in", "Websocket payload bytes received"),
+    ("frames_dropped", "Stale snapshot frames dropped from send queues"),
+    ("inbound_dropped", "Inbound messages dropped by the rate limiter"),
+    ("chat_messages", "Chat messages accepted"),
+    ("connections", "Websocket connections accepted"),
+    ("tick_errors", "Server ticks that raised an exception"),
+)
+
+
+class Metrics:
+    """
+    Process-wide counters. They are plain integer attributes bumped inline on
+    the hot paths; per-second rates are only worked out from the samples that
+    sample() takes once a second.
+    """
+
+    def __init__(self) -> None:
+        for name, _ in COUNTERS:
+            setattr(self, name, 0)
+        self.started = time.time()
+        self._samples: deque[tuple[float, tuple[int, ...]]] = deque(maxlen=RATE_WINDOW + 1)
+
+    def _values(self) -> tuple[int, ...]:
+        return tuple(getattr(self, name) for name, _ in COUNTERS)
+
+    def sample(self) -> None:
+        self._samples.append((time.monotonic(), self._values()))
+
+    def snapshot(self) -> dict:
+        """Counter totals plus their per-second rates over the last RATE_WINDOW seconds"""
+        out: dict[str, Any] = {"uptime_s": round(time.time() - self.started, 1)}
+        rates = [0.0] * len(COUNTERS)
+        if len(self._samples) > 1:
+            (t0, v0), (t1, v1) = self._samples[0], self._samples[-1]
+            rates = [(b - a) / (t1 - t0) for a, b in zip(v0, v1)]
+        for (name, _), total, rate in zip(COUNTERS, self._values(), rates):
+            out[name] = total
+            out[name + "_per_s"] = round(rate, 2)
+        return out
+
+
+METRICS = Metrics()
+
+
+class PrometheusWriter:
+    """Collects samples per metric family and renders the Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._families: dict[str, tuple[str, str, list[str]]] = {}
+
+    def add(self, name: str, kind: str, help_text: str, value: float,
+            labels: dict[str, Any] | None = None) -> None:
+        name = f"{PREFIX}_{name}"
+        family = self._families.setdefault(name, (kind, help_text, []))
+        label_text = ""
+        if labels:
+            label_text = "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+        family[2].append(f"{name}{label_text} {value}")
+
+    def text(self) -> str:
+        lines = []
+        for name, (kind, help_text, samples) in self._families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def write_status(out: PrometheusWriter, status: dict, labels: dict | None = None) -> None:
+    """Add the figures of one process's status() to `out`; missing sections are skipped."""
+    labels = labels or {}
+    if "clients" in status:
+        out.add("clients", "gauge", "Connected websocket clients", status["clients"], labels)
+    if "players" in status:
+        out.add("players", "gauge", "Players in the world", status["players"], labels)
+    for map_name, count in status.get("players_per_map", {}).items():
+        out.add("players_on_map", "gauge", "Players per map", count, dict(labels, map=map_name))
+    if "evictions" in status:
+        out.add("evictions_total", "counter", "Players evicted for inactivity", status["evictions"], labels)
+
+    tick = status.get("tick")
+    if tick:
+        out.add("tick_rate_hz", "gauge", "Measured server tick rate", tick["actual_hz"], labels)
+        for q, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+            out.add("tick_duration_ms", "gauge", "Tick duration quantiles over the last ~10 s",
+                    tick[f"tick_ms_{key}"], dict(labels, quantile=q))
+        out.add("tick_duration_max_ms", "gauge", "Longest tick over the last ~10 s", tick["tick_ms_max"], labels)
+        out.add("tick_overruns_total", "counter", "Ticks that took longer than one period",
+                tick["overruns"], labels)
+        out.add("ticks_skipped_total", "counter", "Ticks skipped after falling behind",
+                tick["skipped_ticks"], labels)
+        out.add("shed_level", "gauge", "Snapshot load-shedding level", tick["shed_level"], labels)
+
+    queues = status.get("send_queue")
+    if queues:
+        out.add("send_queue_depth_max", "gauge", "Deepest per-client send queue", queues["max"], labels)
+        out.add("send_queue_depth_total", "gauge", "Frames queued over all clients", queues["total"], labels)
+
+    traffic = status.get("traffic")
+    if traffic:
+        for name, help_text in COUNTERS:
+            out.add(f"{name}_total", "counter", help_text, traffic[name], labels)
+
+    checkpoint = status.get("checkpoint")
+    if checkpoint:
+        out.add("checkpoints_total", "counter", "State checkpoints written to SQLite", checkpoint["checkpoints"], labels)
+        out.add("checkpoint_duration_ms", "gauge", "Duration of the last state checkpoint", checkpoint["last_ms"], labels)
+        out.add("checkpoint_duration_max_ms", "gauge", "Longest state checkpoint", checkpoint["max_ms"], labels)
+
+    for shard, shard_status in status.get("shards", {}).items():
+        write_status(out, shard_status, dict(labels, shard=shard))
+
+
+def render_prometheus(status: dict) -> str:
+    out = PrometheusWriter()
+    write_status(out, status)
+    return out.text()
+
+
+def status_endpoint(status: Callable[[], dict]) -> Callable:
+    """
+    process_request hook for websockets' serve(): plain HTTP GET /status (JSON)
+    and /metrics (Prometheus text) on the websocket port; anything else
+    carries on with the websocket handshake.
+    """
+    def process_request(connection: Any, request: Any) -> Any:
+        path = urlsplit(request.path).path
+        if path == "/status":
+            body, content_type = json.dumps(status(), indent=1), "application/json"
+        elif path == "/metrics":
+            body, content_type = render_prometheus(status()), PROMETHEUS_CONTENT_TYPE
+        else:
+            return None
+        response = connection.respond(HTTPStatus.OK, body)
+        del response.headers["Content-Type"]
+        response.headers["Content-Type"] = content_type
+        return response
+
+    return process_request
@@ -0,0 +1,98 @@
+import math
+
+from server.collisionGrid import CollisionGrid
+from server.rateLimit import TokenBucket
+from server.spatialHash import TILE_SIZE
+from server.teleports import TeleportTable
+
+MAX_SPEED = 4.0 * TILE_SIZE         # the client's Player.speed, pixels per second
+SPEED_SLACK = 1.25                  # headroom for frame timing jitter
+MOVE_BURST = 0.5 * MAX_SPEED        # distance a client held up by the network may catch up at once
+PATH_STEP = TILE_SIZE / 2           # sweep step, so a long move cannot hop over a one-tile wall
+CORRECTION_INTERVAL = 0.25          # seconds between position corrections sent to one client
+
+
+def move_budget() -> TokenBucket:
+    """Distance allowance of one player: tokens are pixels"""
+    return TokenBucket(MAX_SPEED * SPEED_SLACK, MOVE_BURST)
+
+
+def _edge(last: float, hit: float) -> float:
+    """Closest point to `hit` on the way from `last` where the player's tile-sized collider touches the wall"""
+    if hit > last:
+        return max(last, float(int(hit) // TILE_SIZE * TILE_SIZE))
+    return min(last, float((int(hit) // TILE_SIZE + 1) * TILE_SIZE))
+
+
+def _sweep_x(grid: CollisionGrid, x0: float, x1: float, y: float) -> float:
+    """Furthest x from x0 towards x1 a player at height y reaches before a wall"""
+    steps = int(abs(x1 - x0) / PATH_STEP) + 1
+    last = x0
+    for i in range(1, steps + 1):
+        x = x0 + (x1 - x0) * i / steps
+        if grid.rect_blocked(x, y):
+            edge = _edge(last, x)
+            return last if grid.rect_blocked(edge, y) else edge
+        last = x
+    return x1
+
+
+def _sweep_y(grid: CollisionGrid, y0: float, y1: float, x: float) -> float:
+    steps = int(abs(y1 - y0) / PATH_STEP) + 1
+    last = y0
+    for i in range(1, steps + 1):
+        y = y0 + (y1 - y0) * i / steps
+        if grid.rect_blocked(x, y):
+            edge = _edge(last, y)
+            return last if grid.rect_blocked(x, edge) else edge
+        last = y
+    return y1
+
+
+class MovementValidator:
+    """
+    Server-side check of client-reported positions. A move is cut short at the
+    player's distance budget (a token bucket refilled at the walking speed),
+    then swept along x and then y against the map's collision grid, which is
+    how the client's Player.update moves as well. The result is the position
+    and map to accept; it differs from the requested one when the move was
+    clamped or refused.
+
+    Maps without a collision grid are refused. Changing maps is a jump, allowed
+    from a teleport tile to any free spot of its destination (after which the
+    budget is full again), or as the first placement of a new player. A player
+    already overlapping a wall, e.g. placed there by a spawn point, may walk
+    out of it.
+    """
+    grids: dict[str, CollisionGrid]
+    teleports: TeleportTable
+
+    def __init__(self, grids: dict[str, CollisionGrid], teleports: TeleportTable) -> None:
+        self.grids = grids
+        self.teleports = teleports
+
+    def check(self, budget: TokenBucket, x0: float, y0: float, map0: str,
+              x: float, y: float, map_name: str) -> tuple[float, float, str]:
+        grid = self.grids.get(map_name)
+        if grid is None:
+            return x0, y0, map0
+        if map_name != map0:
+            if map0 and (not self.teleports.leads_to(map0, x0, y0, map_name) or grid.rect_blocked(x, y)):
+                return x0, y0, map0
+            budget.tokens = budget.burst
+            return x, y, map_name
+        dx, dy = x - x0, y - y0
+        if not dx and not dy:
+            return x, y, map_name
+        dist = math.hypot(dx, dy)
+        allowed = budget.take_up_to(dist)
+        if allowed < dist:
+            scale = allowed / dist
+            x, y = x0 + dx * scale, y0 + dy * scale
+        if grid.rect_blocked(x0, y0):
+            return x, y, map_name
+        if dx:
+            x = _sweep_x(grid, x0, x, y0)
+        if dy:
+            y = _sweep_y(grid, y0, y, x)
+        return x, y, map_name
@@ -3,8 +3,11 @@ import time
 from dataclasses import dataclass
 from typing import Dict
 
+from server.spatialHash import SpatialHash
+from server.timingWheel import TimingWheel
+
 TIMEOUT_TIME = 60.0
-CHECK_INTERVAL_TIME = 10.0
+REAP_RESOLUTION = 1.0   # seconds per timing wheel slot
 
 @dataclass
 class Player:
@@ -17,21 +20,37 @@ class Player:
     # NEW: direction + moving state (for animation)
     dir: str = "down"        # "up"|"down"|"left"|"right"
     moving: bool = False
+    # Bumped by PlayerHandler whenever the state changes (dirty tracking for snapshots)
+    version: int = 0
+
+    def update(self, x: float, y: float, map: str, dir: str = "down", moving: bool = False) -> bool:
+        # sanitize dir
+        if dir not in ("up", "down", "left", "right"):
+            dir = "down"
+        moving = bool(moving)
 
-    def update(self, x: float, y: float, map: str, dir: str = "down", moving: bool = False) -> None:
         # Update last_update if anything changes
-        if x != self.x or y != self.y or map != self.map or dir != self.dir or moving != self.moving:
+        changed = x != self.x or y != self.y or map != self.map or dir != self.dir or moving != self.moving
+        if changed:
             self.last_update = time.monotonic()
 
         self.x = x
         self.y = y
         self.map = map
-
-        # sanitize dir
-        if dir not in ("up", "down", "left", "right"):
-            dir = "down"
         self.dir = dir
-        self.moving = bool(moving)
+        self.moving = moving
+        return changed
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "x": self.x,
+            "y": self.y,
+            "map": self.map,
+            # NEW
+            "dir": self.dir,
+            "moving": self.moving,
+        }
 
     def is_inactive(self) -> bool:
         now = time.monotonic()
@@ -40,58 +59,71 @@ class Player:
 
 class PlayerHandler:
     _lock: threading.Lock
-    _stop_event: threading.Event
-    _thread: threading.Thread | None
 
     players: Dict[int, Player]
     _next_id: int
+    _version: int
+    # Per-map spatial index and the (version, wire state) of each player, kept up to date on change
+    _grids: Dict[str, SpatialHash]
+    _states: Dict[int, tuple[int, dict]]
+    # Inactivity deadlines (last message from the client + TIMEOUT_TIME), reaped from the server loop
+    _wheel: TimingWheel
+    evictions: int
 
     def __init__(self):
         self._lock = threading.Lock()
-        self._stop_event = threading.Event()
-        self._thread = None
 
         self.players = {}
         self._next_id = 0
-
-    # Threading
-    def start(self) -> None:
-        if self._thread and self._thread.is_alive():
-            return
-        self._stop_event.clear()
-        self._thread = threading.Thread(target=self._cleaner, name="PlayerCleaner", daemon=True)
-        self._thread.start()
-
-    def stop(self) -> None:
-        self._stop_event.set()
-        if self._thread:
-            self._thread.join(timeout=2.0)
-
-    def _cleaner(self) -> None:
-        while not self._stop_event.wait(CHECK_INTERVAL_TIME):
-            now = time.monotonic()
-            to_remove: list[int] = []
-            with self._lock:
-                for pid, p in list(self.players.items()):
-                    if now - p.last_update >= TIMEOUT_TIME:
-                        to_remove.append(pid)
-                for pid in to_remove:
-                    _ = self.players.pop(pid, None)
+        self._version = 0
+        self._grids = {}
+        self._states = {}
+        self._wheel = TimingWheel(REAP_RESOLUTION, int(TIMEOUT_TIME / REAP_RESOLUTION) + 4)
+        self.evictions = 0
+
+    # Index maintenance (caller holds the lock)
+    def _changed(self, p: Player, old_map: str | None) -> None:
+        self._version += 1
+        p.version = self._version
+        self._states[p.id] = (p.version, p.to_dict())
+        self._wheel.touch(p.id, p.last_update + TIMEOUT_TIME)
+        if old_map != p.map and old_map is not None:
+            grid = self._grids[old_map]
+            grid.remove(p.id)
+            if not grid:
+                del self._grids[old_map]
+        grid = self._grids.get(p.map)
+        if grid is None:
+            grid = self._grids[p.map] = SpatialHash()
+        grid.move(p.id, p.x, p.y)
+
+    def _remove(self, pid: int) -> Player | None:
+        p = self.players.pop(pid, None)
+        if p is None:
+            return None
+        self._states.pop(pid, None)
+        self._wheel.remove(pid)
+        grid = self._grids.get(p.map)
+        if grid is not None:
+            grid.remove(pid)
+            if not grid:
+                del self._grids[p.map]
+        return p
 
     # API
-    def register(self) -> int:
+    def register(self, pid: int | None = None) -> int:
+        """Add a player, with a fresh id unless one is given (ids handed out by the shard router)."""
         with self._lock:
-            pid = self._next_id
-            self._next_id += 1
-            self.players[pid] = Player(pid, 0.0, 0.0, "", time.monotonic(), dir="down", moving=False)
+            if pid is None:
+                pid = self._next_id
+                self._next_id += 1
+            p = self.players[pid] = Player(pid, 0.0, 0.0, "", time.monotonic(), dir="down", moving=False)
+            self._changed(p, None)
             return pid
 
     def unregister(self, pid: int) -> bool:
         with self._lock:
-            if pid in self.players:
-                del self.players[pid]
-                return True
-            return False
+            return self._remove(pid) is not None
 
     # NEW signature includes dir + moving
     def update(self, pid: int, x: float, y: float, map_name: str, dir: str = "down", moving: bool = False) -> bool:
@@ -99,20 +131,79 @@ class PlayerHandler:
             p = self.players.get(pid)
             if not p:
                 return False
-            p.update(float(x), float(y), str(map_name), str(dir), bool(moving))
+            old_map = p.map
+            if p.update(float(x), float(y), str(map_name), str(dir), bool(moving)):
+                self._changed(p, old_map)
             return True
 
+    def reap_inactive(self) -> list[int]:
+        """Remove players not heard from for TIMEOUT_TIME; returns their ids."""
+        now = time.monotonic()
+        with self._lock:
+            reaped = [pid for pid in self._wheel.advance(now) if self._remove(pid) is not None]
+            self.evictions += len(reaped)
+            return reaped
+
+    def update_many(self, updates: list[tuple[int, float, float, str, str, bool]],
+                    heard: list[tuple[int, float]] = ()) -> None:
+        """
+        Apply a batch of (pid, x, y, map, dir, moving) under a single lock acquisition.
+        `heard` holds (pid, time.monotonic() of the client's last message): its inactivity
+        deadline moves past that, whether or not the player's state changed.
+        """
+        with self._lock:
+            for pid, last_heard in heard:
+                if pid in self.players:
+                    self._wheel.touch(pid, max(last_heard, self.players[pid].last_update) + TIMEOUT_TIME)
+            for pid, x, y, map_name, dir, moving in updates:
+                p = self.players.get(pid)
+                if not p:
+                    continue
+                old_map = p.map
+                if p.update(x, y, map_name, dir, moving):
+                    self._changed(p, old_map)
+
     def list_players(self) -> dict:
         with self._lock:
             player_list = {}
             for p in self.players.values():
-                player_list[p.id] = {
-                    "id": p.id,
-                    "x": p.x,
-                    "y": p.y,
-                    "map": p.map,
-                    # NEW
-                    "dir": p.dir,
-                    "moving": p.moving,
-                }
+                player_list[p.id] = p.to_dict()
             return player_list
+
+    def map_of(self, pid: int) -> str:
+        p = self.players.get(pid)
+        return p.map if p is not None else ""
+
+    def count_by_map(self) -> dict[str, int]:
+        with self._lock:
+            return {map_name: len(grid) for map_name, grid in self._grids.items()}
+
+    def players_in_rect(self, map_name: str, x0: float, y0: float, x1: float, y1: float) -> list[int]:
+        with self._lock:
+            grid = self._grids.get(map_name)
+            return grid.query_rect(x0, y0, x1, y1) if grid else []
+
+    def players_in_radius(self, map_name: str, x: float, y: float, radius: float) -> list[int]:
+        with self._lock:
+            grid = self._grids.get(map_name)
+            return grid.query_radius(x, y, radius) if grid else []
+
+    def states(self) -> dict[int, tuple[int, dict]]:
+        """(version, state) of every player"""
+        with self._lock:
+            return dict(self._states)
+
+    def snapshot_visible(self, viewers: list[int], half_w: float, half_h: float
+                         ) -> tuple[dict[int, tuple[int, dict]], dict[int, list[int]]]:
+        """
+        (version, state) of every player, plus for each viewer the ids of the
+        players on its map within half_w/half_h pixels of it.
+        """
+        with self._lock:
+            visible: dict[int, list[int]] = {}
+            for pid in viewers:
+                p = self.players.get(pid)
+                if p is None:
+                    continue
+                visible[pid] = self._grids[p.map].query_rect(p.x - half_w, p.y - half_h, p.x + half_w, p.y + half_h)
+            return dict(self._states), visible
@@ -0,0 +1,167 @@
+"""
+Compact binary encoding for the two hot messages, player_update and players_delta.
+
+JSON text frames stay the default. A client opts in by listing BINARY_FORMAT in
+its "hello"; once the server answers with {"type": "encoding", "format": ...}
+both sides send these messages as binary frames. Map names never go on the wire
+in binary form: each side announces new names with a JSON "map_table" message
+and then refers to them by index.
+"""
+import struct
+
+BINARY_FORMAT = "bin1"
+
+MSG_PLAYER_UPDATE = 1
+MSG_PLAYERS_DELTA = 2
+
+DIRS = ("down", "left", "right", "up")
+_DIR_INDEX = {d: i for i, d in enumerate(DIRS)}
+_MOVING_BIT = 0x4
+
+# type, x, y, map index, flags
+_PLAYER_UPDATE = struct.Struct("<BffHB")
+# the same followed by the client's input seq (for reconciliation); both are accepted
+_PLAYER_UPDATE_SEQ = struct.Struct("<BffHBI")
+# type, seq, base, keyframe, timestamp, n_changed, n_removed
+_DELTA_HEADER = struct.Struct("<BIIBdHH")
+# id, x, y, map index, flags
+_RECORD = struct.Struct("<IffHB")
+
+MAX_MAPS = 0xFFFF
+
+
+class MapTable:
+    """Map name <-> index table for one direction of a session."""
+    names: list[str]
+    _index: dict[str, int]
+
+    def __init__(self) -> None:
+        self.names = []
+        self._index = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def index(self, name: str) -> int:
+        idx = self._index.get(name)
+        if idx is None:
+            if len(self.names) >= MAX_MAPS:
+                raise ValueError("map table full")
+            idx = self._index[name] = len(self.names)
+            self.names.append(name)
+        return idx
+
+    def name(self, idx: int) -> str:
+        if idx >= len(self.names):
+            raise ValueError(f"unknown map index {idx}")
+        return self.names[idx]
+
+    def announce(self, start: int = 0) -> dict:
+        """JSON message carrying every entry from `start` on."""
+        return {
+            "type": "map_table",
+            "maps": {str(i): self.names[i] for i in range(start, len(self.names))},
+        }
+
+    def apply(self, maps: dict) -> None:
+        """Store entries from a peer's map_table message."""
+        for idx_str, name in maps.items():
+            idx = int(idx_str)
+            if idx >= MAX_MAPS:
+                raise ValueError(f"map index out of range {idx}")
+            while len(self.names) <= idx:
+                self.names.append("")
+            old = self.names[idx]
+            if old and self._index.get(old) == idx:
+                del self._index[old]
+            self.names[idx] = str(name)
+            self._index[str(name)] = idx
+
+
+def _flags(direction: str, moving: bool) -> int:
+    return _DIR_INDEX.get(direction, 0) | (_MOVING_BIT if moving else 0)
+
+
+def encode_player_update(x: float, y: float, map_idx: int, direction: str, moving: bool,
+                         seq: int | None = None) -> bytes:
+    if seq is None:
+        return _PLAYER_UPDATE.pack(MSG_PLAYER_UPDATE, x, y, map_idx, _flags(direction, moving))
+    return _PLAYER_UPDATE_SEQ.pack(MSG_PLAYER_UPDATE, x, y, map_idx, _flags(direction, moving), seq)
+
+
+def decode_player_update(buf: bytes, maps: MapTable) -> dict:
+    try:
+        if len(buf) == _PLAYER_UPDATE_SEQ.size:
+            msg_type, x, y, map_idx, flags, seq = _PLAYER_UPDATE_SEQ.unpack(buf)
+        else:
+            msg_type, x, y, map_idx, flags = _PLAYER_UPDATE.unpack(buf)
+            seq = None
+    except struct.error as e:
+        raise ValueError(f"bad player_update frame: {e}") from None
+    if msg_type != MSG_PLAYER_UPDATE:
+        raise ValueError(f"unexpected binary message type {msg_type}")
+    data = {
+        "type": "player_update",
+        "x": x,
+        "y": y,
+        "map": maps.name(map_idx),
+        "dir": DIRS[flags & 0x3],
+        "moving": bool(flags & _MOVING_BIT),
+    }
+    if seq is not None:
+        data["seq"] = seq
+    return data
+
+
+def encode_record(state: dict, maps: MapTable) -> bytes:
+    return _RECORD.pack(
+        state["id"], state["x"], state["y"],
+        maps.index(state["map"]), _flags(state["dir"], state["moving"])
+    )
+
+
+def encode_players_delta(seq: int, base: int, keyframe: bool, timestamp: float,
+                         records: list[bytes], removed: list[int]) -> bytes:
+    return b"".join((
+        _DELTA_HEADER.pack(MSG_PLAYERS_DELTA, seq, base, keyframe, timestamp, len(records), len(removed)),
+        *records,
+        struct.pack(f"<{len(removed)}I", *removed),
+    ))
+
+
+def decode_players_delta(buf: bytes, maps: MapTable) -> dict:
+    """Decode into the same shape as the JSON players_delta message."""
+    try:
+        msg_type, seq, base, keyframe, timestamp, n_changed, n_removed = _DELTA_HEADER.unpack_from(buf)
+        if msg_type != MSG_PLAYERS_DELTA:
+            raise ValueError(f"unexpected binary message type {msg_type}")
+        off = _DELTA_HEADER.size
+        end = off + n_changed * _RECORD.size
+        players = {}
+        for pid, x, y, map_idx, flags in _RECORD.iter_unpack(buf[off:end]):
+            players[pid] = {
+                "id": pid,
+                "x": x,
+                "y": y,
+                "map": maps.name(map_idx),
+                "dir": DIRS[flags & 0x3],
+                "moving": bool(flags & _MOVING_BIT),
+            }
+        removed = list(struct.unpack_from(f"<{n_removed}I", buf, end))
+    except struct.error as e:
+        raise ValueError(f"bad players_delta frame: {e}") from None
+    return {
+        "type": "players_delta",
+        "seq": seq,
+        "base": base,
+        "keyframe": bool(keyframe),
+        "players": players,
+        "removed": removed,
+        "timestamp": timestamp,
+    }
+
+
+def binary_type(buf: bytes) -> int:
+    if not buf:
+        raise ValueError("empty binary frame")
+    return buf[0]
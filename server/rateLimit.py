@@ -0,0 +1,34 @@
+import time
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `burst`."""
+    rate: float
+    burst: float
+    tokens: float
+    _last: float
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._last = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def take(self, n: float = 1.0) -> bool:
+        self._refill()
+        if self.tokens >= n:
+            self.tokens -= n
+            return True
+        return False
+
+    def take_up_to(self, n: float) -> float:
+        """Take as much of `n` as is available; returns the amount taken."""
+        self._refill()
+        taken = min(n, self.tokens)
+        self.tokens -= taken
+        return taken
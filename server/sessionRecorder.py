@@ -0,0 +1,146 @@
+"""
+Session recording: the server's player table on every tick plus every chat
+message, in a compact binary log that tools/replay.py plays back.
+
+The file starts with MAGIC, followed by records of <u32 length><payload>.
+The first payload byte is the record kind:
+
+  MSG_PLAYERS_DELTA  one tick, in the bin1 players_delta layout (server.protocol):
+                     seq is the tick number, timestamp the server's monotonic
+                     clock, base the previously recorded tick. Keyframes carry
+                     every player and have base 0.
+  REC_MAP_TABLE      JSON map_table message for map indexes used from here on
+  REC_CHAT           JSON chat message, as stored by ChatStore
+
+Ticks in which nothing changed are not written.
+"""
+import json
+import struct
+import threading
+from typing import IO, Iterator
+
+from server.protocol import (
+    MSG_PLAYERS_DELTA, MapTable, decode_players_delta, encode_players_delta, encode_record
+)
+
+MAGIC = b"MGREC1\n"
+REC_MAP_TABLE = 0x10
+REC_CHAT = 0x11
+RECORD_KEYFRAME_INTERVAL = 600  # ticks between full player tables (~10 s at 60 Hz)
+RECORD_FLUSH_INTERVAL = 1.0     # seconds between batched writes
+
+_LENGTH = struct.Struct("<I")
+
+
+class SessionRecorder:
+    """
+    Encodes on the caller's thread (cheap: only players whose version changed)
+    and buffers the records; flush() does the file I/O and is meant to run
+    off the event loop.
+    """
+    _file: IO[bytes]
+
+    def __init__(self, path: str) -> None:
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._lock = threading.Lock()
+        self._pending: list[bytes] = []
+        self._maps = MapTable()
+        self._versions: dict[int, int] = {}
+        self._last_seq = 0
+        self._keyframe_seq = -RECORD_KEYFRAME_INTERVAL
+        self.bytes_written = 0
+
+    def _append(self, payload: bytes) -> None:
+        with self._lock:
+            self._pending.append(_LENGTH.pack(len(payload)))
+            self._pending.append(payload)
+
+    def record_tick(self, seq: int, timestamp: float, states: dict[int, tuple[int, dict]]) -> None:
+        """`states` is pid -> (version, state), as PlayerHandler.states() returns it"""
+        keyframe = seq - self._keyframe_seq >= RECORD_KEYFRAME_INTERVAL
+        if keyframe:
+            changed = list(states)
+            removed = []
+            self._keyframe_seq = seq
+        else:
+            changed = [pid for pid, (ver, _) in states.items() if self._versions.get(pid) != ver]
+            removed = [pid for pid in self._versions if pid not in states]
+            if not changed and not removed:
+                return
+        known_maps = len(self._maps)
+        records = [encode_record(states[pid][1], self._maps) for pid in changed]
+        if len(self._maps) > known_maps:
+            self._append(bytes([REC_MAP_TABLE]) + json.dumps(self._maps.announce(known_maps)).encode())
+        self._append(encode_players_delta(seq, 0 if keyframe else self._last_seq, keyframe,
+                                          timestamp, records, removed))
+        if keyframe:
+            self._versions = {pid: ver for pid, (ver, _) in states.items()}
+        else:
+            for pid in changed:
+                self._versions[pid] = states[pid][0]
+            for pid in removed:
+                del self._versions[pid]
+        self._last_seq = seq
+
+    def record_chat(self, msg: dict) -> None:
+        self._append(bytes([REC_CHAT]) + json.dumps(msg).encode())
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if pending:
+            data = b"".join(pending)
+            self._file.write(data)
+            self._file.flush()
+            self.bytes_written += len(data)
+
+    def close(self) -> None:
+        self.flush()
+        self._file.close()
+
+
+def read_records(path: str) -> Iterator[bytes]:
+    """Payloads in file order; a record cut short by a crash ends the stream"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a session recording")
+        while True:
+            head = f.read(_LENGTH.size)
+            if len(head) < _LENGTH.size:
+                return
+            (length,) = _LENGTH.unpack(head)
+            payload = f.read(length)
+            if len(payload) < length or not payload:
+                return
+            yield payload
+
+
+def replay_events(path: str) -> Iterator[tuple[str, dict]]:
+    """
+    ("tick", players_delta dict plus the full table under "table") and
+    ("chat", message) events. Deltas before the first keyframe are skipped,
+    since the players they build on are unknown.
+    """
+    maps = MapTable()
+    table: dict[int, dict] | None = None
+    for payload in read_records(path):
+        kind = payload[0]
+        if kind == MSG_PLAYERS_DELTA:
+            delta = decode_players_delta(payload, maps)
+            if delta["keyframe"]:
+                table = {}
+            elif table is None:
+                continue
+            for pid in delta["removed"]:
+                table.pop(pid, None)
+            table.update(delta["players"])
+            delta["table"] = table
+            yield "tick", delta
+        elif kind == REC_MAP_TABLE:
+            maps.apply(json.loads(payload[1:])["maps"])
+        elif kind == REC_CHAT:
+            yield "chat", json.loads(payload[1:])
+        else:
+            raise ValueError(f"unknown record kind {kind}")
@@ -0,0 +1,413 @@
+import asyncio
+import json
+import os
+import secrets
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+import websockets
+from websockets.exceptions import ConnectionClosed
+
+from server.chatStore import ChatStore
+from server.chatChannels import (
+    ChatBatch, CHAT_BATCH_WINDOW, CHAT_RATE, CHAT_BURST, resolve_channel, subscriptions
+)
+from server.metrics import METRICS
+from server.clockSync import SERVER_CLOCK, time_pong
+from server.collisionGrid import map_names
+from server.clientSession import (
+    Outbox, INBOUND_RATE, INBOUND_BURST, RESUME_GRACE, RESUMABLE_CLOSE_CODES, resume_params
+)
+from server.protocol import (
+    BINARY_FORMAT, MSG_PLAYER_UPDATE, MapTable, binary_type, decode_player_update
+)
+from server.movement import MovementValidator, CORRECTION_INTERVAL, move_budget
+from server.rateLimit import TokenBucket
+
+SHARD_MAPS = ("map.tmx", "gym.tmx", "northpole.tmx")
+SHARD_HOST = "127.0.0.1"
+SECRET_ENV = "MONSTER_SHARD_SECRET"     # how workers learn the shared secret
+CONNECT_RETRIES = 50                    # shard connect attempts, 0.1 s apart
+STATS_INTERVAL = 1.0                    # seconds between shard stats polls
+HANDOFF_TIMEOUT = 1.0                   # seconds to wait for the old shard's state of a player leaving it
+PLAYER_STATE_PREFIX = '{"type": "player_state"'
+
+
+@dataclass
+class RouterSession:
+    """Router-side state for one client connection."""
+    websocket: Any
+    player_id: int
+    outbox: Outbox = field(default_factory=Outbox)
+    binary: bool = False
+    # Map names the client announced for its binary player_update frames
+    inbound_maps: MapTable = field(default_factory=MapTable)
+    # Map from the player's latest update (chat channel), the shard that owns
+    # it, and the proxied connection to that shard
+    map_name: str = ""
+    shard: str | None = None
+    upstream: Any = None
+    pump: asyncio.Task | None = None
+    # The shard's answer to a player_state request, while a map change waits for it
+    state_reply: asyncio.Future | None = None
+    last_correction: float = 0.0
+    inbound: TokenBucket = field(default_factory=lambda: TokenBucket(INBOUND_RATE, INBOUND_BURST))
+    flood: TokenBucket = field(default_factory=lambda: TokenBucket(INBOUND_RATE, INBOUND_BURST * 4))
+    chat: TokenBucket = field(default_factory=lambda: TokenBucket(CHAT_RATE, CHAT_BURST))
+    resume_token: str = field(default_factory=lambda: secrets.token_urlsafe(16))
+
+    def send(self, frame: str | bytes) -> None:
+        self.outbox.push(frame)
+
+
+class ShardRouter:
+    """
+    Front end for the sharded server. Each map is simulated by its own worker
+    process listening on 127.0.0.1; the router accepts the clients, hands out
+    player ids, owns chat, and proxies every other message to the shard of the
+    map the player is on. When a player_update names a map owned by another
+    shard, the player is detached from the old shard and attached to the new one.
+    Such a map change is checked here, since the new shard only sees the
+    player arrive: the old shard says where it has the player, and the move
+    from there goes through the same MovementValidator the shards use.
+
+    Resume tokens keep a reconnecting client's id and chat position. The
+    player leaves its shard as soon as the connection drops, and the shard
+    sends a keyframe when it comes back.
+
+    Snapshots are forwarded without being decoded, and the router awaits each
+    send to the client, so a slow client backs up into its shard's outbox.
+    """
+
+    def __init__(self, chat: ChatStore, base_port: int, worker_cmd: list[str],
+                 maps: tuple[str, ...] = SHARD_MAPS, moves: MovementValidator | None = None) -> None:
+        self.chat = chat
+        # None trusts map changes, as shards started with --trust-movement do
+        self.moves = moves
+        self.ports = {name: base_port + i for i, name in enumerate(maps)}
+        self.known_maps = frozenset(map_names())
+        self.worker_cmd = worker_cmd
+        self.secret = secrets.token_hex(16)
+        self.clients: dict[int, RouterSession] = {}
+        # Resume token -> player id; dropped players (id -> (token, deadline)) in their grace window
+        self.tokens: dict[str, int] = {}
+        self.detached: dict[int, tuple[str, float]] = {}
+        self.shard_stats: dict[str, dict] = {}
+        self.chat_batch = ChatBatch()
+        self._next_id = 1
+        self._procs: list[asyncio.subprocess.Process] = []
+
+    # Worker processes
+    async def start_shards(self) -> None:
+        env = dict(os.environ, **{SECRET_ENV: self.secret})
+        for name, port in self.ports.items():
+            proc = await asyncio.create_subprocess_exec(
+                *self.worker_cmd, "--shard", name, "--port", str(port), "--chat-log", "",
+                env=env, stdin=asyncio.subprocess.PIPE  # workers exit when this pipe closes
+            )
+            self._procs.append(proc)
+            print(f"[Router] shard {name} on {SHARD_HOST}:{port} (pid {proc.pid})")
+            asyncio.create_task(self._stats_loop(name))
+
+    async def stop_shards(self) -> None:
+        for proc in self._procs:
+            if proc.returncode is None:
+                proc.terminate()
+        for proc in self._procs:
+            await proc.wait()
+
+    def shard_for(self, map_name: str) -> str:
+        # Maps without a shard of their own share the first one
+        return map_name if map_name in self.ports else next(iter(self.ports))
+
+    async def _connect(self, shard: str, attach: dict) -> Any:
+        uri = f"ws://{SHARD_HOST}:{self.ports[shard]}"
+        for _ in range(CONNECT_RETRIES):
+            try:
+                upstream = await websockets.connect(uri, max_size=None, ping_interval=None)
+                break
+            except OSError:
+                await asyncio.sleep(0.1)  # shard still starting
+        else:
+            raise ConnectionError(f"shard {shard} unavailable")
+        await upstream.send(json.dumps(dict(attach, type="attach", secret=self.secret)))
+        return upstream
+
+    async def _stats_loop(self, shard: str) -> None:
+        """Keep the latest server_stats of a shard over a control connection"""
+        while True:
+            try:
+                upstream = await self._connect(shard, {"control": True})
+                async with upstream:
+                    while True:
+                        await upstream.send(json.dumps({"type": "server_stats"}))
+                        self.shard_stats[shard] = json.loads(await upstream.recv())
+                        await asyncio.sleep(STATS_INTERVAL)
+            except (ConnectionError, ConnectionClosed, ValueError):
+                self.shard_stats.pop(shard, None)
+                await asyncio.sleep(STATS_INTERVAL)
+
+    def status(self) -> dict:
+        """Router figures for /status and /metrics, with each shard's own status under "shards" """
+        depths = [len(session.outbox) for session in self.clients.values()]
+        return {
+            "clients": len(self.clients),
+            "detached": len(self.detached),
+            "send_queue": {"max": max(depths, default=0), "total": sum(depths)},
+            "traffic": METRICS.snapshot(),
+            "shards": {name: {k: v for k, v in s.items() if k != "type"}
+                       for name, s in self.shard_stats.items()},
+        }
+
+    def stats(self) -> dict:
+        """Cluster-wide server_stats: worst tick figures over all shards"""
+        ticks = [s["tick"] for s in self.shard_stats.values()]
+        tick: dict = {}
+        for t in ticks:
+            for key, value in t.items():
+                if key not in tick:
+                    tick[key] = value
+                elif key in ("actual_hz", "snapshot_hz"):
+                    tick[key] = min(tick[key], value)
+                else:
+                    tick[key] = max(tick[key], value)
+        return {
+            "type": "server_stats",
+            "clients": len(self.clients),
+            "players": sum(s.get("players", 0) for s in self.shard_stats.values()),
+            "tick": tick,
+            "shards": self.shard_stats,
+        }
+
+    # Clients
+    def _resume(self, websocket: Any, token: str) -> RouterSession | None:
+        now = time.monotonic()
+        for pid in [pid for pid, (_, deadline) in self.detached.items() if deadline <= now]:
+            self.tokens.pop(self.detached.pop(pid)[0], None)
+        pid = self.tokens.get(token) if token else None
+        if pid is None:
+            return None
+        old = self.clients.get(pid)
+        if old is not None:
+            old.outbox.close(4001, "resumed on another connection")
+        self.detached.pop(pid, None)
+        return RouterSession(websocket, pid, resume_token=token)
+
+    async def chat_flush_loop(self) -> None:
+        """Fan out the chat of the last window, one chat_update per recipient"""
+        while True:
+            await asyncio.sleep(CHAT_BATCH_WINDOW)
+            self.chat_batch.flush(
+                (session, pid, session.map_name) for pid, session in self.clients.items()
+            )
+
+    async def _check_map_change(self, session: RouterSession, map_name: str, x: float, y: float) -> bool:
+        """
+        Whether the player may go to (x, y) on `map_name`, another shard's map.
+        Checked from where the old shard has the player, not where the client
+        claims to be; a refused change gets a position_correction.
+        """
+        if self.moves is None or session.upstream is None:
+            return True  # trusted, or a new player's first placement
+        reply = session.state_reply = asyncio.get_running_loop().create_future()
+        try:
+            await session.upstream.send(json.dumps({"type": "player_state"}))
+            state = await asyncio.wait_for(reply, HANDOFF_TIMEOUT)
+        except (ConnectionClosed, asyncio.TimeoutError):
+            return False
+        finally:
+            session.state_reply = None
+        x0, y0, map0 = float(state["x"]), float(state["y"]), str(state["map"])
+        if self.moves.check(move_budget(), x0, y0, map0, x, y, map_name) == (x, y, map_name):
+            return True
+        now = time.monotonic()
+        if now - session.last_correction >= CORRECTION_INTERVAL:
+            session.last_correction = now
+            session.send(json.dumps({"type": "position_correction", "x": x0, "y": y0, "map": map0, "seq": 0}))
+        return False
+
+    async def _attach(self, session: RouterSession, shard: str, place: dict | None = None) -> None:
+        """
+        Move the player onto `shard`, closing its connection to the old one.
+        `place` ({"x", "y", "map"}) is where a checked map change puts it there.
+        """
+        if session.pump is not None:
+            session.pump.cancel()
+        if session.upstream is not None:
+            # The old shard unregisters the player, and its clients see it leave
+            asyncio.create_task(session.upstream.close())
+        session.shard, session.upstream, session.pump = shard, None, None
+        upstream = await self._connect(shard, {
+            "id": session.player_id,
+            "binary": session.binary,
+            "maps": session.inbound_maps.announce()["maps"],
+            **({"place": place} if place is not None else {}),
+        })
+        session.upstream = upstream
+        session.pump = asyncio.create_task(self._pump(session, upstream))
+
+    async def _pump(self, session: RouterSession, upstream: Any) -> None:
+        """Forward frames from the shard to the client until either side closes"""
+        try:
+            # Snapshot sequence numbers and map tables restart on the new shard
+            await session.websocket.send(json.dumps({"type": "handoff", "map": session.shard}))
+            async for frame in upstream:
+                if isinstance(frame, str) and frame.startswith(PLAYER_STATE_PREFIX):
+                    # For the router only: the answer a map change is waiting for
+                    if session.state_reply is not None and not session.state_reply.done():
+                        session.state_reply.set_result(json.loads(frame))
+                    continue
+                await session.websocket.send(frame)
+                METRICS.msgs_out += 1
+                METRICS.bytes_out += len(frame)
+        except ConnectionClosed:
+            pass
+        if session.upstream is upstream:
+            # Closed by the shard (timeout, flooding, ...): pass the close on to the client
+            code = upstream.close_code
+            if code in (None, 1005, 1006):
+                code = 1011
+            session.outbox.close(code, upstream.close_reason or "shard closed")
+
+    async def handle_client(self, websocket: Any) -> None:
+        token, last_chat = resume_params(websocket.request.path)
+        session = self._resume(websocket, token)
+        resumed = session is not None
+        if resumed:
+            player_id = session.player_id
+            print("[Router] resumed", player_id)
+        else:
+            player_id = self._next_id
+            self._next_id += 1
+            print("[Router] registered", player_id)
+            session = RouterSession(websocket, player_id)
+            self.tokens[session.resume_token] = player_id
+        self.clients[player_id] = session
+        METRICS.connections += 1
+        writer = None
+
+        try:
+            # Sent before anything the shard says, so snapshots never precede it
+            await websocket.send(json.dumps({
+                "type": "registered",
+                "id": player_id,
+                "token": session.resume_token,
+                "resumed": resumed
+            }))
+            await websocket.send(json.dumps({
+                "type": "chat_update",
+                "messages": self.chat.list_since(last_chat, subscriptions(player_id, session.map_name))
+            }))
+            writer = asyncio.create_task(session.outbox.run(websocket))
+
+            async for message in websocket:
+                received = SERVER_CLOCK()
+                METRICS.msgs_in += 1
+                METRICS.bytes_in += len(message)
+                if not session.inbound.take():
+                    METRICS.inbound_dropped += 1
+                    if not session.flood.take():
+                        print(f"[Router] player {player_id} flooding, disconnecting")
+                        await websocket.close(code=1008, reason="rate limit exceeded")
+                        break
+                    continue
+                try:
+                    if isinstance(message, bytes):
+                        if binary_type(message) != MSG_PLAYER_UPDATE:
+                            raise ValueError("unsupported binary message")
+                        data = decode_player_update(message, session.inbound_maps)
+                    else:
+                        data = json.loads(message)
+                    msg_type = data.get("type")
+
+                    if msg_type == "player_update":
+                        map_name = str(data.get("map", ""))
+                        if map_name not in self.known_maps:
+                            raise ValueError("unknown_map")
+                        shard = self.shard_for(map_name)
+                        if shard != session.shard:
+                            x, y = float(data.get("x", 0.0)), float(data.get("y", 0.0))
+                            if not await self._check_map_change(session, map_name, x, y):
+                                continue  # stays on its shard, where it was
+                            place = {"x": x, "y": y, "map": map_name} if session.shard is not None else None
+                            await self._attach(session, shard, place)
+                        session.map_name = map_name
+
+                    elif msg_type == "hello":
+                        if BINARY_FORMAT in data.get("encodings", []):
+                            session.binary = True
+                        if session.upstream is None:
+                            session.send(json.dumps({
+                                "type": "encoding",
+                                "format": BINARY_FORMAT if session.binary else "json"
+                            }))
+
+                    elif msg_type == "map_table":
+                        session.inbound_maps.apply(data.get("maps", {}))
+
+                    elif msg_type == "chat_send":
+                        text = str(data.get("text", ""))
+                        if not session.chat.take():
+                            session.send(json.dumps({
+                                "type": "error",
+                                "message": "chat_rate_limited"
+                            }))
+                        elif text:
+                            try:
+                                channel, to = resolve_channel(data, session.map_name)
+                                if to is not None and to not in self.clients:
+                                    raise ValueError("unknown_player")
+                                msg = self.chat.add(player_id, text, channel, to)
+                                METRICS.chat_messages += 1
+                                self.chat_batch.add(msg)
+                            except ValueError as e:
+                                session.send(json.dumps({
+                                    "type": "error",
+                                    "message": str(e)
+                                }))
+                        continue
+
+                    elif msg_type == "time_ping":
+                        # Answered here: shards run on this host and share the clock
+                        session.send(json.dumps(time_pong(data, received)))
+                        continue
+
+                    elif msg_type == "server_stats" and session.upstream is None:
+                        session.send(json.dumps(self.stats()))
+                        continue
+
+                    if session.upstream is not None:
+                        await session.upstream.send(message)
+
+                except json.JSONDecodeError:
+                    session.send(json.dumps({
+                        "type": "error",
+                        "message": "invalid_json"
+                    }))
+                except ConnectionError as e:
+                    print(f"[Router] {e}")
+                    session.outbox.close(1011, "shard unavailable")
+                except ConnectionClosed:
+                    pass  # shard went away; the pump closes the client
+                except Exception as e:
+                    session.send(json.dumps({
+                        "type": "error",
+                        "message": str(e)
+                    }))
+
+        except Exception as e:
+            print(f"[Router] Client handler error: {e}")
+        finally:
+            if self.clients.get(player_id) is session:
+                del self.clients[player_id]
+                if websocket.close_code in RESUMABLE_CLOSE_CODES and session.outbox.closing is None:
+                    self.detached[player_id] = (session.resume_token, time.monotonic() + RESUME_GRACE)
+                else:
+                    self.tokens.pop(session.resume_token, None)
+            if session.pump is not None:
+                session.pump.cancel()
+            if session.upstream is not None:
+                await session.upstream.close()
+            if writer is not None:
+                writer.cancel()
@@ -0,0 +1,115 @@
+import json
+from dataclasses import dataclass
+
+from server.protocol import MapTable, encode_record, encode_players_delta
+from server.spatialHash import TILE_SIZE
+
+KEYFRAME_INTERVAL = 300     # ticks between forced full snapshots (~5 s at 60 Hz)
+HISTORY_SIZE = 64           # sent-but-unacked snapshots remembered per client
+
+# Area of interest: a client is sent the players within this many pixels of it.
+# A whole screen each way, since the camera stops at map edges and the player
+# can then be anywhere on screen.
+VIEW_HALF_WIDTH = 21 * TILE_SIZE
+VIEW_HALF_HEIGHT = 12 * TILE_SIZE
+
+
+@dataclass
+class Delta:
+    seq: int
+    base: int               # seq the client must already hold (0 for keyframes)
+    keyframe: bool
+    changed: list[int]      # player ids to (re)send in full
+    removed: list[int]      # player ids the client should drop
+
+
+class SnapshotHistory:
+    """
+    Remembers which player versions were sent to one client in each snapshot,
+    so the next snapshot only carries what changed since the client's last ack.
+    """
+    acked_seq: int
+    _sent: dict[int, dict[int, int]]    # seq -> {pid: version}
+    _keyframe_seq: int
+
+    def __init__(self) -> None:
+        self.acked_seq = 0
+        self._sent = {}
+        self._keyframe_seq = -KEYFRAME_INTERVAL
+
+    def ack(self, seq: int) -> None:
+        if seq <= 0:
+            # Client lost its base state and asks for a fresh keyframe
+            self.acked_seq = 0
+            self._sent.clear()
+            return
+        if seq > self.acked_seq and seq in self._sent:
+            self.acked_seq = seq
+            for old in [s for s in self._sent if s < seq]:
+                del self._sent[old]
+
+    def diff(self, seq: int, versions: dict[int, int]) -> Delta | None:
+        """
+        Compare the players this client can see (pid -> version) against its base.
+        Returns None when the client is already up to date.
+        """
+        if self.acked_seq in self._sent:
+            base_seq = self.acked_seq
+        elif self._keyframe_seq in self._sent:
+            # Keyframe still in flight: build on it, the client asks again if it got lost
+            base_seq = self._keyframe_seq
+        else:
+            base_seq = 0
+
+        if base_seq == 0 or seq - self._keyframe_seq >= KEYFRAME_INTERVAL:
+            delta = Delta(seq, 0, True, list(versions), [])
+            self._keyframe_seq = seq
+            # The client drops everything older once the keyframe lands, so later
+            # deltas must build on the keyframe, not on an older ack still in flight
+            self._sent.clear()
+        else:
+            base = self._sent[base_seq]
+            changed = [pid for pid, ver in versions.items() if base.get(pid) != ver]
+            removed = [pid for pid in base if pid not in versions]
+            if not changed and not removed:
+                return None
+            delta = Delta(seq, base_seq, False, changed, removed)
+
+        self._sent[seq] = versions
+        if len(self._sent) > HISTORY_SIZE:
+            del self._sent[next(iter(self._sent))]
+        return delta
+
+
+class SnapshotEncoder:
+    """Per-tick cache: each player's state is encoded once per format, however many clients see it."""
+
+    def __init__(self, timestamp: float, maps: MapTable) -> None:
+        self.timestamp = timestamp
+        self.maps = maps
+        self._records: dict[int, str] = {}
+        self._bin_records: dict[int, bytes] = {}
+
+    def _record(self, pid: int, state: dict) -> str:
+        rec = self._records.get(pid)
+        if rec is None:
+            rec = self._records[pid] = f'"{pid}": {json.dumps(state)}'
+        return rec
+
+    def encode(self, delta: Delta, states: dict[int, tuple[int, dict]]) -> str:
+        players = ", ".join(self._record(pid, states[pid][1]) for pid in delta.changed)
+        return (
+            f'{{"type": "players_delta", "seq": {delta.seq}, "base": {delta.base}, '
+            f'"keyframe": {"true" if delta.keyframe else "false"}, '
+            f'"players": {{{players}}}, "removed": {json.dumps(delta.removed)}, '
+            f'"timestamp": {self.timestamp!r}}}'
+        )
+
+    def encode_binary(self, delta: Delta, states: dict[int, tuple[int, dict]]) -> bytes:
+        records = []
+        for pid in delta.changed:
+            rec = self._bin_records.get(pid)
+            if rec is None:
+                rec = self._bin_records[pid] = encode_record(states[pid][1], self.maps)
+            records.append(rec)
+        return encode_players_delta(delta.seq, delta.base, delta.keyframe, self.timestamp, records, delta.removed)
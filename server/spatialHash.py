@@ -0,0 +1,79 @@
+TILE_SIZE = 64          # pixels per tile, same as GameSettings.TILE_SIZE on the client
+CELL_TILES = 8          # bucket side length in tiles
+
+
+class SpatialHash:
+    """
+    Uniform grid over one map. Each bucket holds the ids of the players whose
+    top-left corner lies inside it, so area queries only look at nearby buckets.
+    """
+    cell_size: float
+    _cells: dict[tuple[int, int], set[int]]
+    _pos: dict[int, tuple[float, float]]
+    _cell_of: dict[int, tuple[int, int]]
+
+    def __init__(self, cell_size: float = TILE_SIZE * CELL_TILES) -> None:
+        self.cell_size = cell_size
+        self._cells = {}
+        self._pos = {}
+        self._cell_of = {}
+
+    def __len__(self) -> int:
+        return len(self._pos)
+
+    def _cell(self, x: float, y: float) -> tuple[int, int]:
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def move(self, pid: int, x: float, y: float) -> None:
+        """Insert `pid` at (x, y), or move it there if already present."""
+        cell = self._cell(x, y)
+        old = self._cell_of.get(pid)
+        if old != cell:
+            if old is not None:
+                bucket = self._cells[old]
+                bucket.discard(pid)
+                if not bucket:
+                    del self._cells[old]
+            self._cells.setdefault(cell, set()).add(pid)
+            self._cell_of[pid] = cell
+        self._pos[pid] = (x, y)
+
+    def remove(self, pid: int) -> None:
+        cell = self._cell_of.pop(pid, None)
+        if cell is None:
+            return
+        del self._pos[pid]
+        bucket = self._cells[cell]
+        bucket.discard(pid)
+        if not bucket:
+            del self._cells[cell]
+
+    def query_rect(self, x0: float, y0: float, x1: float, y1: float) -> list[int]:
+        """Ids whose position lies inside [x0, x1] x [y0, y1]."""
+        cx0, cy0 = self._cell(x0, y0)
+        cx1, cy1 = self._cell(x1, y1)
+        out: list[int] = []
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self._cells):
+            # Query covers more buckets than exist: walk the occupied ones instead
+            cells = [c for c in self._cells if cx0 <= c[0] <= cx1 and cy0 <= c[1] <= cy1]
+        else:
+            cells = [(cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)]
+        for cell in cells:
+            bucket = self._cells.get(cell)
+            if not bucket:
+                continue
+            for pid in bucket:
+                x, y = self._pos[pid]
+                if x0 <= x <= x1 and y0 <= y <= y1:
+                    out.append(pid)
+        return out
+
+    def query_radius(self, x: float, y: float, radius: float) -> list[int]:
+        """Ids within `radius` pixels of (x, y)."""
+        r2 = radius * radius
+        out = []
+        for pid in self.query_rect(x - radius, y - radius, x + radius, y + radius):
+            px, py = self._pos[pid]
+            if (px - x) ** 2 + (py - y) ** 2 <= r2:
+                out.append(pid)
+        return out
@@ -0,0 +1,118 @@
+import sqlite3
+import threading
+import time
+
+from server.chatChannels import WHISPER, persisted
+
+STATE_DB_PATH = "saves/server_state.db"
+CHECKPOINT_INTERVAL = 1.0       # seconds between checkpoints
+STATE_TTL = 3600.0              # saved players not seen for this long are dropped on boot
+CHAT_KEEP = 10000               # newest chat messages kept across boots
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    token   TEXT PRIMARY KEY,
+    x       REAL NOT NULL,
+    y       REAL NOT NULL,
+    map     TEXT NOT NULL,
+    dir     TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chat (
+    id      INTEGER PRIMARY KEY,
+    sender  INTEGER NOT NULL,
+    text    TEXT NOT NULL,
+    ts      REAL NOT NULL,
+    channel TEXT NOT NULL,
+    to_id   INTEGER
+);
+"""
+
+
+class StateStore:
+    """
+    SQLite checkpoint of the player state and chat, so a restarted server can
+    put returning players (by resume token) back where they were.
+
+    The server collects what changed once per CHECKPOINT_INTERVAL on the event
+    loop and hands it to checkpoint(), which runs off the loop and writes it
+    in one transaction. The database is in WAL mode, so a checkpoint never
+    waits for readers and costs one sequential append plus an occasional
+    WAL merge. Only the checkpointing thread touches the connection after boot.
+    """
+    # Player version last written per token, and the newest chat id written
+    saved: dict[str, int]
+    chat_id: int
+
+    def __init__(self, path: str) -> None:
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")  # durable at WAL checkpoints; a crash loses at most the last commits
+        self._db.executescript(_SCHEMA)
+        with self._db:
+            self._db.execute("DELETE FROM players WHERE updated < ?", (time.time() - STATE_TTL,))
+            self._db.execute("DELETE FROM chat WHERE id <= (SELECT MAX(id) FROM chat) - ?", (CHAT_KEEP,))
+            # Left by older versions: player ids restart with the server, so whispers must not come back
+            self._db.execute("DELETE FROM chat WHERE channel = ?", (WHISPER,))
+        self._lock = threading.Lock()
+        self.saved = {}
+        self.chat_id = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM chat").fetchone()[0]
+        self.checkpoints = 0
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+
+    def load_players(self) -> dict[str, dict]:
+        """Saved player states by resume token"""
+        with self._lock:
+            rows = self._db.execute("SELECT token, x, y, map, dir FROM players").fetchall()
+        return {token: {"x": x, "y": y, "map": map_name, "dir": dir} for token, x, y, map_name, dir in rows}
+
+    def load_chat(self, limit: int) -> list[dict]:
+        """The newest `limit` chat messages, oldest first"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, sender, text, ts, channel, to_id FROM chat ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        out = []
+        for mid, sender, text, ts, channel, to in reversed(rows):
+            msg = {"id": mid, "from": sender, "text": text, "ts": ts, "channel": channel}
+            if to is not None:
+                msg["to"] = to
+            out.append(msg)
+        return out
+
+    def checkpoint(self, players: list[tuple[str, float, float, str, str]],
+                   gone: list[str], chat: list[dict]) -> None:
+        """
+        Upsert (token, x, y, map, dir) rows, delete the `gone` tokens and append
+        chat (whispers are skipped), in one transaction. Blocking: run it off the event loop.
+        """
+        start = time.perf_counter()
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO players (token, x, y, map, dir, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                [(*row, now) for row in players]
+            )
+            self._db.executemany("DELETE FROM players WHERE token = ?", [(token,) for token in gone])
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chat (id, sender, text, ts, channel, to_id) VALUES (?, ?, ?, ?, ?, ?)",
+                [(m["id"], m["from"], m["text"], m["ts"], m.get("channel", "global"), m.get("to"))
+                 for m in chat if persisted(m)]
+            )
+        elapsed = (time.perf_counter() - start) * 1000
+        self.checkpoints += 1
+        self.last_ms = elapsed
+        self.max_ms = max(self.max_ms, elapsed)
+
+    def stats(self) -> dict:
+        return {
+            "checkpoints": self.checkpoints,
+            "last_ms": round(self.last_ms, 3),
+            "max_ms": round(self.max_ms, 3),
+            "players_saved": len(self.saved),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,56 @@
+import glob
+import json
+import os
+
+from server.spatialHash import TILE_SIZE
+
+SAVES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "saves")
+# How far the last accepted position may be from a teleport tile: the tile
+# itself plus the walking done between two updates at a low update rate
+TELEPORT_REACH = 2 * TILE_SIZE
+
+
+class TeleportTable:
+    """
+    Where a player may leave a map: as on the client (Map.check_teleport), from
+    one of its teleport tiles, to that tile's destination. Read from the map
+    blocks of the game's save files, in tile coordinates.
+
+    Spawn points are not used: the client saves its live position as the spawn
+    (GameManager.try_switch_map aliases the two), so every save has its own.
+    """
+    # map -> (x, y, destination) of each teleport tile, in pixels
+    _exits: dict[str, list[tuple[float, float, str]]]
+
+    def __init__(self) -> None:
+        self._exits = {}
+
+    @classmethod
+    def from_saves(cls, saves_dir: str = SAVES_DIR) -> "TeleportTable":
+        """Teleports of every save, so any save the game ships with can be played"""
+        table = cls()
+        for path in sorted(glob.glob(os.path.join(saves_dir, "*.json"))):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    blocks = json.load(f)["map"]
+                for block in blocks:
+                    table.add_map(block)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"[Server] skipping teleports in {path}: {e!r}")
+        return table
+
+    def add_map(self, block: dict) -> None:
+        """One map block of a save: {"path", "teleport": [{"x", "y", "destination"}], ...}"""
+        name = str(block["path"])
+        exits = self._exits.setdefault(name, [])
+        for tp in block.get("teleport", []):
+            tile = (float(tp["x"]) * TILE_SIZE, float(tp["y"]) * TILE_SIZE, str(tp["destination"]))
+            if tile not in exits:
+                exits.append(tile)
+
+    def leads_to(self, map0: str, x0: float, y0: float, map_name: str) -> bool:
+        """Whether a player at (x0, y0) on map0 is at a teleport to map_name"""
+        return any(
+            dest == map_name and abs(x0 - tx) <= TELEPORT_REACH and abs(y0 - ty) <= TELEPORT_REACH
+            for tx, ty, dest in self._exits.get(map0, ())
+        )
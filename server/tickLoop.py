@@ -0,0 +1,140 @@
+import asyncio
+import time
+from collections import deque
+
+TICK_RATE = 60
+# Snapshot rate per tier: every tick, every 2nd, every 3rd (60 -> 30 -> 20 Hz)
+SNAPSHOT_DIVISORS = (1, 2, 3)
+
+STATS_WINDOW = 600          # ticks kept for percentiles (~10 s)
+LOAD_SMOOTHING = 0.05       # EMA weight of the newest tick's load
+SHED_ABOVE = 0.8            # smoothed load that raises the shed level
+RECOVER_BELOW = 0.4         # smoothed load that lowers it again
+SHED_HOLD_TIME = 2.0        # seconds the load must stay there before switching
+
+
+class TickScheduler:
+    """
+    Fixed-rate tick clock for the server loop.
+
+    Ticks are scheduled against absolute deadlines, so time spent inside a tick
+    does not push later ticks back. If the loop falls more than a whole tick
+    behind, the missed ticks are skipped and counted instead of run in a burst.
+    Under sustained overload the shed level rises, and clients get snapshots
+    less often (see snapshot_due) until the load comes back down.
+    """
+    rate: int
+    period: float
+    tick: int
+    tick_time: float
+    shed_level: int
+
+    def __init__(self, rate: int = TICK_RATE) -> None:
+        self.rate = rate
+        self.period = 1.0 / rate
+        # Ticks between snapshots at tier 0; the tiers slow down from there
+        self.snapshot_every = 1
+        self.tick = 0
+        # When the current tick was due on the server clock (clockSync.SERVER_CLOCK);
+        # snapshots are stamped with it, so their timestamps are evenly spaced
+        self.tick_time = 0.0
+        self.shed_level = 0
+        self.load = 0.0
+        self.overruns = 0
+        self.skipped = 0
+        self._durations: deque[float] = deque(maxlen=STATS_WINDOW)
+        self._tick_times: deque[float] = deque(maxlen=STATS_WINDOW)
+        self._next_deadline = 0.0
+        self._tick_start = 0.0
+        self._shed_since = 0.0
+
+    async def wait(self) -> int:
+        """Sleep until the next tick deadline and return the tick number."""
+        now = time.perf_counter()
+        if not self._next_deadline:
+            self._next_deadline = now
+        self._next_deadline += self.period
+        if now - self._next_deadline > self.period:
+            missed = int((now - self._next_deadline) / self.period)
+            self.skipped += missed
+            self._next_deadline += missed * self.period
+        self.tick_time = self._next_deadline
+        delay = self._next_deadline - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            await asyncio.sleep(0)  # still let connections run between late ticks
+        self.tick += 1
+        self._tick_start = time.perf_counter()
+        self._tick_times.append(self._tick_start)
+        return self.tick
+
+    def done(self) -> float:
+        """Record the end of the current tick's work; returns its duration in seconds."""
+        now = time.perf_counter()
+        duration = now - self._tick_start
+        self._durations.append(duration)
+        if duration > self.period:
+            self.overruns += 1
+        self.load += LOAD_SMOOTHING * (duration / self.period - self.load)
+        self._update_shed_level(now)
+        return duration
+
+    def _update_shed_level(self, now: float) -> None:
+        max_level = len(SNAPSHOT_DIVISORS) - 1
+        if self.load > SHED_ABOVE and self.shed_level < max_level:
+            wanted = self.shed_level + 1
+        elif self.load < RECOVER_BELOW and self.shed_level > 0:
+            wanted = self.shed_level - 1
+        else:
+            self._shed_since = now
+            return
+        if now - self._shed_since >= SHED_HOLD_TIME:
+            self.shed_level = wanted
+            self._shed_since = now
+            print(f"[Server] tick load {self.load:.2f}, snapshot rate now "
+                  f"{self.snapshot_hz(wanted)} Hz (shed level {wanted})")
+
+    def snapshot_due(self, client_tier: int, phase: int) -> bool:
+        """
+        Whether a client in `client_tier` gets a snapshot this tick. The global
+        shed level acts as a floor, and `phase` spreads clients of the same
+        tier over different ticks.
+        """
+        tier = min(max(client_tier, self.shed_level), len(SNAPSHOT_DIVISORS) - 1)
+        return (self.tick + phase) % (SNAPSHOT_DIVISORS[tier] * self.snapshot_every) == 0
+
+    def set_snapshot_rate(self, hz: int) -> None:
+        """Send tier-0 snapshots at about `hz` (a divisor of the tick rate is exact)"""
+        self.snapshot_every = max(1, round(self.rate / max(hz, 1)))
+
+    def snapshot_hz(self, client_tier: int = 0) -> int:
+        """Snapshot rate of a client in `client_tier`, with the shed level as a floor"""
+        tier = min(max(client_tier, self.shed_level), len(SNAPSHOT_DIVISORS) - 1)
+        return self.rate // (SNAPSHOT_DIVISORS[tier] * self.snapshot_every)
+
+    def stats(self) -> dict:
+        durations = sorted(self._durations)
+
+        def pct(p: float) -> float:
+            if not durations:
+                return 0.0
+            return durations[min(len(durations) - 1, int(p * len(durations)))] * 1000.0
+
+        actual = 0.0
+        if len(self._tick_times) > 1:
+            actual = (len(self._tick_times) - 1) / (self._tick_times[-1] - self._tick_times[0])
+        return {
+            "tick": self.tick,
+            "target_hz": self.rate,
+            "actual_hz": round(actual, 2),
+            "tick_ms_p50": round(pct(0.50), 3),
+            "tick_ms_p95": round(pct(0.95), 3),
+            "tick_ms_p99": round(pct(0.99), 3),
+            "tick_ms_max": round(durations[-1] * 1000.0, 3) if durations else 0.0,
+            "load": round(self.load, 3),
+            "overruns": self.overruns,
+            "skipped_ticks": self.skipped,
+            "shed_level": self.shed_level,
+            "snapshot_hz": self.snapshot_hz(self.shed_level),
+        }
@@ -0,0 +1,68 @@
+import time
+from typing import Hashable
+
+
+class TimingWheel:
+    """
+    Hashed timing wheel of deadlines, for expiring idle entries.
+
+    touch() is O(1) and only records the new deadline; an entry is moved to the
+    slot of its new deadline lazily, when its old slot comes up. advance() only
+    visits the slots whose time has passed, so its cost follows the number of
+    entries in those slots rather than the total number of entries.
+    """
+    resolution: float
+    _slots: list[set]
+    _deadline: dict[Hashable, float]
+    _slot_of: dict[Hashable, int]   # absolute tick whose slot holds the key
+    _current: int                   # last tick already processed
+
+    def __init__(self, resolution: float = 1.0, n_slots: int = 64, now: float | None = None) -> None:
+        self.resolution = resolution
+        self._slots = [set() for _ in range(n_slots)]
+        self._deadline = {}
+        self._slot_of = {}
+        self._current = self._tick_of(time.monotonic() if now is None else now) - 1
+
+    def __len__(self) -> int:
+        return len(self._deadline)
+
+    def _tick_of(self, t: float) -> int:
+        return int(t // self.resolution)
+
+    def _place(self, key: Hashable, deadline: float) -> None:
+        tick = max(self._tick_of(deadline), self._current + 1)
+        self._slots[tick % len(self._slots)].add(key)
+        self._slot_of[key] = tick
+
+    def touch(self, key: Hashable, deadline: float) -> None:
+        """Schedule `key` to expire at `deadline`, replacing any earlier deadline."""
+        known = key in self._deadline
+        self._deadline[key] = deadline
+        if not known:
+            self._place(key, deadline)
+
+    def remove(self, key: Hashable) -> None:
+        self._deadline.pop(key, None)
+        tick = self._slot_of.pop(key, None)
+        if tick is not None:
+            self._slots[tick % len(self._slots)].discard(key)
+
+    def advance(self, now: float) -> list:
+        """Pop and return every key whose deadline is at or before `now`."""
+        expired = []
+        last = self._tick_of(now) - 1   # ticks that lie entirely in the past
+        n = len(self._slots)
+        for tick in range(self._current + 1, min(last, self._current + n) + 1):
+            slot = self._slots[tick % n]
+            for key in [k for k in slot if self._slot_of[k] <= last]:
+                slot.discard(key)
+                del self._slot_of[key]
+                deadline = self._deadline[key]
+                if deadline <= now:
+                    del self._deadline[key]
+                    expired.append(key)
+                else:
+                    self._place(key, deadline)  # touched since it was placed
+        self._current = max(self._current, last)
+        return expired
@@ -0,0 +1,108 @@
+import csv
+import threading
+import time
+from collections import deque
+from typing import IO, NamedTuple
+
+SAMPLE_INTERVAL = 0.5       # seconds per telemetry sample
+SAMPLE_HISTORY = 120        # samples kept for the overlay (one minute)
+
+
+class NetSample(NamedTuple):
+    t: float                        # seconds since the telemetry started
+    rtt_ms: float | None            # newest clock-sync round trip
+    msgs_in: float                  # per second
+    bytes_in: float
+    msgs_out: float
+    bytes_out: float
+    snapshot_age_ms: float | None   # server time since the newest players snapshot was built
+    decode_us: float                # mean handling time per inbound message
+    decode_max_us: float
+    coalesced: int                  # position updates replaced before they were sent, in total
+    reconnects: int
+
+
+class NetStats:
+    """
+    Network counters for one OnlineManager. The websocket thread bumps them
+    and rolls them into a NetSample every SAMPLE_INTERVAL; `history` is
+    replaced as a whole each time, so the game reads it without locking.
+    Samples can also be appended to a CSV file for offline analysis.
+    """
+    history: tuple[NetSample, ...]
+    _csv_file: IO[str] | None
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._samples: deque[NetSample] = deque(maxlen=SAMPLE_HISTORY)
+        self.history = ()
+        self._start = time.monotonic()
+        self._window_start = self._start
+        self._msgs_in = self._bytes_in = self._msgs_out = self._bytes_out = 0
+        self._decode_total = self._decode_max = 0.0
+        self.rtt_ms: float | None = None
+        self.coalesced = 0
+        self.connects = 0
+        self._csv_file = None
+        self._csv = None
+        self.csv_path: str | None = None
+
+    def received(self, size: int, seconds: float) -> None:
+        """One inbound message of `size` bytes that took `seconds` to decode and apply"""
+        self._msgs_in += 1
+        self._bytes_in += size
+        self._decode_total += seconds
+        if seconds > self._decode_max:
+            self._decode_max = seconds
+
+    def sent(self, size: int) -> None:
+        self._msgs_out += 1
+        self._bytes_out += size
+
+    def sample(self, snapshot_age: float | None) -> NetSample:
+        """Close the current window; `snapshot_age` is in seconds (None if unknown)"""
+        now = time.monotonic()
+        span = max(now - self._window_start, 1e-6)
+        s = NetSample(
+            round(now - self._start, 3),
+            self.rtt_ms,
+            self._msgs_in / span,
+            self._bytes_in / span,
+            self._msgs_out / span,
+            self._bytes_out / span,
+            snapshot_age * 1000 if snapshot_age is not None else None,
+            self._decode_total / self._msgs_in * 1e6 if self._msgs_in else 0.0,
+            self._decode_max * 1e6,
+            self.coalesced,
+            max(0, self.connects - 1),
+        )
+        self._window_start = now
+        self._msgs_in = self._bytes_in = self._msgs_out = self._bytes_out = 0
+        self._decode_total = self._decode_max = 0.0
+        self._samples.append(s)
+        self.history = tuple(self._samples)
+        with self._lock:
+            if self._csv is not None:
+                self._csv.writerow(["" if v is None else round(v, 3) if isinstance(v, float) else v for v in s])
+                self._csv_file.flush()
+        return s
+
+    def start_csv(self, path: str) -> None:
+        """Append every following sample to `path`"""
+        with self._lock:
+            self._close_csv()
+            self._csv_file = open(path, "a", newline="", encoding="utf-8")
+            self._csv = csv.writer(self._csv_file)
+            if self._csv_file.tell() == 0:
+                self._csv.writerow(NetSample._fields)
+            self.csv_path = path
+
+    def stop_csv(self) -> None:
+        with self._lock:
+            self._close_csv()
+
+    def _close_csv(self) -> None:
+        if self._csv_file is not None:
+            self._csv_file.close()
+        self._csv_file = self._csv = None
+        self.csv_path = None
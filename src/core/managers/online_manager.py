@@ -5,8 +5,16 @@ import queue
 import collections
 import json
 from collections import deque
-from typing import Optional
+from dataclasses import dataclass
+from typing import NamedTuple, Optional
+from urllib.parse import urlencode
 from src.utils import Logger, GameSettings
+from server.protocol import (
+    BINARY_FORMAT, MSG_PLAYERS_DELTA, MapTable,
+    binary_type, decode_players_delta, encode_player_update
+)
+from server.clockSync import ClockSync
+from .net_stats import NetStats, SAMPLE_INTERVAL
 
 try:
     import websockets
@@ -16,9 +24,46 @@ except ImportError:
 
 from typing import Any
 
+SEND_INTERVAL_MIN = 1 / 60      # never send positions faster than the server ticks
+SEND_INTERVAL_MAX = 0.1
+HEARTBEAT_INTERVAL = 1.0        # an idle player resends its state this often
+
+
+class RemotePlayer(NamedTuple):
+    id: int
+    x: float
+    y: float
+    map: str
+    dir: str
+    moving: bool
+
+
+@dataclass(frozen=True)
+class PlayersSnapshot:
+    """
+    The other players as of one server snapshot. Never modified once published:
+    the network thread swaps in a new one, so the game reads it without a lock
+    and can skip work while `version` stays the same.
+    """
+    version: int
+    time: float                         # server tick time the snapshot was built at
+    players: tuple[RemotePlayer, ...]
+
+
+def _remote_player(pid: int, data: dict) -> RemotePlayer:
+    return RemotePlayer(
+        pid,
+        float(data.get("x", 0)),
+        float(data.get("y", 0)),
+        str(data.get("map", "")),
+        str(data.get("dir", "down")),
+        bool(data.get("moving", False)),
+    )
+
 
 class OnlineManager:
-    list_players: list[dict]
+    # Replaced as a whole on every snapshot; read it without locking
+    players: PlayersSnapshot
     player_id: int
     # WebSocket state
     _ws: Optional[Any]
@@ -26,10 +71,34 @@ class OnlineManager:
     _ws_thread: Optional[threading.Thread]
     _stop_event: threading.Event
     _lock: threading.Lock
-    _update_queue: queue.Queue
+    # Newest local player state not yet sent, and the last one handed over by the game
+    _pending_update: dict | None
+    _last_state: tuple | None
+    # Last update the sender put on the wire; a pending one replaced before that counts as coalesced
+    _sent_update: dict | None
     _chat_out_queue: queue.Queue
+    # Wakes the sender; set from the game thread through the websocket loop
+    _wakeup: asyncio.Event | None
+    # Seconds between position updates: the snapshot interval the server announces for us
+    _send_interval: float
     _chat_messages: collections.deque
     _last_chat_id: int
+    # Delta snapshots: seq -> {pid: state}, kept back to the base the server builds on
+    _snapshots: dict[int, dict[int, RemotePlayer]]
+    _ack_seq: int
+    _sent_ack_seq: int
+    # Wire format negotiated with the server, plus map tables for binary frames
+    _binary: bool
+    _maps_in: MapTable
+    _maps_out: MapTable
+    # Lets a reconnect within the server's grace window keep the same player
+    _resume_token: str | None
+    # Newest position_correction from the server, until the game applies it
+    _correction: dict | None
+    # Server clock estimate
+    _clock: ClockSync
+    # Telemetry for the network overlay and CSV dumps
+    stats: NetStats
 
     def __init__(self):
         if websockets is None:
@@ -49,16 +118,30 @@ class OnlineManager:
 
 
         self.player_id = -1
-        self.list_players = []
+        self.players = PlayersSnapshot(0, 0.0, ())
         self._ws = None
         self._ws_loop = None
         self._ws_thread = None
         self._stop_event = threading.Event()
         self._lock = threading.Lock()
-        self._update_queue = queue.Queue(maxsize=10)
+        self._pending_update = None
+        self._last_state = None
+        self._sent_update = None
+        self._wakeup = None
+        self._send_interval = SEND_INTERVAL_MIN
         self._chat_out_queue = queue.Queue(maxsize=50)
         self._chat_messages = deque(maxlen=200)
         self._last_chat_id = 0
+        self._snapshots = {}
+        self._ack_seq = 0
+        self._sent_ack_seq = 0
+        self._binary = False
+        self._maps_in = MapTable()
+        self._maps_out = MapTable()
+        self._resume_token = None
+        self._correction = None
+        self._clock = ClockSync()
+        self.stats = NetStats()
 
         Logger.info("OnlineManager initialized")
 
@@ -69,24 +152,57 @@ class OnlineManager:
         self.stop()
 
     def get_list_players(self) -> list[dict]:
-        """Get list of players"""
+        """Get list of players (as new dicts; `players` is cheaper)"""
+        return [p._asdict() for p in self.players.players]
+
+    def server_time(self) -> float | None:
+        """Current time on the server clock snapshots are stamped with; None until synced"""
+        return self._clock.server_now() if self._clock.synced else None
+
+    def take_correction(self) -> dict | None:
+        """
+        Position the server moved us back to ({"x", "y", "map", "seq"}), once;
+        None if there is none. `seq` is the input frame it follows (0 if unknown).
+        """
         with self._lock:
-            return list(self.list_players)
-
-    def update(self, x: float, y: float, map_name: str, direction: str, moving: bool) -> bool:
+            correction, self._correction = self._correction, None
+            return correction
+
+    def update(self, x: float, y: float, map_name: str, direction: str, moving: bool,
+               seq: int | None = None) -> bool:
+        """
+        Hand over the local player's state; only a changed state wakes the sender.
+        `seq` is the input frame the state results from, echoed back in corrections.
+        """
         if self.player_id == -1:
             return False
-        try:
-            self._update_queue.put_nowait({
+        state = (x, y, map_name, direction, moving)
+        if state == self._last_state:
+            return True
+        self._last_state = state
+        with self._lock:
+            if self._pending_update is not None and self._pending_update is not self._sent_update:
+                self.stats.coalesced += 1
+            self._pending_update = {
                 "x": x,
                 "y": y,
                 "map": map_name,
                 "dir": direction,
                 "moving": moving,
-            })
-            return True
-        except queue.Full:
-            return False
+                "seq": seq,
+            }
+        self._wake()
+        return True
+
+    def _wake(self) -> None:
+        """Wake the sender from any thread"""
+        loop, wakeup = self._ws_loop, self._wakeup
+        if loop is None or wakeup is None:
+            return
+        try:
+            loop.call_soon_threadsafe(wakeup.set)
+        except RuntimeError:
+            pass  # loop already closed
 
 
     def start(self) -> None:
@@ -104,16 +220,19 @@ class OnlineManager:
 
     def stop(self) -> None:
         self._stop_event.set()
+        self._wake()
         if self._ws_loop and self._ws_loop.is_running():
             # Schedule stop in the event loop
             asyncio.run_coroutine_threadsafe(self._close_ws(), self._ws_loop)
         if self._ws_thread and self._ws_thread.is_alive():
             self._ws_thread.join(timeout=3)
+        self.stats.stop_csv()
 
     def _ws_thread_func(self) -> None:
         """Run WebSocket event loop in a separate thread"""
         self._ws_loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self._ws_loop)
+        self._wakeup = asyncio.Event()
         try:
             self._ws_loop.run_until_complete(self._ws_main())
         except Exception as e:
@@ -121,6 +240,7 @@ class OnlineManager:
         finally:
             self._ws_loop.close()
             self._ws_loop = None
+            self._wakeup = None
 
     async def _close_ws(self) -> None:
         """Close WebSocket connection"""
@@ -135,17 +255,33 @@ class OnlineManager:
         """Main WebSocket connection and message handling"""
         reconnect_delay = 1.0
         max_reconnect_delay = 30.0
+        telemetry = asyncio.create_task(self._telemetry_loop())
 
         while not self._stop_event.is_set():
             try:
+                url = self.ws_url
+                if self._resume_token:
+                    # Ask for our old player back, and only the chat we missed
+                    query = urlencode({"resume": self._resume_token, "last_chat": self._last_chat_id})
+                    url = f"{self.ws_url.rstrip('/')}/?{query}"
                 # Connect to WebSocket server
                 async with websockets.connect(
-                    self.ws_url,
+                    url,
                     ping_interval=20,
                     ping_timeout=10
                 ) as websocket:
                     self._ws = websocket
+                    self.stats.connects += 1
                     Logger.info("WebSocket connected")
+                    # Snapshots are kept until "registered" says whether the session resumed
+                    self._sent_ack_seq = 0
+                    # Map tables are per connection; JSON until the server agrees otherwise
+                    self._binary = False
+                    self._maps_in = MapTable()
+                    self._maps_out = MapTable()
+                    self._clock.reset()
+                    encodings = [BINARY_FORMAT, "json"] if GameSettings.ONLINE_BINARY_PROTOCOL else ["json"]
+                    await self._send(websocket, json.dumps({"type": "hello", "encodings": encodings}))
                     reconnect_delay = 1.0  # Reset delay on successful connection
 
                     # Start sender task
@@ -156,7 +292,9 @@ class OnlineManager:
                         async for message in websocket:
                             if self._stop_event.is_set():
                                 break
+                            start = time.perf_counter()
                             await self._handle_message(message)
+                            self.stats.received(len(message), time.perf_counter() - start)
                     except websockets.exceptions.ConnectionClosed:
                         Logger.warning("WebSocket connection closed")
                     finally:
@@ -174,36 +312,69 @@ class OnlineManager:
                 self._ws = None
                 if not self._stop_event.is_set():
                     await asyncio.sleep(0.5)
-
-    async def _handle_message(self, message: str) -> None:
+        telemetry.cancel()
+        try:
+            await telemetry
+        except asyncio.CancelledError:
+            pass
+
+    async def _telemetry_loop(self) -> None:
+        """Roll the counters into a sample every SAMPLE_INTERVAL, connected or not"""
+        while True:
+            await asyncio.sleep(SAMPLE_INTERVAL)
+            snapshot_time = self.players.time
+            age = None
+            if self._clock.synced and snapshot_time:
+                age = self._clock.server_now() - snapshot_time
+            self.stats.sample(age)
+
+    async def _send(self, websocket: Any, message: str | bytes) -> None:
+        await websocket.send(message)
+        self.stats.sent(len(message))
+
+    async def _handle_message(self, message: str | bytes) -> None:
         """Handle incoming WebSocket message"""
         try:
+            if isinstance(message, bytes):
+                if binary_type(message) == MSG_PLAYERS_DELTA:
+                    self._apply_players_delta(decode_players_delta(message, self._maps_in))
+                return
+
             data = json.loads(message)
             msg_type = data.get("type")
 
             if msg_type == "registered":
                 self.player_id = int(data.get("id", -1))
-                Logger.info(f"OnlineManager registered with id={self.player_id}")
+                self._resume_token = data.get("token")
+                if data.get("resumed"):
+                    Logger.info(f"OnlineManager resumed as id={self.player_id}")
+                else:
+                    # A new session starts from a keyframe
+                    self._snapshots.clear()
+                    self._ack_seq = 0
+                    Logger.info(f"OnlineManager registered with id={self.player_id}")
 
             elif msg_type == "players_update":
                 players_data = data.get("players", {})
-                with self._lock:
-                    filtered = []
-                    for pid_str, player_data in players_data.items():
-                        pid = int(pid_str)
-                        if pid != self.player_id:
+                self._publish_players({int(pid): _remote_player(int(pid), p) for pid, p in players_data.items()},
+                                      float(data.get("timestamp", 0.0)))
 
-                            # HINT: This part might be helpful for direction change
-                            # Maybe you can add other parameters?
-                            filtered.append({
-                                "id": pid,
-                                "x": float(player_data.get("x", 0)),
-                                "y": float(player_data.get("y", 0)),
-                                "map": str(player_data.get("map", "")),
-                                "dir": str(player_data.get("dir", "down")),
-                                "moving": bool(player_data.get("moving", False)),
-                            })
-                    self.list_players = filtered
+            elif msg_type == "players_delta":
+                self._apply_players_delta(data)
+
+            elif msg_type == "map_table":
+                self._maps_in.apply(data.get("maps", {}))
+
+            elif msg_type == "handoff":
+                # Moved to another shard: its snapshots and map table start over
+                self._snapshots.clear()
+                self._ack_seq = 0
+                self._sent_ack_seq = 0
+                self._maps_in = MapTable()
+
+            elif msg_type == "encoding":
+                self._binary = data.get("format") == BINARY_FORMAT
+                Logger.info(f"OnlineManager using {data.get('format')} encoding")
 
             elif msg_type == "chat_update":
                 messages = data.get("messages", [])
@@ -215,6 +386,19 @@ class OnlineManager:
                         if mid > self._last_chat_id:
                             self._last_chat_id = mid
 
+            elif msg_type == "update_rate":
+                # The server slowed our snapshots down (or sped them up again): match them
+                hz = float(data.get("hz", 0)) or 1 / SEND_INTERVAL_MAX
+                self._send_interval = min(max(1 / hz, SEND_INTERVAL_MIN), SEND_INTERVAL_MAX)
+
+            elif msg_type == "time_pong":
+                self.stats.rtt_ms = self._clock.add(data) * 1000
+
+            elif msg_type == "position_correction":
+                # The server rejected part of a move (too fast or through a wall)
+                with self._lock:
+                    self._correction = data
+
             elif msg_type == "error":
                 Logger.warning(f"Server error: {data.get('message', 'unknown')}")
 
@@ -223,68 +407,151 @@ class OnlineManager:
         except Exception as e:
             Logger.warning(f"Error handling WebSocket message: {e}")
 
+    def _apply_players_delta(self, data: dict) -> None:
+        seq = int(data.get("seq", 0))
+        base = int(data.get("base", 0))
+        if data.get("keyframe"):
+            players: dict[int, RemotePlayer] = {}
+            base = seq
+        else:
+            base_players = self._snapshots.get(base)
+            if base_players is None:
+                # Lost the base snapshot: ask for a keyframe (once) and wait for it
+                self._ack_seq = 0
+                if self._sent_ack_seq != 0:
+                    self._sent_ack_seq = -1
+                    self._wakeup.set()
+                return
+            players = dict(base_players)
+
+        # Only the changed players are converted; the rest are shared with the base
+        for pid_str, player_data in data.get("players", {}).items():
+            pid = int(pid_str)
+            players[pid] = _remote_player(pid, player_data)
+        for pid in data.get("removed", []):
+            players.pop(int(pid), None)
+
+        # The server never builds on anything older than the base it just used
+        self._snapshots[seq] = players
+        for old in [s for s in self._snapshots if s < base]:
+            del self._snapshots[old]
+        self._ack_seq = seq
+        self._wakeup.set()
+        self._publish_players(players, float(data.get("timestamp", 0.0)))
+
+    def _publish_players(self, players: dict[int, RemotePlayer], timestamp: float) -> None:
+        # HINT: This part might be helpful for direction change
+        # Maybe you can add other parameters?
+        others = tuple(p for pid, p in players.items() if pid != self.player_id)
+        # One reference swap: the game thread sees the old snapshot or the new one, never a mix
+        self.players = PlayersSnapshot(self.players.version + 1, timestamp, others)
+
     async def _ws_sender(self, websocket: Any) -> None:
-        """Send updates to server via WebSocket"""
-        update_interval = 0.0167  # 60 updates per second
-        last_update = time.monotonic()
+        """
+        Send what is waiting, then sleep until woken (new state, chat, snapshot
+        to ack) or until the next position slot, heartbeat or clock ping is due.
+        """
+        last_sent: dict | None = None
+        last_sent_at = 0.0
 
         while not self._stop_event.is_set():
             try:
-                # Send position updates
+                self._wakeup.clear()
                 now = time.monotonic()
-                if now - last_update >= update_interval:
-                    # Collapse queue to latest entry to avoid sending stale movement
-                    latest_update = None
+                timeout = HEARTBEAT_INTERVAL
+
+                # Position: changes at most once per send interval, the same state again as a heartbeat
+                with self._lock:
+                    update = self._pending_update
+                if update is not None and self.player_id >= 0:
+                    due = last_sent_at + (self._send_interval if update is not last_sent else HEARTBEAT_INTERVAL)
+                    if now >= due:
+                        if self._binary:
+                            await self._send_binary_update(websocket, update)
+                        else:
+                            # HINT: This part might be helpful for direction change
+                            # Maybe you can add other parameters? 
+                            message = {
+                                "type": "player_update",
+                                "x": update.get("x"),
+                                "y": update.get("y"),
+                                "map": update.get("map"),
+                                "dir": update.get("dir", "down"),
+                                "moving": bool(update.get("moving", False)),
+                            }
+                            if update.get("seq") is not None:
+                                message["seq"] = update["seq"]
+                            await self._send(websocket, json.dumps(message))
+                        last_sent, last_sent_at = update, now
+                        self._sent_update = update
+                        due = now + HEARTBEAT_INTERVAL
+                    timeout = min(timeout, due - now)
+
+                # Keep the server clock estimate fresh
+                ping = self._clock.ping()
+                if ping is not None:
+                    await self._send(websocket, json.dumps(ping))
+                timeout = min(timeout, self._clock.next_ping_in())
+
+                # Acknowledge the newest snapshot so the server can send deltas against it
+                if self._ack_seq != self._sent_ack_seq:
+                    ack_seq = self._ack_seq
+                    await self._send(websocket, json.dumps({"type": "snapshot_ack", "seq": ack_seq}))
+                    self._sent_ack_seq = ack_seq
+
+                # Send chat messages
+                while self.player_id >= 0:
                     try:
-                        while True:
-                            latest_update = self._update_queue.get_nowait()
+                        message = self._chat_out_queue.get_nowait()
                     except queue.Empty:
-                        pass
-
-                    if latest_update and self.player_id >= 0:
-                        # HINT: This part might be helpful for direction change
-                        # Maybe you can add other parameters? 
-                        message = {
-                            "type": "player_update",
-                            "x": latest_update.get("x"),
-                            "y": latest_update.get("y"),
-                            "map": latest_update.get("map"),
-                            "dir": latest_update.get("dir", "down"),
-                            "moving": bool(latest_update.get("moving", False)),
-                        }
-
-                        await websocket.send(json.dumps(message))
-                        last_update = now
+                        break
+                    await self._send(websocket, json.dumps(message))
 
-                # Send chat messages
                 try:
-                    chat_text = self._chat_out_queue.get_nowait()
-                    if self.player_id >= 0:
-                        message = {
-                            "type": "chat_send",
-                            "text": chat_text
-                        }
-                        await websocket.send(json.dumps(message))
-                except queue.Empty:
+                    await asyncio.wait_for(self._wakeup.wait(), max(timeout, 0.0))
+                except asyncio.TimeoutError:
                     pass
 
-                await asyncio.sleep(0.01)  # Small sleep to prevent busy waiting
-
             except Exception as e:
                 Logger.warning(f"WebSocket send error: {e}")
                 await asyncio.sleep(0.1)
 
+    async def _send_binary_update(self, websocket: Any, update: dict) -> None:
+        known = len(self._maps_out)
+        map_idx = self._maps_out.index(str(update.get("map", "")))
+        if len(self._maps_out) > known:
+            # Tell the server the new map name before referring to it by index
+            await self._send(websocket, json.dumps(self._maps_out.announce(known)))
+        await self._send(websocket, encode_player_update(
+            float(update.get("x", 0)),
+            float(update.get("y", 0)),
+            map_idx,
+            str(update.get("dir", "down")),
+            bool(update.get("moving", False)),
+            update.get("seq"),
+        ))
+
     # -----------------------------
     # Chat API
     # -----------------------------
     def send_chat(self, text: str) -> bool:
+        """Send to everyone, or "/m text" to the current map and "/w <id> text" to one player"""
         if self.player_id == -1:
             return False
         t = (text or "").strip()
-        if not t:
+        message: dict = {"type": "chat_send", "text": t, "channel": "global"}
+        if t.startswith("/m "):
+            message.update(text=t[3:].strip(), channel="map")
+        elif t.startswith("/w "):
+            parts = t[3:].strip().split(" ", 1)
+            if len(parts) < 2 or not parts[0].isdigit():
+                return False
+            message.update(text=parts[1].strip(), channel="whisper", to=int(parts[0]))
+        if not message["text"]:
             return False
         try:
-            self._chat_out_queue.put_nowait(t)
+            self._chat_out_queue.put_nowait(message)
+            self._wake()
             return True
         except queue.Full:
             return False
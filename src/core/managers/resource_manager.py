@@ -1,4 +1,6 @@
 import pygame as pg
+from types import MappingProxyType
+from typing import Mapping
 from src.utils import load_img, load_font, load_sound
 
 class ResourceManager:
@@ -10,6 +12,9 @@ class ResourceManager:
         self._images: dict[str, pg.Surface] = {}
         self._sounds: dict[str, pg.mixer.Sound] = {}
         self._fonts: dict[tuple[str, int], pg.font.Font] = {}
+        # (sheet path, rows, keyframes, size) -> row name -> scaled frames
+        self._frames: dict[tuple[str, tuple[str, ...], int, tuple[int, int]],
+                           Mapping[str, tuple[pg.Surface, ...]]] = {}
 
     def get_image(self, path: str) -> pg.Surface:
         if path not in self._images:
@@ -27,8 +32,34 @@ class ResourceManager:
             self._fonts[key] = load_font(path, size)
         return self._fonts[key]
 
+    def get_frames(self, path: str, rows: list[str], n_keyframes: int,
+                   size: tuple[int, int]) -> Mapping[str, tuple[pg.Surface, ...]]:
+        """
+        A spritesheet cut into `rows` x `n_keyframes` frames scaled to `size`,
+        by row name. Sliced and scaled once per key, then shared by every
+        Animation that asks for it, so it must not be modified.
+        """
+        key = (path, tuple(rows), n_keyframes, tuple(size))
+        frames = self._frames.get(key)
+        if frames is None:
+            sheet = self.get_image(path)
+            sheet_w, sheet_h = sheet.get_size()
+            frame_w = sheet_w // n_keyframes
+            frame_h = sheet_h // len(rows)
+            frames = self._frames[key] = MappingProxyType({
+                name: tuple(
+                    pg.transform.smoothscale(
+                        sheet.subsurface(pg.Rect(c * frame_w, r * frame_h, frame_w, frame_h)), size
+                    )
+                    for c in range(n_keyframes)
+                )
+                for r, name in enumerate(rows)
+            })
+        return frames
+
     def clear(self) -> None:
         """Clear all cached assets (useful when switching levels)."""
         self._images.clear()
         self._sounds.clear()
         self._fonts.clear()
+        self._frames.clear()
@@ -1,12 +1,30 @@
 import pygame as pg
+from collections import deque
 from src.sprites import Animation
 from src.utils import Position, PositionCamera, GameSettings
 
+BUFFER_SIZE = 32            # server states kept per remote player
+MAX_EXTRAPOLATION = 0.25    # seconds a late player keeps walking on its last velocity
+TELEPORT_DISTANCE = 3 * GameSettings.TILE_SIZE  # jumps this long between two states are not smoothed
+CLOCK_JUMP = 1.0            # a state this much older than the newest one means the server clock changed
+
 class OnlinePlayer:
+    """
+    A remote player. States stamped with the server tick time go into a small
+    time-ordered buffer and are drawn GameSettings.ONLINE_INTERP_DELAY behind
+    the server clock, interpolating between the two states around that time.
+    When no newer state has arrived yet the player is extrapolated for at
+    most MAX_EXTRAPOLATION, then held.
+    """
+    # (server time, x, y, dir, moving), oldest first
+    _buffer: deque[tuple[float, float, float, str, bool]]
+
     def __init__(self, x: float, y: float):
         self.position = Position(x, y)
         self.facing_dir = "down"
         self.moving = False
+        self._buffer = deque(maxlen=BUFFER_SIZE)
+        self._velocity = (0.0, 0.0)
 
         self.animation = Animation(
             "character/ow1.png",
@@ -16,22 +34,66 @@ class OnlinePlayer:
         )
         self.animation.update_pos(self.position)
 
-    def apply_state(self, x: float, y: float, direction: str, moving: bool) -> None:
-        self.position.x = float(x)
-        self.position.y = float(y)
-
+    def apply_state(self, x: float, y: float, direction: str, moving: bool,
+                    timestamp: float | None = None) -> None:
+        """Take a state from the server; without a timestamp it is shown at once"""
         if direction not in ("up", "down", "left", "right"):
             direction = "down"
-        self.facing_dir = direction
-        self.moving = bool(moving)
+        if timestamp is None:
+            self._buffer.clear()
+            self._show(float(x), float(y), direction, bool(moving))
+            return
 
-        self.animation.switch(self.facing_dir)
+        if self._buffer:
+            last_t, last_x, last_y, _, _ = self._buffer[-1]
+            if timestamp <= last_t:
+                if last_t - timestamp < CLOCK_JUMP:
+                    return  # same snapshot as last frame, or an older one
+                self._buffer.clear()  # server clock went back: another server process
+            else:
+                dt = timestamp - last_t
+                vx, vy = (x - last_x) / dt, (y - last_y) / dt
+                teleport = abs(x - last_x) + abs(y - last_y) > TELEPORT_DISTANCE
+                self._velocity = (vx, vy) if moving and not teleport else (0.0, 0.0)
+        self._buffer.append((timestamp, float(x), float(y), direction, bool(moving)))
+
+    def _show(self, x: float, y: float, direction: str, moving: bool) -> None:
+        self.position.x = x
+        self.position.y = y
+        if direction != self.facing_dir:
+            self.facing_dir = direction
+            self.animation.switch(self.facing_dir)
+        self.moving = moving
         self.animation.update_pos(self.position)
 
         if not self.moving:
             self.animation.accumulator = 0.0
 
-    def update(self, dt: float) -> None:
+    def _sample(self, render_time: float) -> None:
+        buf = self._buffer
+        # Drop states that are no longer needed: keep the last one at or before render_time
+        while len(buf) >= 2 and buf[1][0] <= render_time:
+            buf.popleft()
+        t0, x0, y0, dir0, moving0 = buf[0]
+        if render_time <= t0:
+            self._show(x0, y0, dir0, moving0)
+        elif len(buf) >= 2:
+            t1, x1, y1, _, _ = buf[1]
+            if abs(x1 - x0) + abs(y1 - y0) > TELEPORT_DISTANCE:
+                self._show(x0, y0, dir0, moving0)
+            else:
+                a = (render_time - t0) / (t1 - t0)
+                self._show(x0 + (x1 - x0) * a, y0 + (y1 - y0) * a, dir0, moving0)
+        else:
+            # Late: keep walking for a bit, then wait where the player was last seen
+            ahead = min(render_time - t0, MAX_EXTRAPOLATION)
+            vx, vy = self._velocity
+            self._show(x0 + vx * ahead, y0 + vy * ahead, dir0, moving0)
+
+    def update(self, dt: float, server_time: float | None = None) -> None:
+        """`server_time` is the current server clock estimate (OnlineManager.server_time())"""
+        if server_time is not None and self._buffer:
+            self._sample(server_time - GameSettings.ONLINE_INTERP_DELAY)
         # Only animate if moving
         if self.moving:
             self.animation.update(dt)
@@ -5,16 +5,24 @@ from src.core.services import input_manager
 from src.utils import Position, PositionCamera, GameSettings, Logger
 from src.core import GameManager
 import math
+from collections import deque
 from typing import override
 
+PREDICTION_HISTORY = 240    # moving input frames kept for replay (4 s at 60 fps)
+
 class Player(Entity):
     speed: float = 4.0 * GameSettings.TILE_SIZE
     game_manager: GameManager
+    # Moves applied locally but maybe not yet seen by the server: (seq, dx, dy, dt)
+    inputs: deque[tuple[int, float, float, float]]
 
     def __init__(self, x: float, y: float, game_manager: GameManager) -> None:
         super().__init__(x, y, game_manager)
         self.facing_dir = "down"
         self.moving = False
+        # Numbers every input frame; sent with our position so corrections can name the frame they follow
+        self.input_seq = 0
+        self.inputs = deque(maxlen=PREDICTION_HISTORY)
 
 
     '''
@@ -165,6 +173,7 @@ class Player(Entity):
             dis.y /= length
 
         # 3) Save state for animation + online
+        self.input_seq += 1
         self.moving = moving
         if moving:
             if abs(dis.x) > abs(dis.y):
@@ -172,7 +181,32 @@ class Player(Entity):
             else:
                 self.facing_dir = "down" if dis.y > 0 else "up"
 
-        # 4) Collision movement (X then Y)
+        # 4) Collision movement (X then Y), predicted: kept until the server may have corrected it
+        if moving:
+            self.inputs.append((self.input_seq, dis.x, dis.y, dt))
+            self._step(dis.x, dis.y, dt)
+
+        # 5) Teleport check
+        tp = self.game_manager.current_map.check_teleport(self.position)
+        if tp:
+            dest = tp.destination
+            self.game_manager.switch_map(dest)
+            self.inputs.clear()
+            if tp.destination not in self.game_manager.maps:
+                Logger.warning(f"Teleport destination '{tp.destination}' not loaded")
+
+        # 6) Animation
+        self.animation.switch(self.facing_dir)
+        self.animation.update_pos(self.position)
+        if self.moving:
+            self.animation.update(dt)
+        else:
+            # Freeze on first frame for idle look
+            self.animation.accumulator = 0.0
+
+
+    def _step(self, dx: float, dy: float, dt: float) -> None:
+        """Move along the normalized direction (dx, dy) for dt seconds, X then Y, stopping at obstacles"""
         ts = GameSettings.TILE_SIZE
         step = self.speed * dt
 
@@ -194,33 +228,28 @@ class Player(Entity):
                     return True
             return False
 
-        if moving and dis.x != 0:
-            new_x = self.position.x + dis.x * step
+        if dx != 0:
+            new_x = self.position.x + dx * step
             if not collides_any(collider_rect_at(new_x, self.position.y)):
                 self.position.x = new_x
 
-        if moving and dis.y != 0:
-            new_y = self.position.y + dis.y * step
+        if dy != 0:
+            new_y = self.position.y + dy * step
             if not collides_any(collider_rect_at(self.position.x, new_y)):
                 self.position.y = new_y
 
-        # 5) Teleport check
-        tp = self.game_manager.current_map.check_teleport(self.position)
-        if tp:
-            dest = tp.destination
-            self.game_manager.switch_map(dest)
-            if tp.destination not in self.game_manager.maps:
-                Logger.warning(f"Teleport destination '{tp.destination}' not loaded")
-
-        # 6) Animation
-        self.animation.switch(self.facing_dir)
+    def reconcile(self, seq: int, x: float, y: float) -> None:
+        """
+        The server put us at (x, y) as of input frame `seq`: start from there
+        and replay the inputs that came after it, which it had not seen yet.
+        """
+        while self.inputs and self.inputs[0][0] <= seq:
+            self.inputs.popleft()
+        self.position.x = x
+        self.position.y = y
+        for _, dx, dy, dt in self.inputs:
+            self._step(dx, dy, dt)
         self.animation.update_pos(self.position)
-        if self.moving:
-            self.animation.update(dt)
-        else:
-            # Freeze on first frame for idle look
-            self.animation.accumulator = 0.0
-
 
     @override
     def draw(self, screen: pg.Surface, camera: PositionCamera) -> None:
@@ -70,7 +70,14 @@ class ChatOverlay:
         for m in show:
             sender = m.get("name") or m.get("from") or m.get("id") or "?"
             text = str(m.get("text", ""))
-            surf = self.font_small.render(f"{sender}: {text}", True, (255, 255, 255))
+            channel = str(m.get("channel", "global"))
+            if channel == "whisper":
+                tag = "[whisper] "
+            elif channel.startswith("map:"):
+                tag = "[map] "
+            else:
+                tag = ""
+            surf = self.font_small.render(f"{tag}{sender}: {text}", True, (255, 255, 255))
             screen.blit(surf, (x + 10, lines_y))
             lines_y += 22
 
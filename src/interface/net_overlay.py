@@ -0,0 +1,66 @@
+import os
+import pygame as pg
+from src.core.managers.net_stats import NetSample, SAMPLE_HISTORY
+
+# (label, NetSample field, value format, scale)
+ROWS = (
+    ("RTT", "rtt_ms", "{:.0f} ms", 1.0),
+    ("Snapshot age", "snapshot_age_ms", "{:.0f} ms", 1.0),
+    ("In", "msgs_in", "{:.0f} msg/s", 1.0),
+    ("In", "bytes_in", "{:.1f} KB/s", 1 / 1024),
+    ("Out", "msgs_out", "{:.0f} msg/s", 1.0),
+    ("Out", "bytes_out", "{:.1f} KB/s", 1 / 1024),
+    ("Decode", "decode_us", "{:.0f} us", 1.0),
+)
+
+class NetOverlay:
+    """Network telemetry panel: one sparkline per metric over the last SAMPLE_HISTORY samples"""
+
+    def __init__(self, width: int = 330, row_height: int = 26, margin: int = 16) -> None:
+        self.opened = False
+        self.width = width
+        self.row_height = row_height
+        self.margin = margin
+        font_path = "assets/fonts/Minecraft.ttf"
+        self.font = pg.font.Font(font_path, 12)
+
+    def toggle(self) -> None:
+        self.opened = not self.opened
+
+    def draw(self, screen: pg.Surface, history: tuple[NetSample, ...], csv_path: str | None) -> None:
+        if not self.opened:
+            return
+
+        height = self.row_height * (len(ROWS) + 1) + 12
+        x = screen.get_width() - self.width - self.margin
+        y = self.margin
+        panel = pg.Surface((self.width, height), pg.SRCALPHA)
+        panel.fill((0, 0, 0, 170))
+        screen.blit(panel, (x, y))
+
+        spark_w, spark_h = 130, self.row_height - 8
+        spark_x = x + self.width - spark_w - 8
+        latest = history[-1] if history else None
+        for i, (label, field, fmt, scale) in enumerate(ROWS):
+            row_y = y + 6 + i * self.row_height
+            value = getattr(latest, field) if latest else None
+            text = f"{label} {fmt.format(value * scale) if value is not None else '-'}"
+            screen.blit(self.font.render(text, True, (255, 255, 255)), (x + 8, row_y + 6))
+
+            values = [getattr(s, field) for s in history]
+            peak = max((v for v in values if v is not None), default=0.0) or 1.0
+            step = spark_w / (SAMPLE_HISTORY - 1)
+            left = spark_x + spark_w - step * (len(values) - 1)
+            points = [
+                (left + j * step, row_y + spark_h - v / peak * spark_h)
+                for j, v in enumerate(values) if v is not None
+            ]
+            pg.draw.line(screen, (80, 80, 80), (spark_x, row_y + spark_h), (spark_x + spark_w, row_y + spark_h))
+            if len(points) >= 2:
+                pg.draw.lines(screen, (120, 220, 120), False, points)
+
+        footer_y = y + 6 + len(ROWS) * self.row_height
+        footer = (f"reconnects {latest.reconnects if latest else 0}  "
+                  f"coalesced {latest.coalesced if latest else 0}  "
+                  + (f"CSV {os.path.basename(csv_path)}" if csv_path else "F4: dump CSV"))
+        screen.blit(self.font.render(footer, True, (200, 200, 200)), (x + 8, footer_y + 6))
@@ -14,6 +14,7 @@ from typing import override
 from collections import deque
 from src.entities.online_player import OnlinePlayer
 from src.interface.chat_overlay import ChatOverlay
+from src.interface.net_overlay import NetOverlay
 
 
 class GameScene(Scene):
@@ -44,10 +45,14 @@ class GameScene(Scene):
             exit(1)
         self.game_manager = manager
         self.remote_players: dict[int, OnlinePlayer] = {}
+        # (snapshot version, map) remote_players was last built from
+        self._players_seen: tuple[int, str] | None = None
 
         #----------CHAT-----------
         self.chat_overlay = ChatOverlay()
         self.chat_open = False
+        # Network telemetry: F3 shows it, F4 dumps it to CSV
+        self.net_overlay = NetOverlay()
         # -------- MINIMAP --------
         self.minimap_w = 180
         self.minimap_h = 180
@@ -573,44 +578,62 @@ class GameScene(Scene):
                 self.game_manager.player.update(dt)
 
         if self.online_manager is not None and self.game_manager.player is not None:
+            player = self.game_manager.player
+            correction = self.online_manager.take_correction()
+            if (correction is not None and correction.get("map") != self.game_manager.current_map.path_name
+                    and correction.get("map") in self.game_manager.maps):
+                # The server refused a map change: back to the map it still has us on
+                self.game_manager.current_map_key = correction["map"]
+                player.inputs.clear()
+                player.position.x = float(correction["x"])
+                player.position.y = float(correction["y"])
+            elif correction is not None and correction.get("map") == self.game_manager.current_map.path_name:
+                seq = int(correction.get("seq", 0))
+                if seq > 0:
+                    # Server position for that input frame, plus the moves it has not seen yet
+                    player.reconcile(seq, float(correction["x"]), float(correction["y"]))
+                else:
+                    player.inputs.clear()
+                    player.position.x = float(correction["x"])
+                    player.position.y = float(correction["y"])
             self.online_manager.update(
-                self.game_manager.player.position.x,
-                self.game_manager.player.position.y,
+                player.position.x,
+                player.position.y,
                 self.game_manager.current_map.path_name,  # use path_name consistently
-                self.game_manager.player.facing_dir,
-                self.game_manager.player.moving
+                player.facing_dir,
+                player.moving,
+                player.input_seq
             )
 
         # Update remote players (same map only recommended)
         if self.online_manager is not None:
-            net_players = self.online_manager.get_list_players()
-            alive = set()
-
-            for p in net_players:
-                pid = int(p["id"])
-                if str(p.get("map", "")) != self.game_manager.current_map.path_name:
-                    continue
-                alive.add(pid)
-
-                # optionally skip players on different maps
-                #if str(p.get("map", "")) != self.game_manager.current_map.map_name:
-                #    continue
-
-                rp = self.remote_players.get(pid)
-                if rp is None:
-                    rp = self.remote_players[pid] = OnlinePlayer(p["x"], p["y"])
-
-                rp.apply_state(
-                    p["x"], p["y"],
-                    p.get("dir", "down"),
-                    p.get("moving", False)
-                )
-                rp.update(dt)
-
-            # Remove disconnected
-            for pid in list(self.remote_players.keys()):
-                if pid not in alive:
-                    del self.remote_players[pid]
+            snapshot = self.online_manager.players
+            # Interpolate remote players once the server clock is known; until then show them as they come
+            server_now = self.online_manager.server_time()
+            current_map = self.game_manager.current_map.path_name
+            if self._players_seen != (snapshot.version, current_map):
+                # New snapshot (or we changed maps): hand the new states over
+                self._players_seen = (snapshot.version, current_map)
+                stamp = snapshot.time if server_now is not None and snapshot.time else None
+                alive = set()
+
+                for p in snapshot.players:
+                    if p.map != current_map:
+                        continue
+                    alive.add(p.id)
+
+                    rp = self.remote_players.get(p.id)
+                    if rp is None:
+                        rp = self.remote_players[p.id] = OnlinePlayer(p.x, p.y)
+                    rp.apply_state(p.x, p.y, p.dir, p.moving, stamp)
+
+                # Remove disconnected
+                for pid in list(self.remote_players.keys()):
+                    if pid not in alive:
+                        del self.remote_players[pid]
+
+            for rp in self.remote_players.values():
+                rp.update(dt, server_now)
 
         for enemy in self.game_manager.current_enemy_trainers:
             enemy.update(dt)
@@ -688,6 +711,20 @@ class GameScene(Scene):
             print(" pressed in GameScene")
         '''
 
+        if event.type == pg.KEYDOWN and event.key == pg.K_F3:
+            self.net_overlay.toggle()
+            return
+        if event.type == pg.KEYDOWN and event.key == pg.K_F4:
+            stats = self.online_manager.stats
+            if stats.csv_path:
+                Logger.info(f"Network telemetry saved to {stats.csv_path}")
+                stats.stop_csv()
+            else:
+                path = f"{GameSettings.ONLINE_TELEMETRY_DIR}/net_{time.strftime('%Y%m%d-%H%M%S')}.csv"
+                stats.start_csv(path)
+                Logger.info(f"Dumping network telemetry to {path}")
+            return
+
         # Open chat with T (only when no other overlay is open)
         if event.type == pg.KEYDOWN and event.key == pg.K_r and (event.mod & pg.KMOD_SHIFT):
             if (not self.overlay_open) and (not self.backpack_open) and (not self.shop_open) and (not self.nav_open):
@@ -1009,17 +1046,6 @@ class GameScene(Scene):
             if my_id is not None:
                 id2name[my_id] = GameSettings.PLAYER_NAME
 
-            # OPTIONAL: if server returns names in player list
-            # (only works if get_list_players() contains "name")
-            try:
-                for p in self.online_manager.get_list_players():
-                    pid = str(p.get("id", ""))
-                    pname = p.get("name")
-                    if pid and pname:
-                        id2name[pid] = pname
-            except Exception:
-                pass
-
             # rewrite messages so ChatOverlay prints names
             fixed = []
             for m in msgs:
@@ -1036,6 +1062,10 @@ class GameScene(Scene):
             msgs = self.online_manager.get_recent_chat(50)
             self.chat_overlay.draw(screen, msgs)
 
+        if self.online_manager is not None:
+            stats = self.online_manager.stats
+            self.net_overlay.draw(screen, stats.history, stats.csv_path)
+
         
 
         
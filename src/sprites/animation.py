@@ -1,12 +1,13 @@
 import pygame as pg
 
 from .sprite import Sprite
+from src.core.services import resource_manager
 from src.utils import GameSettings, Logger, PositionCamera
-from typing import Optional
+from typing import Mapping, Optional
 
 class Animation(Sprite):
-    # Animations
-    animations: dict[str, list[pg.Surface]]
+    # Animations, shared with every Animation of the same sheet and size (read only)
+    animations: Mapping[str, tuple[pg.Surface, ...]]
     cur_row: str
     # Time information for selections
     accumulator: float  # time elapsed
@@ -20,23 +21,12 @@ class Animation(Sprite):
         loop: float = 1                     # loop in second
     ):
         super().__init__(image_path)
-        sheet_w, sheet_h = self.image.get_size()
-        frame_w = sheet_w // n_keyframes
-        frame_h = sheet_h // len(rows)
         
         if (len(rows) <= 0 or n_keyframes <= 0):
             Logger.error("Invalid number of rows")
         
-        self.animations = {}
-        for r, name in enumerate(rows):
-            anim : list[pg.Surface] = []
-            for c in range(n_keyframes):
-                frame = self.image.subsurface(pg.Rect(
-                    c * frame_w, r * frame_h,
-                    frame_w, frame_h
-                ))
-                anim.append(pg.transform.smoothscale(frame, size))
-            self.animations[name] = anim
+        # Sliced and scaled once per sheet and size; only the playback state below is per instance
+        self.animations = resource_manager.get_frames(image_path, rows, n_keyframes, size)
             
         self.accumulator = 0
         self.cur_row = rows[0]
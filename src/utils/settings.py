@@ -18,6 +18,9 @@ class Settings:
     #IS_ONLINE: bool = False
     IS_ONLINE = True
     ONLINE_SERVER_URL = "127.0.0.1:8989"
+    ONLINE_BINARY_PROTOCOL: bool = True  # Ask the server for binary position frames
+    ONLINE_INTERP_DELAY: float = 0.1     # Seconds remote players are drawn behind the server (2 snapshots at 20 Hz)
+    ONLINE_TELEMETRY_DIR: str = "saves"  # Where F4 writes network telemetry CSV files
     
     
 GameSettings = Settings()
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""
+Chat that outlives the server process: player ids start over after a restart,
+so whispers must never come back from the chat log or the state database.
+"""
+import json
+
+from server.chatChannels import WHISPER, subscriptions
+from server.chatStore import ChatStore
+from server.stateStore import StateStore
+
+
+def test_chat_log_does_not_replay_whispers(tmp_path):
+    path = str(tmp_path / "chat.log")
+    chat = ChatStore()
+    chat.open_log(path)
+    chat.add(1, "hello all")
+    chat.add(1, "secret", WHISPER, 2)
+    chat.close()
+    assert "secret" not in open(path, encoding="utf-8").read()
+
+    restarted = ChatStore()
+    assert restarted.open_log(path) == 1
+    assert [m["text"] for m in restarted.list_since(0, subscriptions(2, ""))] == ["hello all"]
+    # New ids continue after the last message written
+    assert restarted.add(3, "next")["id"] == 2
+    restarted.close()
+
+
+def test_old_log_whispers_are_dropped(tmp_path):
+    path = tmp_path / "chat.log"
+    lines = [
+        {"id": 1, "from": 1, "text": "hello all", "ts": 0.0, "channel": "global"},
+        {"id": 2, "from": 1, "text": "secret", "ts": 0.0, "channel": WHISPER, "to": 2},
+    ]
+    path.write_text("".join(json.dumps(m) + "\n" for m in lines), encoding="utf-8")
+    chat = ChatStore()
+    assert chat.open_log(str(path)) == 1
+    assert [m["text"] for m in chat.list_since(0, subscriptions(2, ""))] == ["hello all"]
+    assert chat.add(3, "next")["id"] == 3
+    chat.close()
+    assert "secret" not in path.read_text(encoding="utf-8")
+
+
+def test_state_db_skips_whispers(tmp_path):
+    path = str(tmp_path / "state.db")
+    chat = ChatStore()
+    msgs = [chat.add(1, "hello all"), chat.add(1, "secret", WHISPER, 2)]
+    store = StateStore(path)
+    store.checkpoint([], [], msgs)
+
+    restarted = ChatStore()
+    restarted.restore(StateStore(path).load_chat(100))
+    assert [m["text"] for m in restarted.list_since(0, subscriptions(2, ""))] == ["hello all"]
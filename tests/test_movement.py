@@ -0,0 +1,55 @@
+"""
+MovementValidator's map changes: only from a teleport tile to a free spot on
+its destination, and never onto a map the server does not know.
+"""
+from server.collisionGrid import CollisionGrid
+from server.movement import MovementValidator, move_budget
+from server.spatialHash import TILE_SIZE
+from server.teleports import TeleportTable
+
+WALL = (2, 2)   # the one blocked tile of the test maps
+TELEPORT = (24 * TILE_SIZE, 23 * TILE_SIZE)     # map.tmx -> gym.tmx
+
+
+def validator() -> MovementValidator:
+    bits = bytearray(40 * 40 // 8)
+    i = WALL[1] * 40 + WALL[0]
+    bits[i >> 3] |= 1 << (i & 7)
+    grid = CollisionGrid(40, 40, bytes(bits))
+    teleports = TeleportTable()
+    teleports.add_map({"path": "map.tmx", "teleport": [{"x": 24, "y": 23, "destination": "gym.tmx"}],
+                       "player": {"x": 16, "y": 30}})
+    teleports.add_map({"path": "gym.tmx", "teleport": [{"x": 11, "y": 14, "destination": "map.tmx"}],
+                       "player": {"x": 12, "y": 12}})
+    return MovementValidator({"map.tmx": grid, "gym.tmx": grid}, teleports)
+
+
+def test_unknown_map_is_refused():
+    moves = validator()
+    assert moves.check(move_budget(), 100, 100, "map.tmx", 110, 100, "nowhere.tmx") == (100, 100, "map.tmx")
+
+
+def test_first_placement_is_accepted():
+    moves = validator()
+    assert moves.check(move_budget(), 0, 0, "", 500, 700, "gym.tmx") == (500, 700, "gym.tmx")
+
+
+def test_teleport_leads_anywhere_free_on_its_destination():
+    moves = validator()
+    tp_x, tp_y = TELEPORT
+    # Last accepted position a step short of the teleport tile; the arrival
+    # follows the client's own spawn point, which drifts with its saves
+    assert moves.check(move_budget(), tp_x - 10, tp_y, "map.tmx", 300, 900, "gym.tmx") == (300, 900, "gym.tmx")
+    assert moves.check(move_budget(), tp_x, tp_y, "map.tmx", 1500, 200, "gym.tmx") == (1500, 200, "gym.tmx")
+
+
+def test_map_change_elsewhere_is_refused():
+    moves = validator()
+    tp_x, tp_y = TELEPORT
+    # Far from any teleport
+    assert moves.check(move_budget(), 100, 100, "map.tmx", 300, 900, "gym.tmx") == (100, 100, "map.tmx")
+    # From the teleport, but into a wall
+    wall_x, wall_y = WALL[0] * TILE_SIZE, WALL[1] * TILE_SIZE
+    assert moves.check(move_budget(), tp_x, tp_y, "map.tmx", wall_x, wall_y, "gym.tmx") == (tp_x, tp_y, "map.tmx")
+    # Through a teleport that leads somewhere else
+    assert not moves.teleports.leads_to("gym.tmx", 11 * TILE_SIZE, 14 * TILE_SIZE, "gym.tmx")
@@ -0,0 +1,27 @@
+"""
+PlayerHandler's inactivity reaping: any message from the client, pushed in
+the tick's batch, keeps its player alive whether or not its state changes.
+"""
+import time
+
+from server.playerHandler import TIMEOUT_TIME, PlayerHandler
+
+
+def test_heartbeats_keep_idle_player(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    handler = PlayerHandler()
+    idle = handler.register()
+    silent = handler.register()
+    handler.update(idle, 10, 10, "map.tmx")
+    handler.update(silent, 10, 10, "map.tmx")
+
+    # The idle player only sends heartbeats with the same state, once a second
+    for _ in range(int(TIMEOUT_TIME * 3)):
+        now[0] += 1.0
+        handler.update_many([(idle, 10, 10, "map.tmx", "down", False)], [(idle, now[0])])
+        reaped = handler.reap_inactive()
+        assert idle not in reaped
+    assert idle in handler.players
+    assert silent not in handler.players
+    assert handler.evictions == 1
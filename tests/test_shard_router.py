@@ -0,0 +1,69 @@
+"""
+ShardRouter's check of map changes onto another shard: made from where the
+old shard has the player, not from where the client claims to be.
+"""
+import asyncio
+import json
+
+from server.chatStore import ChatStore
+from server.shardRouter import RouterSession, ShardRouter
+from test_movement import TELEPORT, validator
+
+
+class FakeShard:
+    """Upstream connection that answers player_state with the shard's view of the player"""
+
+    def __init__(self, session: RouterSession, x: float, y: float, map_name: str) -> None:
+        self.session = session
+        self.state = {"type": "player_state", "x": x, "y": y, "map": map_name}
+        self.close_code = None
+        self.close_reason = ""
+        self.frames: asyncio.Queue = asyncio.Queue()
+
+    async def send(self, frame: str) -> None:
+        assert json.loads(frame)["type"] == "player_state"
+        # Delivered through the router's pump, as a real shard's reply would be
+        self.frames.put_nowait(json.dumps(self.state))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.frames.get()
+
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.frames: list = []
+
+    async def send(self, frame) -> None:
+        self.frames.append(frame)
+
+
+async def change_map(shard_x: float, shard_y: float, x: float, y: float) -> tuple[bool, RouterSession]:
+    router = ShardRouter(ChatStore(), 0, [], moves=validator())
+    session = RouterSession(FakeClient(), 1, map_name="map.tmx", shard="map.tmx")
+    session.upstream = FakeShard(session, shard_x, shard_y, "map.tmx")
+    pump = asyncio.create_task(router._pump(session, session.upstream))
+    ok = await router._check_map_change(session, "gym.tmx", x, y)
+    pump.cancel()
+    return ok, session
+
+
+def test_claimed_teleport_position_is_not_trusted():
+    # The client claimed the teleport tile from ten tiles away; the shard refused that
+    # and still has the player where it was, so the jump to the gym is refused too
+    tp_x, tp_y = TELEPORT
+    ok, session = asyncio.run(change_map(tp_x - 640, tp_y, 300, 900))
+    assert not ok
+    correction = json.loads(session.outbox._queue[0][0])
+    assert correction["type"] == "position_correction"
+    assert (correction["x"], correction["y"], correction["map"]) == (tp_x - 640, tp_y, "map.tmx")
+
+
+def test_map_change_from_teleport_is_allowed():
+    tp_x, tp_y = TELEPORT
+    ok, session = asyncio.run(change_map(tp_x, tp_y, 300, 900))
+    assert ok
+    # The shard's answer went to the router only
+    assert not any("player_state" in f for f in session.websocket.frames)
@@ -0,0 +1,81 @@
+"""
+Server SnapshotHistory against the client's OnlineManager delta handling,
+with frames and acks each taking a few ticks to arrive.
+"""
+import asyncio
+import json
+import random
+from collections import deque
+
+from server.protocol import MapTable
+from server.snapshot import KEYFRAME_INTERVAL, SnapshotEncoder, SnapshotHistory
+from src.core.managers.online_manager import OnlineManager
+
+MAPS = ("map.tmx", "gym.tmx")
+
+
+def run_session(ticks: int, latency: int, players: int = 6, seed: int = 1) -> dict:
+    rng = random.Random(seed)
+    history = SnapshotHistory()
+    client = OnlineManager()
+    client.player_id = 0
+    client._wakeup = asyncio.Event()
+    maps = MapTable()
+
+    states: dict[int, tuple[int, dict]] = {}
+    version = 0
+    to_client: deque[tuple[int, str]] = deque()     # (arrival tick, frame)
+    to_server: deque[tuple[int, int]] = deque()     # (arrival tick, acked seq)
+    stats = {"keyframes": 0, "deltas": 0, "resyncs": 0}
+    sent_states: dict[int, dict[int, tuple]] = {}   # seq -> what the server sent as of then
+
+    for tick in range(1, ticks + 1):
+        while to_server and to_server[0][0] <= tick:
+            history.ack(to_server.popleft()[1])
+
+        # A few players move each tick
+        for pid in rng.sample(range(1, players + 1), 2):
+            version += 1
+            states[pid] = (version, {"id": pid, "x": rng.uniform(0, 500), "y": rng.uniform(0, 500),
+                                     "map": rng.choice(MAPS), "dir": "down", "moving": True})
+
+        delta = history.diff(tick, {pid: ver for pid, (ver, _) in states.items()})
+        if delta is not None:
+            stats["keyframes" if delta.keyframe else "deltas"] += 1
+            sent_states[tick] = {pid: (s["x"], s["y"], s["map"]) for pid, (_, s) in states.items()}
+            to_client.append((tick + latency, SnapshotEncoder(float(tick), maps).encode(delta, states)))
+
+        while to_client and to_client[0][0] <= tick:
+            frame = json.loads(to_client.popleft()[1])
+            version_before = client.players.version
+            client._apply_players_delta(frame)
+            if client.players.version != version_before:
+                # What the game sees is exactly the server's view at that tick
+                seen = {p.id: (p.x, p.y, p.map) for p in client.players.players}
+                assert seen == {pid: v for pid, v in sent_states[frame["seq"]].items() if pid != client.player_id}
+            # The client's sender: ack what it now holds, or 0 to ask for a keyframe
+            if client._ack_seq != client._sent_ack_seq:
+                if client._ack_seq == 0:
+                    stats["resyncs"] += 1
+                client._sent_ack_seq = client._ack_seq
+                to_server.append((tick + latency, client._ack_seq))
+    return stats
+
+
+def test_periodic_keyframes_need_no_resync():
+    ticks = 1300
+    for latency in (0, 1, 3, 10):
+        stats = run_session(ticks, latency)
+        assert stats["resyncs"] == 0, latency
+        # The first keyframe plus one per interval, nothing more
+        assert stats["keyframes"] == 1 + (ticks - 1) // KEYFRAME_INTERVAL, latency
+
+
+def test_lost_base_requests_one_keyframe():
+    history = SnapshotHistory()
+    history.diff(1, {1: 1})
+    history.ack(1)
+    history.diff(2, {1: 2})
+    history.ack(0)     # client lost its base
+    delta = history.diff(3, {1: 3})
+    assert delta.keyframe and delta.base == 0
@@ -0,0 +1,112 @@
+"""
+Encode/decode throughput of the JSON and binary snapshot formats.
+
+Usage (from the project root):
+    python -m tools.bench_protocol [--seconds 0.5]
+"""
+import argparse
+import json
+import random
+import time
+
+from server.protocol import (
+    MapTable, decode_player_update, decode_players_delta, encode_player_update
+)
+from server.snapshot import Delta, SnapshotEncoder
+
+MAPS = ("map.tmx", "gym.tmx", "northpole.tmx")
+DIRS = ("up", "down", "left", "right")
+
+
+def make_states(n: int) -> dict[int, tuple[int, dict]]:
+    rng = random.Random(n)
+    states = {}
+    for pid in range(n):
+        states[pid] = (pid + 1, {
+            "id": pid,
+            "x": rng.uniform(0, 6400),
+            "y": rng.uniform(0, 6400),
+            "map": rng.choice(MAPS),
+            "dir": rng.choice(DIRS),
+            "moving": rng.random() < 0.5,
+        })
+    return states
+
+
+def rate(fn, seconds: float) -> float:
+    """Calls per second of fn over roughly `seconds` of wall time."""
+    calls = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+        fn()
+        calls += 1
+        now = time.perf_counter()
+        if now >= deadline:
+            return calls / (now - start)
+
+
+def decode_json(frame: str) -> list[dict]:
+    # Mirrors what OnlineManager does with a JSON snapshot
+    data = json.loads(frame)
+    return [{
+        "id": int(pid),
+        "x": float(p.get("x", 0)),
+        "y": float(p.get("y", 0)),
+        "map": str(p.get("map", "")),
+        "dir": str(p.get("dir", "down")),
+        "moving": bool(p.get("moving", False)),
+    } for pid, p in data["players"].items()]
+
+
+def bench_snapshot(n: int, seconds: float) -> None:
+    states = make_states(n)
+    delta = Delta(1, 0, True, list(states), [])
+    maps = MapTable()
+    for name in MAPS:
+        maps.index(name)
+
+    json_frame = SnapshotEncoder(0.0, maps).encode(delta, states)
+    bin_frame = SnapshotEncoder(0.0, maps).encode_binary(delta, states)
+
+    rows = (
+        ("json", len(json_frame.encode()),
+         rate(lambda: SnapshotEncoder(0.0, maps).encode(delta, states), seconds),
+         rate(lambda: decode_json(json_frame), seconds)),
+        ("binary", len(bin_frame),
+         rate(lambda: SnapshotEncoder(0.0, maps).encode_binary(delta, states), seconds),
+         rate(lambda: decode_players_delta(bin_frame, maps), seconds)),
+    )
+    for fmt, size, enc, dec in rows:
+        print(f"{n:>6} {fmt:<8} {size:>9} {enc:>12.0f} {dec:>12.0f} {enc * n:>14.0f}")
+
+
+def bench_player_update(seconds: float) -> None:
+    maps = MapTable()
+    idx = maps.index("map.tmx")
+    msg = {"type": "player_update", "x": 1234.5, "y": 678.25, "map": "map.tmx", "dir": "left", "moving": True}
+    json_frame = json.dumps(msg)
+    bin_frame = encode_player_update(1234.5, 678.25, idx, "left", True)
+    print()
+    print("player_update      bytes     enc/s        dec/s")
+    print(f"json          {len(json_frame):>9} {rate(lambda: json.dumps(msg), seconds):>9.0f} "
+          f"{rate(lambda: json.loads(json_frame), seconds):>12.0f}")
+    print(f"binary        {len(bin_frame):>9} "
+          f"{rate(lambda: encode_player_update(1234.5, 678.25, idx, 'left', True), seconds):>9.0f} "
+          f"{rate(lambda: decode_player_update(bin_frame, maps), seconds):>12.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=0.5, help="time spent per measurement")
+    args = parser.parse_args()
+
+    print("keyframe snapshot (all players changed)")
+    print(f"{'players':>6} {'format':<8} {'bytes':>9} {'enc/s':>12} {'dec/s':>12} {'records/s':>14}")
+    for n in (10, 100, 1000):
+        bench_snapshot(n, args.seconds)
+    bench_player_update(args.seconds)
+
+
+if __name__ == "__main__":
+    main()
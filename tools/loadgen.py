@@ -0,0 +1,412 @@
+"""
+Headless bot swarm for capacity testing a local server.py.
+
+Each bot is a websocket client speaking the real protocol: hello, player_update,
+snapshot_ack and chat_send. A monitor polls the server's HTTP /status once a second
+for its own tick timing. The run is summarised as JSON, and several
+summaries can be compared side by side.
+
+Usage (from the project root, with `python server.py` running):
+    python -m tools.loadgen --bots 200 --duration 30 --pattern random --out reports/200.json
+    python -m tools.loadgen --compare reports/100.json reports/200.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import random
+import time
+import urllib.request
+from urllib.parse import urlparse
+
+import websockets
+
+from server.protocol import (
+    BINARY_FORMAT, MSG_PLAYERS_DELTA, MapTable,
+    binary_type, decode_players_delta, encode_player_update
+)
+
+MAPS = ("map.tmx", "gym.tmx", "northpole.tmx")
+PATTERNS = ("random", "circle", "patrol", "idle", "teleport")
+TILE_SIZE = 64
+SPEED = 4.0 * TILE_SIZE         # same walking speed as the client's Player
+AREA = 30 * TILE_SIZE           # bots wander inside this square
+TELEPORT_EVERY = 5.0            # seconds between map switches for "teleport"
+MONITOR_INTERVAL = 1.0          # seconds between /status polls
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+HIST_BUCKET_MS = 0.5
+HIST_BUCKETS = 4000             # intervals above 2 s land in the last bucket
+
+
+class Histogram:
+    """Fixed-bucket millisecond histogram; cheap to fill and to merge across processes."""
+
+    def __init__(self, counts: list[int] | None = None) -> None:
+        self.counts = counts or [0] * HIST_BUCKETS
+
+    def add(self, ms: float) -> None:
+        self.counts[min(HIST_BUCKETS - 1, int(ms / HIST_BUCKET_MS))] += 1
+
+    def merge(self, other: "Histogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+
+    def percentile(self, p: float) -> float:
+        total = sum(self.counts)
+        if not total:
+            return 0.0
+        target = p * total
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return (i + 0.5) * HIST_BUCKET_MS
+        return HIST_BUCKETS * HIST_BUCKET_MS
+
+
+class Movement:
+    """Produces (x, y, map, dir, moving) for one bot over time."""
+
+    def __init__(self, pattern: str, map_name: str, rng: random.Random) -> None:
+        self.pattern = pattern
+        self.map = map_name
+        self.rng = rng
+        self.x = rng.uniform(0, AREA)
+        self.y = rng.uniform(0, AREA)
+        self.origin = (self.x, self.y)
+        self.phase = rng.uniform(0, 2 * math.pi)
+        self.heading = rng.uniform(0, 2 * math.pi)
+        self.next_teleport = TELEPORT_EVERY * rng.random()
+
+    def step(self, t: float, dt: float) -> tuple[float, float, str, str, bool]:
+        if self.pattern == "idle":
+            return self.x, self.y, self.map, "down", False
+
+        if self.pattern == "circle":
+            radius = 3 * TILE_SIZE
+            angle = self.phase + t * SPEED / radius
+            nx = self.origin[0] + radius * math.cos(angle)
+            ny = self.origin[1] + radius * math.sin(angle)
+        elif self.pattern == "patrol":
+            span = 8 * TILE_SIZE
+            offset = (t * SPEED + self.phase * span) % (2 * span)
+            nx = self.origin[0] + (offset if offset < span else 2 * span - offset)
+            ny = self.y
+        else:  # random walk, also used between map switches by "teleport"
+            if self.rng.random() < dt:
+                self.heading = self.rng.uniform(0, 2 * math.pi)
+            nx = min(AREA, max(0.0, self.x + math.cos(self.heading) * SPEED * dt))
+            ny = min(AREA, max(0.0, self.y + math.sin(self.heading) * SPEED * dt))
+            if self.pattern == "teleport" and t >= self.next_teleport:
+                self.next_teleport = t + TELEPORT_EVERY
+                self.map = self.rng.choice([m for m in MAPS if m != self.map])
+
+        dx, dy = nx - self.x, ny - self.y
+        self.x, self.y = nx, ny
+        if abs(dx) > abs(dy):
+            direction = "right" if dx > 0 else "left"
+        else:
+            direction = "down" if dy > 0 else "up"
+        return nx, ny, self.map, direction, True
+
+
+class BotStats:
+    def __init__(self) -> None:
+        self.connected = 0
+        self.failed = 0
+        self.disconnected = 0
+        self.msgs_in = 0
+        self.msgs_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.snapshots = 0
+        self.chat_in = 0
+        self.interval = Histogram()
+
+    def to_dict(self) -> dict:
+        d = dict(self.__dict__)
+        d["interval"] = self.interval.counts
+        return d
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "BotStats":
+        s = cls()
+        s.__dict__.update(d)
+        s.interval = Histogram(d["interval"])
+        return s
+
+    def merge(self, other: "BotStats") -> None:
+        for k, v in other.__dict__.items():
+            if k == "interval":
+                self.interval.merge(v)
+            else:
+                setattr(self, k, getattr(self, k) + v)
+
+
+async def run_bot(idx: int, args: argparse.Namespace, stats: BotStats, stop_at: float) -> None:
+    rng = random.Random(args.seed * 100003 + idx)
+    move = Movement(args.pattern, MAPS[idx % len(MAPS)], rng)
+    maps_in, maps_out = MapTable(), MapTable()
+    binary = False
+    ack_seq = 0
+    last_snapshot = 0.0
+
+    try:
+        ws = await websockets.connect(args.url, max_size=None)
+    except Exception:
+        stats.failed += 1
+        return
+    stats.connected += 1
+
+    async def send(frame: str | bytes) -> None:
+        stats.msgs_out += 1
+        stats.bytes_out += len(frame)
+        await ws.send(frame)
+
+    async def reader() -> None:
+        nonlocal binary, ack_seq, last_snapshot
+        async for message in ws:
+            stats.msgs_in += 1
+            stats.bytes_in += len(message)
+            if isinstance(message, bytes):
+                if binary_type(message) != MSG_PLAYERS_DELTA:
+                    continue
+                data = decode_players_delta(message, maps_in)
+            else:
+                data = json.loads(message)
+            msg_type = data.get("type")
+            if msg_type == "players_delta":
+                now = time.perf_counter()
+                if last_snapshot:
+                    stats.interval.add((now - last_snapshot) * 1000.0)
+                last_snapshot = now
+                stats.snapshots += 1
+                ack_seq = int(data["seq"])
+            elif msg_type == "map_table":
+                maps_in.apply(data.get("maps", {}))
+            elif msg_type == "encoding":
+                binary = data.get("format") == BINARY_FORMAT
+            elif msg_type == "chat_update":
+                stats.chat_in += len(data.get("messages", []))
+
+    read_task = asyncio.create_task(reader())
+    try:
+        encodings = [BINARY_FORMAT, "json"] if args.binary else ["json"]
+        await send(json.dumps({"type": "hello", "encodings": encodings}))
+        period = 1.0 / args.rate
+        chat_chance = args.chat_per_min / 60.0 * period
+        start = time.perf_counter()
+        sent_ack = 0
+        next_send = start
+        while time.perf_counter() < stop_at and not read_task.done():
+            now = time.perf_counter()
+            x, y, map_name, direction, moving = move.step(now - start, period)
+            if binary:
+                known = len(maps_out)
+                map_idx = maps_out.index(map_name)
+                if len(maps_out) > known:
+                    await send(json.dumps(maps_out.announce(known)))
+                await send(encode_player_update(x, y, map_idx, direction, moving))
+            else:
+                await send(json.dumps({
+                    "type": "player_update", "x": x, "y": y, "map": map_name,
+                    "dir": direction, "moving": moving,
+                }))
+            if ack_seq != sent_ack:
+                sent_ack = ack_seq
+                await send(json.dumps({"type": "snapshot_ack", "seq": sent_ack}))
+            if rng.random() < chat_chance:
+                await send(json.dumps({"type": "chat_send", "text": f"bot {idx} says hi"}))
+            next_send += period
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+        if read_task.done():
+            stats.disconnected += 1
+    except websockets.exceptions.ConnectionClosed:
+        stats.disconnected += 1
+    finally:
+        read_task.cancel()
+        await ws.close()
+
+
+def status_url(url: str) -> str:
+    """The HTTP /status endpoint served on the same port as the websocket"""
+    parts = urlparse(url)
+    return parts._replace(scheme="https" if parts.scheme == "wss" else "http", path="/status").geturl()
+
+
+def fetch_status(url: str) -> dict:
+    with urllib.request.urlopen(url, timeout=MONITOR_INTERVAL) as response:
+        return json.load(response)
+
+
+async def monitor(url: str, stop_at: float, samples: list[dict]) -> None:
+    """
+    Poll /status once a second. Plain HTTP rather than a websocket, so the
+    monitor is never a player the server could reap. Each sample keeps the
+    tick figures of the server, or of every shard behind a router.
+    """
+    url = status_url(url)
+    while time.perf_counter() < stop_at:
+        next_poll = time.perf_counter() + MONITOR_INTERVAL
+        try:
+            data = await asyncio.to_thread(fetch_status, url)
+        except (OSError, ValueError):
+            pass  # server busy or restarting: a gap in the samples, not a failed run
+        else:
+            if "tick" in data:
+                ticks = [data["tick"]]
+            else:
+                ticks = [s["tick"] for s in data.get("shards", {}).values() if "tick" in s]
+            samples.append({"t": time.time(), "ticks": ticks})
+        await asyncio.sleep(max(0.0, next_poll - time.perf_counter()))
+
+
+async def run_bots(first: int, count: int, args: argparse.Namespace, stop_wall: float) -> dict:
+    stats = BotStats()
+    stop_at = time.perf_counter() + (stop_wall - time.time())
+    bots = []
+    for i in range(first, first + count):
+        bots.append(asyncio.create_task(run_bot(i, args, stats, stop_at)))
+        if args.ramp:
+            await asyncio.sleep(args.ramp / max(1, args.bots))
+    await asyncio.gather(*bots)
+    return stats.to_dict()
+
+
+def _worker(first: int, count: int, args: argparse.Namespace, stop_wall: float) -> dict:
+    return asyncio.run(run_bots(first, count, args, stop_wall))
+
+
+async def run(args: argparse.Namespace) -> dict:
+    started = time.time()
+    stop_wall = started + args.ramp + args.duration
+    samples: list[dict] = []
+    mon = asyncio.create_task(monitor(args.url, time.perf_counter() + args.ramp + args.duration, samples))
+
+    if args.procs > 1:
+        per = math.ceil(args.bots / args.procs)
+        jobs = [(i, min(per, args.bots - i), args, stop_wall) for i in range(0, args.bots, per)]
+        loop = asyncio.get_running_loop()
+        with multiprocessing.Pool(len(jobs)) as pool:
+            results = await loop.run_in_executor(None, pool.starmap, _worker, jobs)
+    else:
+        results = [await run_bots(0, args.bots, args, stop_wall)]
+    await mon
+
+    stats = BotStats()
+    for r in results:
+        stats.merge(BotStats.from_dict(r))
+    elapsed = time.time() - started
+    # Only samples taken once every bot was connected describe steady state
+    steady = [s for s in samples if s["t"] >= started + args.ramp] or samples
+    ticks = [t for s in steady for t in s["ticks"]]
+
+    def worst(key: str) -> float:
+        return max((t[key] for t in ticks), default=0.0)
+
+    return {
+        "config": {
+            "bots": args.bots, "duration": args.duration, "pattern": args.pattern,
+            "rate": args.rate, "binary": args.binary, "chat_per_min": args.chat_per_min,
+            "procs": args.procs, "url": args.url, "started": started,
+        },
+        "bots": {
+            "connected": stats.connected, "failed": stats.failed, "disconnected": stats.disconnected,
+        },
+        "client": {
+            "update_interval_ms_p50": stats.interval.percentile(0.50),
+            "update_interval_ms_p95": stats.interval.percentile(0.95),
+            "update_interval_ms_p99": stats.interval.percentile(0.99),
+            "snapshots_per_bot_per_s": stats.snapshots / max(1, stats.connected) / elapsed,
+            "bytes_in_per_s": stats.bytes_in / elapsed,
+            "bytes_out_per_s": stats.bytes_out / elapsed,
+            "msgs_in_per_s": stats.msgs_in / elapsed,
+            "msgs_out_per_s": stats.msgs_out / elapsed,
+            "chat_received": stats.chat_in,
+        },
+        "server": {
+            "samples": len(steady),
+            "actual_hz_min": min((t["actual_hz"] for t in ticks), default=0.0),
+            "tick_ms_p50_max": worst("tick_ms_p50"),
+            "tick_ms_p95_max": worst("tick_ms_p95"),
+            "tick_ms_p99_max": worst("tick_ms_p99"),
+            "tick_ms_max": worst("tick_ms_max"),
+            "overruns": worst("overruns"),
+            "skipped_ticks": worst("skipped_ticks"),
+            "shed_level_max": worst("shed_level"),
+        },
+    }
+
+
+COMPARE_ROWS = (
+    ("bots", ("config", "bots"), "{:.0f}"),
+    ("pattern", ("config", "pattern"), "{}"),
+    ("binary", ("config", "binary"), "{}"),
+    ("connected", ("bots", "connected"), "{:.0f}"),
+    ("disconnected", ("bots", "disconnected"), "{:.0f}"),
+    ("server tick p50 ms", ("server", "tick_ms_p50_max"), "{:.3f}"),
+    ("server tick p99 ms", ("server", "tick_ms_p99_max"), "{:.3f}"),
+    ("server tick max ms", ("server", "tick_ms_max"), "{:.3f}"),
+    ("server Hz (min)", ("server", "actual_hz_min"), "{:.1f}"),
+    ("shed level (max)", ("server", "shed_level_max"), "{:.0f}"),
+    ("update interval p50 ms", ("client", "update_interval_ms_p50"), "{:.1f}"),
+    ("update interval p99 ms", ("client", "update_interval_ms_p99"), "{:.1f}"),
+    ("snapshots/bot/s", ("client", "snapshots_per_bot_per_s"), "{:.1f}"),
+    ("KB/s in (all bots)", ("client", "bytes_in_per_s"), "{:.0f}"),
+    ("KB/s out (all bots)", ("client", "bytes_out_per_s"), "{:.0f}"),
+)
+
+
+def compare(paths: list[str]) -> None:
+    reports = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            reports.append(json.load(f))
+    width = max(12, *(len(p) for p in paths))
+    print(f"{'':<24}" + "".join(f"{p:>{width + 2}}" for p in paths))
+    for label, (section, key), fmt in COMPARE_ROWS:
+        cells = []
+        for r in reports:
+            value = r.get(section, {}).get(key, "-")
+            if key.startswith("bytes"):
+                value = value / 1024.0
+            cells.append(fmt.format(value) if value != "-" else "-")
+        print(f"{label:<24}" + "".join(f"{c:>{width + 2}}" for c in cells))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="ws://127.0.0.1:8989")
+    parser.add_argument("--bots", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of steady load")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which bots connect")
+    parser.add_argument("--pattern", choices=PATTERNS, default="random",
+                        help="'teleport' jumps between maps anywhere, which only a --trust-movement server accepts")
+    parser.add_argument("--rate", type=float, default=60.0, help="player_update messages per second per bot")
+    parser.add_argument("--chat-per-min", type=float, default=1.0, help="chat messages per bot per minute")
+    parser.add_argument("--json", dest="binary", action="store_false", help="use JSON instead of binary frames")
+    parser.add_argument("--procs", type=int, default=1, help="client processes to spread the bots over")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the report here (JSON)")
+    parser.add_argument("--compare", nargs="+", metavar="REPORT", help="compare saved reports instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return
+
+    host = urlparse(args.url).hostname
+    if host not in LOCAL_HOSTS:
+        parser.error(f"refusing to load-test non-local host {host!r}")
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""
+Network condition simulator: a websocket relay between game clients and a
+local server.py, so smoothing, send coalescing and reconnects can be tried on
+one machine.
+
+Every message is held for the profile's one-way latency plus jitter and
+queued behind its bandwidth cap. Now and then one is delivered late, after
+messages sent behind it (reorder), or stalls the stream like a lost TCP
+segment being resent (loss). A profile is a list of phases starting at given
+seconds after the relay starts; each phase changes some conditions and can
+drop every connection (the client sees an abnormal close and resumes),
+optionally refusing new ones for `down` seconds.
+
+With --log every relayed message is written to CSV: when it came in, when it
+was due and when it went out, so runs can be compared.
+
+Usage (from the project root, with `python server.py` running and the client's
+GameSettings.ONLINE_SERVER_URL set to "127.0.0.1:8990"):
+    python -m tools.netsim --profile mobile --log netsim.csv
+    python -m tools.netsim --profile flaky --duration 90
+    python -m tools.netsim --profile phases.json --latency 80 --jitter 20
+"""
+import argparse
+import asyncio
+import csv
+import heapq
+import json
+import random
+import time
+from dataclasses import dataclass, fields, replace
+from http import HTTPStatus
+from typing import Any, IO
+from urllib.parse import urlparse
+
+import websockets
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+
+@dataclass
+class Conditions:
+    latency_ms: float = 0.0     # one way, each direction
+    jitter_ms: float = 0.0      # uniform +-, never below zero delay
+    kbps: float = 0.0           # bandwidth cap per direction (0 = none)
+    reorder: float = 0.0        # chance a message is held back and overtaken
+    reorder_ms: float = 50.0    # how long it is held back
+    loss: float = 0.0           # chance of a resend stall, holding up everything behind it
+    resend_ms: float = 200.0    # length of that stall (TCP's minimum retransmit timeout)
+    disconnect: bool = False    # drop every connection when the phase starts
+    down: float = 0.0           # then refuse new connections for this many seconds
+
+
+CONDITION_KEYS = {f.name for f in fields(Conditions)}
+
+# Phases: "at" is seconds after the relay starts; other keys are Conditions
+# fields and carry over to later phases (except disconnect and down)
+PROFILES: dict[str, list[dict]] = {
+    "lan": [{"at": 0}],
+    "wifi": [{"at": 0, "latency_ms": 8, "jitter_ms": 6, "loss": 0.002}],
+    "mobile": [{"at": 0, "latency_ms": 50, "jitter_ms": 25, "kbps": 2000, "reorder": 0.01, "loss": 0.01}],
+    "congested": [{"at": 0, "latency_ms": 120, "jitter_ms": 60, "kbps": 256, "reorder": 0.03, "loss": 0.03}],
+    "flaky": [
+        {"at": 0, "latency_ms": 8, "jitter_ms": 6, "loss": 0.002},
+        {"at": 15, "disconnect": True},
+        {"at": 30, "latency_ms": 200, "jitter_ms": 100},
+        {"at": 40, "latency_ms": 8, "jitter_ms": 6},
+        {"at": 60, "disconnect": True, "down": 5},
+    ],
+}
+
+
+class Profile:
+    """Conditions over time, from a list of phases"""
+    phases: list[tuple[float, Conditions]]
+
+    def __init__(self, phases: list[dict], overrides: dict | None = None) -> None:
+        self.phases = []
+        current = Conditions()
+        for phase in sorted(phases, key=lambda p: p.get("at", 0)):
+            unknown = set(phase) - CONDITION_KEYS - {"at"}
+            if unknown:
+                raise ValueError(f"unknown phase keys: {', '.join(sorted(unknown))}")
+            settings = {k: v for k, v in phase.items() if k != "at"}
+            current = replace(current, **{"disconnect": False, "down": 0.0, **settings, **(overrides or {})})
+            self.phases.append((float(phase.get("at", 0)), current))
+        if not self.phases or self.phases[0][0] > 0:
+            self.phases.insert(0, (0.0, Conditions(**(overrides or {}))))
+
+    @classmethod
+    def load(cls, name: str, overrides: dict | None = None) -> "Profile":
+        """A built-in profile name or a JSON file holding a list of phases"""
+        if name in PROFILES:
+            return cls(PROFILES[name], overrides)
+        with open(name, encoding="utf-8") as f:
+            return cls(json.load(f), overrides)
+
+    def at(self, t: float) -> Conditions:
+        current = self.phases[0][1]
+        for start, conditions in self.phases:
+            if start > t:
+                break
+            current = conditions
+        return current
+
+
+class TimingLog:
+    """Per-message timing, to CSV if a path is given, and a summary per direction"""
+    COLUMNS = ("conn", "dir", "kind", "bytes", "recv_s", "due_ms", "sent_ms")
+
+    def __init__(self, path: str | None, start: float) -> None:
+        self.start = start
+        self._file: IO[str] | None = open(path, "w", newline="", encoding="utf-8") if path else None
+        self._csv = csv.writer(self._file) if self._file else None
+        if self._csv:
+            self._csv.writerow(self.COLUMNS)
+        self.delays: dict[str, list[float]] = {"up": [], "down": []}
+        self.bytes = {"up": 0, "down": 0}
+
+    def add(self, conn: int, direction: str, kind: str, size: int,
+            received: float, due: float, sent: float) -> None:
+        sent_ms = (sent - received) * 1000
+        self.delays[direction].append(sent_ms)
+        self.bytes[direction] += size
+        if self._csv:
+            self._csv.writerow((conn, direction, kind, size, f"{received - self.start:.4f}",
+                                f"{(due - received) * 1000:.2f}", f"{sent_ms:.2f}"))
+
+    def summary(self) -> str:
+        lines = []
+        for direction, delays in self.delays.items():
+            if not delays:
+                lines.append(f"{direction:<5} no messages")
+                continue
+            ordered = sorted(delays)
+            p50 = ordered[len(ordered) // 2]
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            lines.append(f"{direction:<5} {len(ordered):>8} msgs {self.bytes[direction] / 1024:10.1f} KiB  "
+                         f"delay ms mean {sum(ordered) / len(ordered):7.1f}  p50 {p50:7.1f}  "
+                         f"p95 {p95:7.1f}  max {ordered[-1]:7.1f}")
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+
+
+def message_kind(message: str | bytes) -> str:
+    if isinstance(message, bytes):
+        return f"bin{message[0]}" if message else "bin"
+    try:
+        return str(json.loads(message).get("type", "?"))
+    except (ValueError, AttributeError):
+        return "text"
+
+
+class Link:
+    """
+    One direction of one relayed connection. Messages are scheduled on arrival
+    and sent from a heap in due order; delivery stays in order except for the
+    messages picked for reordering.
+    """
+    _heap: list[tuple[float, int, float, str | bytes]]     # (due, n, received, message)
+
+    def __init__(self, conn: int, direction: str, dest: Any, relay: "Relay") -> None:
+        self.conn = conn
+        self.direction = direction
+        self.dest = dest
+        self.relay = relay
+        self._heap = []
+        self._n = 0
+        self._wake = asyncio.Event()
+        self._free_at = 0.0     # when the bandwidth cap is done with what is queued
+        self._last_due = 0.0    # in-order messages are never due before this
+        self.closed = False
+
+    def push(self, message: str | bytes) -> None:
+        now = time.perf_counter()
+        c = self.relay.profile.at(now - self.relay.start)
+        rng = self.relay.rng
+        due = now
+        if c.kbps > 0:
+            self._free_at = max(now, self._free_at) + len(message) * 8 / (c.kbps * 1000)
+            due = self._free_at
+        due += max(0.0, c.latency_ms + rng.uniform(-c.jitter_ms, c.jitter_ms)) / 1000
+        if rng.random() < c.loss:
+            due += c.resend_ms / 1000
+        if rng.random() < c.reorder:
+            due = max(due, self._last_due) + c.reorder_ms / 1000
+        else:
+            due = max(due, self._last_due)
+            self._last_due = due
+        heapq.heappush(self._heap, (due, self._n, now, message))
+        self._n += 1
+        self._wake.set()
+
+    def close(self) -> None:
+        """No more messages; run() returns once the queued ones are sent"""
+        self.closed = True
+        self._wake.set()
+
+    async def run(self) -> None:
+        try:
+            while self._heap or not self.closed:
+                self._wake.clear()
+                if not self._heap:
+                    await self._wake.wait()
+                    continue
+                due = self._heap[0][0]
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), wait)
+                    except TimeoutError:
+                        pass
+                    continue
+                _, _, received, message = heapq.heappop(self._heap)
+                await self.dest.send(message)
+                self.relay.log.add(self.conn, self.direction, message_kind(message), len(message),
+                                   received, due, time.perf_counter())
+        except ConnectionClosed:
+            pass
+
+
+class Relay:
+    def __init__(self, upstream: str, profile: Profile, log_path: str | None, seed: int) -> None:
+        self.upstream = upstream.rstrip("/")
+        self.profile = profile
+        self.rng = random.Random(seed)
+        self.start = time.perf_counter()
+        self.log = TimingLog(log_path, self.start)
+        self.live: dict[int, tuple[Any, Any]] = {}
+        self.next_conn = 1
+        self.down_until = 0.0
+
+    def process_request(self, connection: Any, request: Any) -> Any:
+        if time.perf_counter() < self.down_until:
+            return connection.respond(HTTPStatus.SERVICE_UNAVAILABLE, "netsim: link down\n")
+        return None
+
+    async def handle_client(self, client: Any) -> None:
+        conn = self.next_conn
+        self.next_conn += 1
+        try:
+            upstream = await websockets.connect(self.upstream + client.request.path,
+                                                max_size=None, ping_interval=None)
+        except (OSError, websockets.exceptions.InvalidHandshake) as e:
+            print(f"[Netsim] #{conn} upstream unavailable: {e}")
+            await client.close(1011, "upstream unavailable")
+            return
+        print(f"[Netsim] #{conn} connected")
+        self.live[conn] = (client, upstream)
+        up = Link(conn, "up", upstream, self)
+        down = Link(conn, "down", client, self)
+        tasks = [
+            asyncio.create_task(self.pump(client, up)),
+            asyncio.create_task(self.pump(upstream, down)),
+            asyncio.create_task(up.run()),
+            asyncio.create_task(down.run()),
+        ]
+        try:
+            # Whichever side closed first, its last messages still get through before the other is closed
+            done, _ = await asyncio.wait(tasks[2:], return_when=asyncio.FIRST_COMPLETED)
+            src, dest = (client, upstream) if tasks[2] in done else (upstream, client)
+            if src.close_code in (None, 1005, 1006):
+                dest.transport.abort()
+            else:
+                await dest.close(src.close_code, src.close_reason or "")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await upstream.close()
+            del self.live[conn]
+            print(f"[Netsim] #{conn} closed ({client.close_code})")
+
+    async def pump(self, src: Any, link: Link) -> None:
+        try:
+            async for message in src:
+                link.push(message)
+        except ConnectionClosed:
+            pass
+        finally:
+            link.close()
+
+    async def script(self) -> None:
+        """Announce each phase as it starts and carry out its disconnect"""
+        for start, conditions in self.profile.phases:
+            await asyncio.sleep(max(0.0, self.start + start - time.perf_counter()))
+            print(f"[Netsim] {start:.0f}s: latency {conditions.latency_ms:g}+-{conditions.jitter_ms:g} ms, "
+                  f"{conditions.kbps:g} kbps, reorder {conditions.reorder:g}, loss {conditions.loss:g}")
+            if conditions.disconnect:
+                print(f"[Netsim] dropping {len(self.live)} connection(s)"
+                      + (f", down for {conditions.down:g}s" if conditions.down else ""))
+                self.down_until = time.perf_counter() + conditions.down
+                for client, upstream in list(self.live.values()):
+                    client.transport.abort()
+                    upstream.transport.abort()
+
+
+async def run(args: argparse.Namespace, profile: Profile) -> None:
+    relay = Relay(args.upstream, profile, args.log, args.seed)
+    try:
+        async with serve(relay.handle_client, args.host, args.port,
+                         process_request=relay.process_request, max_size=None, ping_interval=None):
+            print(f"[Netsim] relaying ws://{args.host}:{args.port} -> {args.upstream}")
+            script = asyncio.create_task(relay.script())
+            if args.duration > 0:
+                await asyncio.sleep(args.duration)
+            else:
+                await asyncio.Future()
+            script.cancel()
+    finally:
+        relay.log.close()
+        print(relay.log.summary())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8990)
+    parser.add_argument("--upstream", default="ws://127.0.0.1:8989")
+    parser.add_argument("--profile", default="lan", help=f"{', '.join(PROFILES)} or a JSON file of phases")
+    parser.add_argument("--latency", type=float, help="one-way ms, overrides every phase")
+    parser.add_argument("--jitter", type=float, help="+- ms, overrides every phase")
+    parser.add_argument("--kbps", type=float, help="bandwidth cap, overrides every phase")
+    parser.add_argument("--reorder", type=float, help="chance per message, overrides every phase")
+    parser.add_argument("--loss", type=float, help="chance per message, overrides every phase")
+    parser.add_argument("--duration", type=float, default=0.0, help="seconds to run (0 = until Ctrl-C)")
+    parser.add_argument("--log", help="write per-message timing here (CSV)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    host = urlparse(args.upstream).hostname
+    if host not in LOCAL_HOSTS:
+        parser.error(f"refusing to relay to non-local host {host!r}")
+
+    overrides = {key: value for key, value in (
+        ("latency_ms", args.latency), ("jitter_ms", args.jitter), ("kbps", args.kbps),
+        ("reorder", args.reorder), ("loss", args.loss),
+    ) if value is not None}
+    try:
+        profile = Profile.load(args.profile, overrides)
+    except (OSError, ValueError, TypeError) as e:
+        parser.error(f"bad profile {args.profile!r}: {e}")
+
+    try:
+        asyncio.run(run(args, profile))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Offline encoder benchmark over a session recorded with `python server.py --record PATH`.
+
+Every recorded tick goes through PlayerHandler, a SnapshotHistory per player
+and both SnapshotEncoder formats, with one simulated client per player that
+acks at once, so the encoders can be compared on real traffic. This is not the
+server's broadcast path: there are no rate tiers, map table announcements or
+outboxes, chat is only counted, and nothing is sent anywhere. To watch a
+recording in the game, play it through the live server instead:
+    python server.py --replay saves/session.rec
+--follow prints one player's recorded positions tick by tick, which shows
+jumps in the recording itself.
+
+Usage (from the project root):
+    python -m tools.replay saves/session.rec                # at recorded speed
+    python -m tools.replay saves/session.rec --speed 0      # as fast as possible
+    python -m tools.replay saves/session.rec --speed 4 --follow 3 --chat
+"""
+import argparse
+import math
+import time
+
+from server.playerHandler import PlayerHandler
+from server.protocol import MapTable
+from server.sessionRecorder import replay_events
+from server.snapshot import SnapshotEncoder, SnapshotHistory, VIEW_HALF_WIDTH, VIEW_HALF_HEIGHT
+
+
+class EncoderBench:
+    """Diffing and encoding for one simulated client per player, timed per format"""
+
+    def __init__(self) -> None:
+        self.players = PlayerHandler()
+        self.histories: dict[int, SnapshotHistory] = {}
+        self.maps = MapTable()
+        self.frames = 0
+        self.bytes = {"json": 0, "binary": 0}
+        self.seconds = {"json": 0.0, "binary": 0.0}
+
+    def apply(self, delta: dict) -> None:
+        """Bring the player table to the recorded tick"""
+        removed = set(self.players.players) - set(delta["table"]) if delta["keyframe"] else delta["removed"]
+        for pid in removed:
+            self.players.unregister(pid)
+            self.histories.pop(pid, None)
+        for pid in delta["players"]:
+            if pid not in self.players.players:
+                self.players.register(pid)
+                self.histories[pid] = SnapshotHistory()
+        self.players.update_many([
+            (pid, p["x"], p["y"], p["map"], p["dir"], p["moving"]) for pid, p in delta["players"].items()
+        ])
+
+    def send(self, seq: int, timestamp: float) -> None:
+        states, visible = self.players.snapshot_visible(list(self.histories), VIEW_HALF_WIDTH, VIEW_HALF_HEIGHT)
+        deltas = []
+        for pid, history in self.histories.items():
+            delta = history.diff(seq, {other: states[other][0] for other in visible.get(pid, ())})
+            if delta is not None:
+                deltas.append(delta)
+                history.ack(seq)
+        self.frames += len(deltas)
+        for fmt in ("json", "binary"):
+            start = time.perf_counter()
+            encoder = SnapshotEncoder(timestamp, self.maps)
+            encode = encoder.encode if fmt == "json" else encoder.encode_binary
+            size = 0
+            for delta in deltas:
+                frame = encode(delta, states)
+                size += len(frame)
+            self.seconds[fmt] += time.perf_counter() - start
+            self.bytes[fmt] += size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the snapshot encoders on a recorded server session")
+    parser.add_argument("path")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed factor (0 = no waiting)")
+    parser.add_argument("--follow", type=int, metavar="PID", help="print this player's position on every tick")
+    parser.add_argument("--chat", action="store_true", help="print chat messages as they come")
+    args = parser.parse_args()
+
+    broadcast = EncoderBench()
+    ticks = chat = peak = 0
+    elapsed = 0.0           # recorded seconds played so far
+    last_ts = None
+    wall_start = time.perf_counter()
+    followed = None
+    for kind, event in replay_events(args.path):
+        if kind == "chat":
+            chat += 1
+            if args.chat:
+                print(f"chat #{event['id']} [{event.get('channel', 'global')}] {event['from']}: {event['text']}")
+            continue
+        ts = event["timestamp"]
+        if last_ts is not None and ts >= last_ts:
+            elapsed += ts - last_ts     # a later server run appended to the file restarts the clock
+        last_ts = ts
+        if args.speed > 0:
+            delay = elapsed / args.speed - (time.perf_counter() - wall_start)
+            if delay > 0:
+                time.sleep(delay)
+        broadcast.apply(event)
+        broadcast.send(event["seq"], ts)
+        ticks += 1
+        peak = max(peak, len(event["table"]))
+        if args.follow is not None:
+            p = event["table"].get(args.follow)
+            if p is not None and args.follow in event["players"]:
+                step = math.dist((p["x"], p["y"]), followed) if followed else 0.0
+                print(f"tick {event['seq']:>8} t={elapsed:9.3f}s  {p['map']:<16} "
+                      f"x={p['x']:8.1f} y={p['y']:8.1f}  {p['dir']:<5} {'moving' if p['moving'] else 'idle  '} "
+                      f"step={step:6.1f}")
+                followed = (p["x"], p["y"])
+            elif p is None:
+                followed = None
+
+    if not ticks:
+        print("no ticks recorded")
+        return
+    print(f"ticks {ticks}, recorded {elapsed:.1f} s, peak players {peak}, chat {chat}")
+    print(f"snapshot frames {broadcast.frames}")
+    for fmt in ("json", "binary"):
+        per_tick = broadcast.seconds[fmt] / ticks * 1e6
+        print(f"  {fmt:<6} {broadcast.bytes[fmt] / 1024:10.1f} KiB  encode {per_tick:8.1f} us/tick")
+
+
+if __name__ == "__main__":
+    main()